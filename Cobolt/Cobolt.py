@@ -1,18 +1,39 @@
-import os, logging, time
+import os, logging, time, serial
+from serial.tools import list_ports
 logger = logging.getLogger(__name__)
 
+class LaserIOError(IOError):
+    pass
+
 class Cobolt:
-    def __init__(self,baudrate=9600):
-        # Find comport
-        ui = None  # add your unique identifier! format: '0000:0000'
-        if not ui:
-            raise LaserIOError('No unique identifier set')
-        port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
-        if not len(port)==1:
-            raise LaserIOError('Found %i ports matching the unique identifier'%len(port))
+    def __init__(self,baudrate=9600,port=None):
+        # port: serial device to use instead of searching by unique identifier (e.g. Cobolt/emulator.py)
+        if port is None:
+            # Find comport
+            ui = None  # add your unique identifier! format: '0000:0000'
+            if not ui:
+                raise LaserIOError('No unique identifier set')
+            port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
+            if not len(port)==1:
+                raise LaserIOError('Found %i ports matching the unique identifier'%len(port))
+            port = port[0]
 
         # Save serial object
-        self.serial = serial.Serial(port[0], baudrate, timeout=1)
+        self.serial = serial.Serial(port, baudrate, timeout=1)
+
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._Close()
+
+    def _Close(self):
+        if self.serial.isOpen():
+            self.serial.close()
+
+    def _query(self, cmd):
+        # Commands end in a carriage return; replies in \r\n
+        self.serial.write((cmd + '\r').encode())
+        return self.serial.readline().strip().decode()
 
     def dispatch(self, client_ip, fn_name, *args):
         logger.debug('Calling ' + fn_name + str(args))
@@ -109,22 +130,15 @@ class Cobolt:
         commandFloats = ["hrs?", "i?", "glp?", "p?", "pa?", "ps?", "glmp?", "rbpt?"]                                                            # Commands that return floats. # ???? "rlc"
         commandOther = ["?", "l0", "@cob0", "l1", "@cob1", "cf", "ecc", "ci", "ver?", "em", "eoom", "xoom", "ecp", "cp"]
         
-        if fn_name in commandArgs and len(argv) == 1:
-            self.serial.write(fn_name + str(argv[0]))
-            return self.serial.readline().strip()
-        elif fn_name in commandInts and len(argv) == 0:
-            self.serial.write(fn_name)
-            return int(self.serial.readline().strip())
-        elif fn_name in commandFloats and len(argv) == 0:
-            self.serial.write(fn_name)
-            return float(self.serial.readline().strip())
-        elif fn_name in commandOther and len(argv) == 0:
-            self.serial.write(fn_name)
-            r = self.serial.readline().strip()
+        if fn_name in commandArgs and len(args) == 1:
+            return self._query(fn_name + str(args[0]))
+        elif fn_name in commandInts and len(args) == 0:
+            return int(self._query(fn_name))
+        elif fn_name in commandFloats and len(args) == 0:
+            return float(self._query(fn_name))
+        elif fn_name in commandOther and len(args) == 0:
+            r = self._query(fn_name)
         else:
-            return LaserIOError("Unrecognized command.")
+            raise LaserIOError("Unrecognized command.")
         
         return 'You successfully called the dispatching method!'
-
-class LaserIOError(IOError):
-    pass
@@ -0,0 +1,158 @@
+import argparse, logging, time
+from serial_emulator import PTYEmulator
+
+logger = logging.getLogger(__name__)
+
+# Cobolt laser on a pty: the command set listed in Cobolt.dispatch.
+#
+# from Cobolt import emulator, Cobolt
+# with emulator.CoboltEmulator() as emu:
+#     with Cobolt.Cobolt(port=emu.port) as c:
+#         c.dispatch('', 'l1')
+#         c.dispatch('', 'pa?')
+#
+# or as a process: python -m Cobolt.emulator
+#
+# Commands end in \r (or \n); every command is answered with a line ending in \r\n: the
+# value for queries, "OK" otherwise, "Syntax error: illegal command" if unknown.
+# Arguments follow the command with or without a space ("p0.05", "p 0.05").
+# CoboltEmulator settings (besides latency/baudrate, see serial_emulator):
+#   interlock -> whether the interlock is open (laser can not turn on, fault 3)
+
+OK = 'OK'
+ILLEGAL = 'Syntax error: illegal command'
+
+class CoboltEmulator(PTYEmulator):
+    name = 'Cobolt'
+
+    def __init__(self,latency=0,baudrate=None,interlock=False):
+        self.interlock = interlock
+        self.on = False
+        self.autostart = 1
+        self.mode = 'power'          # power, current or modulation
+        self.onoff_modulation = False
+        self.power = 0.05            # W
+        self.current = 1000.0        # mA
+        self.modulated_power = 50.0  # mW
+        self.digital_modulation = 0
+        self.analog_modulation = 0
+        self.analog_low_impedance = 0
+        self.fault = 0
+        self.started = time.time()
+        self._buffer = b''
+        super().__init__(latency,baudrate)
+
+    def received(self,data):
+        self._buffer += data.replace(b'\n',b'\r')
+        while b'\r' in self._buffer:
+            (line,self._buffer) = self._buffer.split(b'\r',1)
+            line = line.strip().decode('ascii','replace')
+            if line:
+                self.reply((self._command(line) + '\r\n').encode())
+
+    def _command(self,line):
+        if line in self.queries:
+            self.count(line)
+            return str(self.queries[line](self))
+        if line in self.actions:
+            self.count(line)
+            self.actions[line](self)
+            return OK
+        for name in sorted(self.setters,key=len,reverse=True):  # "slmp" before "p"
+            if line.startswith(name):
+                try:
+                    value = float(line[len(name):])
+                except ValueError:
+                    continue
+                self.count(name)
+                return self.setters[name](self,value) or OK
+        self.count('illegal')
+        return ILLEGAL
+
+    def _turn_on(self):
+        if self.interlock:
+            self.fault = 3
+        else:
+            self.on = True
+
+    def _operating_mode(self):
+        # 0 Off, 1 Waiting for key, 2 Continuous, 3 On/Off Modulation, 4 Modulation, 5 Fault
+        if self.fault:
+            return 5
+        if not self.on:
+            return 0
+        if self.onoff_modulation:
+            return 3
+        return 4 if self.mode == 'modulation' else 2
+
+    def _set(attribute,cast=float,valid=lambda value: True):
+        def setter(self,value):
+            if not valid(value):
+                return 'Syntax error: value out of range'
+            setattr(self,attribute,cast(value))
+        return setter
+
+    queries = {
+        '?': lambda self: OK,
+        'l?': lambda self: int(self.on),
+        '@cobas?': lambda self: self.autostart,
+        '@cobasks?': lambda self: 1,
+        '@cobast?': lambda self: 5 if self.on else 1,
+        'gom?': _operating_mode,
+        'f?': lambda self: self.fault,
+        'ilk?': lambda self: int(self.interlock),
+        'leds?': lambda self: 1 | (2 if self.on else 0) | (8 if self.fault else 0),
+        'gsn?': lambda self: 12345,
+        'sn?': lambda self: 12345,
+        'ver?': lambda self: '9.001',
+        'hrs?': lambda self: '%.2f'%(100 + (time.time()-self.started)/3600),
+        'i?': lambda self: '%.1f'%(self.current if self.on else 0.0),
+        'glp?': lambda self: '%.4f'%(self.power*1e3),
+        'p?': lambda self: '%.4f'%self.power,
+        'ps?': lambda self: '%.4f'%self.power,
+        'pa?': lambda self: '%.4f'%(self.power if self.on else 0.0),
+        'glmp?': lambda self: '%.1f'%self.modulated_power,
+        'rbpt?': lambda self: '25.0',
+        'gdmes?': lambda self: self.digital_modulation,
+        'games?': lambda self: self.analog_modulation,
+        'galis?': lambda self: self.analog_low_impedance,
+    }
+    actions = {
+        'l0': lambda self: setattr(self,'on',False),
+        '@cob0': lambda self: setattr(self,'on',False),
+        'l1': _turn_on,
+        '@cob1': _turn_on,
+        'cf': lambda self: setattr(self,'fault',0),
+        'ecc': lambda self: setattr(self,'mode','current'),
+        'ci': lambda self: setattr(self,'mode','current'),
+        'ecp': lambda self: setattr(self,'mode','power'),
+        'cp': lambda self: setattr(self,'mode','power'),
+        'em': lambda self: setattr(self,'mode','modulation'),
+        'eoom': lambda self: setattr(self,'onoff_modulation',True),
+        'xoom': lambda self: setattr(self,'onoff_modulation',False),
+    }
+    setters = {
+        '@cobas': _set('autostart',int,lambda value: value in [0,1]),
+        'slc': _set('current',float,lambda value: 0 <= value <= 5000),
+        'slp': _set('power',lambda value: value*1e-3,lambda value: 0 <= value <= 1000),
+        'p': _set('power',float,lambda value: 0 <= value <= 1),
+        '@cobasp': _set('power',float,lambda value: 0 <= value <= 1),
+        'slmp': _set('modulated_power',float,lambda value: value >= 0),
+        'sdmes': _set('digital_modulation',int,lambda value: value in [0,1]),
+        'sames': _set('analog_modulation',int,lambda value: value in [0,1]),
+        'salis': _set('analog_low_impedance',int,lambda value: value in [0,1]),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cobolt laser emulator on a pseudo-terminal.')
+    parser.add_argument('--latency',type=float,default=0,help='seconds before every reply')
+    parser.add_argument('--baudrate',type=int,default=0,help='reply pacing (0: none)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with CoboltEmulator(args.latency,args.baudrate or None) as emu:
+        logger.info('Cobolt emulator on %s'%emu.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,41 @@
+import argparse, logging
+from benchmark_tools import run, report, header
+from MSquared import msquared, simulator
+
+# Round-trip latency of the msquared hot paths against the local protocol simulator.
+#
+# python -m MSquared.benchmark --latency 0.0005 --calls 1000
+
+def entry_points(wrapper):
+    # name: call
+    s = wrapper.sessions['solstis']
+    return [
+        ('_transmit get_status', lambda: s._transmit('get_status')),
+        ('get_wavelength', lambda: s.get_wavelength()),
+        ('status_wavelength (pipelined)', lambda: s.status_wavelength()),
+        ('set_etalon_val', lambda: s.set_etalon_val(50)),
+        ('set_resonator_val + report', lambda: s.set_resonator_val(50,10)),
+        ('set_resonator_val job + wait', lambda: s.job_wait(s.set_resonator_val(50,10,True)[1])),
+        ('dispatch solstis status', lambda: wrapper.dispatch('bench','status','solstis')),
+        ('dispatch alternating EMM/solstis', lambda: (wrapper.dispatch('bench','status','EMM'),
+                                                      wrapper.dispatch('bench','status','solstis'))),
+        ('new solstis session', lambda: msquared.solstis().__exit__(None,None,None)),
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark msquared entry points on the simulated ICE-BLOC.')
+    parser.add_argument('--calls',type=int,default=1000,help='maximum calls per entry point')
+    parser.add_argument('--duration',type=float,default=2.0,help='maximum seconds per entry point')
+    parser.add_argument('--latency',type=float,default=0,help='simulated seconds before every reply')
+    parser.add_argument('--tune-time',type=float,default=0,help='simulated seconds before final reports')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with simulator.SimulatedICE(latency=args.latency,tune_time=args.tune_time) as sim:
+        msquared.init('benchmark',sim.address,sim.address)
+        with msquared.LaserWrapper() as wrapper:
+            wrapper.dispatch('bench','status','solstis')  # Open both sessions
+            print('\nsimulator latency %g s, tune time %g s'%(args.latency,args.tune_time))
+            header()
+            for (name,fn) in entry_points(wrapper):
+                report(name,run(fn,args.calls,args.duration))
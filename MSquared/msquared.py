@@ -1,7 +1,9 @@
 import socket, select
 import sys, time, os, inspect
-import json
-import subprocess, datetime
+import json, re
+import subprocess, datetime, threading
+import concurrent.futures, bisect, base64
+import numpy as np
 import logging # Should grab default logger
 
 logger = None # Should initialize with init_logger
@@ -12,17 +14,24 @@ ADDR = {
     'solstis': None,
     'EMM': None
 } #defined for a given module in init file
+TUNING_CACHE = None # Path of the solstis tuning cache (JSON); None keeps it in memory only
+# Etalon/resonator piezo drive full scale (V) of the SolsTiS ICE-BLOC: tune_etalon and
+# tune_resonator take percent of this range while get_status reports etalon_voltage and
+# resonator_voltage in volts. The TCP/JSON protocol has no command to read the range, so
+# it is the 0-200 V of the standard ICE-BLOC piezo drivers unless given to init.
+PIEZO_FULL_SCALE = 200.0
 
-help_text = '''This wrapper is for the hwserver. It will take care of entering and exiting \
-EMM or solstis as needed (keeping the last one called alive until it needs to \
-switch)
+help_text = '''This wrapper is for the hwserver. It keeps a connection to each configured laser \
+(EMM and/or solstis) open, reconnecting one if its connection was lost.
 
 This also keeps track of the last client until client requests to "close" connection. \
 It is possible to force client out by calling force_client() method (e.g. function="force_client", args=[]).
 
 When calling a laser, the first argument must be name of laser (e.g. function="function_name", args=["laser_name",...]). \
 Note, that anything with an equals sign in the prototype is optional. Anything that has a positive (non-zero) timeout will return a tuple \
-of the original command response along with a report.
+of the original command response along with a report. Long operations also take job=True \
+(last argument), returning the response and a job id immediately instead; use job_status, \
+job_wait and job_cancel (with the same laser_name) to follow it while other calls stay usable.
 Valid "laser_name" options (along with their valid "function_name" options):
 
 EMM:
@@ -32,14 +41,17 @@ solstis:
   %s
 '''
 
-def init(name, solstis_addr, emm_addr):
+def init(name, solstis_addr, emm_addr, tuning_cache=None, piezo_full_scale=None):
 	# Addresses: (IP, PORT)
-    global logger, ADDR
+    global logger, ADDR, TUNING_CACHE, PIEZO_FULL_SCALE
     logger = logging.getLogger(name)
     ADDR = {
         'solstis': solstis_addr,
         'EMM': emm_addr
     }
+    TUNING_CACHE = tuning_cache
+    if piezo_full_scale is not None: # Read by solstis._learn at each report
+        PIEZO_FULL_SCALE = float(piezo_full_scale)
 
 def _help():
     EMM_help = []
@@ -59,19 +71,20 @@ def _help():
     return help_text%('\n  '.join(EMM_help),'\n  '.join(solstis_help))
 
 class LaserWrapper:
-    # This wrapper is for the hwserver. It will take care of entering and exiting
-    # EMM or solstis as needed (keeping the last one called alive until it needs to
-    # switch)
+    # This wrapper is for the hwserver. It keeps one live session per configured laser
+    # (EMM and/or solstis) so alternating calls do not reconnect. A session whose
+    # connection dropped is rebuilt on its next call.
     #
     # This also keeps track of the last client until client requests to "close" connection.
     # It is possible to force client out by calling force_client() method
 
     def __init__(self):
         # We will try to instantiate EMM if exists, if not try solstis, else error
+        self.sessions = {} # {laser name: EMM or solstis instance}
         if ADDR['EMM']:
-            self.laser = EMM() # Handle to either EMM or solstis (load EMM first because takes a while to init)
+            self.laser = self._session('EMM') # Last used session (load EMM first because takes a while to init)
         elif ADDR['solstis']:
-            self.laser = solstis()
+            self.laser = self._session('solstis')
         else:
             raise Exception('EMM and solstis are not configured with an address. Can\'t initialize.')
         self.client = (None,None)  # Keep track of last client (IP,last_use datetime)
@@ -79,8 +92,31 @@ class LaserWrapper:
     def __enter__(self):
         return self
     def __exit__(self,*args,**kwargs):
-        if self.laser:
-            self.laser.__exit__(self, *args,**kwargs)
+        for laser in list(self.sessions):
+            self._drop(laser)
+        self.laser = None
+
+    def _healthy(self,session):
+        return session._reader.is_alive() and session._error is None
+
+    def _drop(self,laser):
+        session = self.sessions.pop(laser,None)
+        if session:
+            try: session.__exit__(None,None,None)
+            except: logger.exception('Error closing %s session'%laser)
+
+    def _session(self,laser):
+        # Live session for laser, (re)connecting if needed
+        session = self.sessions.get(laser)
+        if session is not None and not self._healthy(session):
+            logger.warning('%s session lost (%s); reconnecting'%(laser,session._error))
+            self._drop(laser)
+            session = None
+        if session is None:
+            if not ADDR[laser]: raise Exception('"%s" is not configured with an address. Can\'t initialize.'%laser)
+            session = globals()[laser]()
+            self.sessions[laser] = session
+        return session
 
     def dispatch(self,client,fn,*args):
         if fn == 'force_client':
@@ -98,12 +134,8 @@ class LaserWrapper:
         if client != self.client[0] and self.client[0] is not None:
             raise Exception('Another client was using the laser (last call: %s)'%self.client[1])
         self.client = (client,datetime.datetime.now())
-        # Check laser and update if necessary
-        if laser != self.laser.__class__.__name__: # This will work with None too
-            if not ADDR[laser]: raise Exception('"%s" is not configured with an address. Can\'t initialize.')
-            try: self.laser.__exit__(None,None,None)
-            except: pass
-            self.laser = globals()[laser]()
+        # Get (or reconnect) the session
+        self.laser = self._session(laser)
         # Dispatch
         assert fn in dir(self.laser), \
             'Function "%s" not found in laser "%s". Available: %s'%(fn,laser,', '.join([f for f in dir(self.laser) if f[0]!='_']))
@@ -144,100 +176,446 @@ class ParseError(IOError):
 class WrongTransmissionID(IOError):
     pass
 
-def recvjson(connection,recv_buffer=1):
-    # Having recv_buffer larger than 1 byte could result in multiple json strings loaded at once
-    buffer = b''
-    while True:
-        data = connection.recv(recv_buffer)
-        if not data: ClientDisconnected('Client disconnected.')
-        buffer += data
-        try:
-            return json.loads(buffer)
-        except ValueError:
-            pass
+class JSONStream:
+    # Splits the TCP byte stream into JSON messages using a persistent receive buffer.
+    # Data is read in chunks. A buffer that looks complete is decoded directly; otherwise
+    # each byte is scanned once for structural characters until the message closes.
+    # Surplus bytes of the next message stay buffered for the next call.
+    _special = re.compile(rb'[\\"{}\[\]]')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self,sock,chunk=4096):
+        self.sock = sock
+        self.chunk = chunk
+        self.buffer = bytearray()
+        self._scan = 0       # Buffer index scanned so far
+        self._depth = 0      # Bracket depth at self._scan
+        self._string = False # Inside a JSON string at self._scan
+        self._start = None   # Buffer index of the current message's opening bracket
+
+    def _next(self):
+        # Returns the next complete message in the buffer, or None
+        buf = self.buffer
+        if self._scan == 0 and self._depth == 0 and buf.rstrip()[-1:] == b'}':
+            try: # Fast path: whole message(s) already received
+                text = buf.decode('utf-8')
+                (msg,end) = self._decoder.raw_decode(text,len(text)-len(text.lstrip()))
+            except ValueError:
+                pass # Incomplete (or split utf-8); scan instead
+            else:
+                del buf[:len(text[:end].encode('utf-8'))]
+                return msg
+        i = self._scan
+        while True:
+            match = self._special.search(buf,i)
+            if not match:
+                break
+            i = match.start()
+            c = buf[i]
+            if self._string:
+                if c == 0x5c:   # \ escapes the next byte
+                    if i+1 == len(buf):
+                        break   # Need the escaped byte first
+                    i += 1
+                elif c == 0x22: # "
+                    self._string = False
+            elif c == 0x22:
+                self._string = True
+            elif c in b'{[':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c in b'}]' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = bytes(buf[self._start:i+1])
+                    del buf[:i+1]
+                    self._scan = 0
+                    self._start = None
+                    return json.loads(raw.decode('utf-8'))
+            i += 1
+        if self._depth == 0 and not self._string:
+            del buf[:]  # Only whitespace between messages
+            i = 0
+        self._scan = min(i,len(buf))
+        return None
+
+    def _fill(self):
+        data = self.sock.recv(self.chunk)
+        if not data: raise ClientDisconnected('Client disconnected.')
+        self.buffer += data
+
+    def recv(self):
+        # Blocks (subject to the socket timeout) until a complete message is available
+        while True:
+            msg = self._next()
+            if msg is not None:
+                return msg
+            self._fill()
+
+class TuningCache:
+    # Etalon/resonator settings (percent) that reached past set_wavelength targets, kept
+    # sorted by wavelength for nearest-neighbour lookup and saved as JSON after each change.
+    # Entries unused for max_age seconds are evicted, then least recently used ones
+    # beyond max_entries.
+    def __init__(self,path=None,tolerance=0.01,max_entries=2000,max_age=30*24*3600):
+        self.path = path
+        self.tolerance = tolerance # nm; farther entries are misses
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.wavelengths = [] # sorted keys of entries
+        self.entries = {}     # {wavelength: {'etalon','resonator','stored','used','hits'}}
+        self.stats = {'hits':0,'misses':0,'stores':0,'evictions':0,'failures':0}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f):
+                    self.entries[entry.pop('wavelength')] = entry
+            self.wavelengths = sorted(self.entries)
+            with self._lock:
+                self._evict()
+
+    def _evict(self):
+        # Must hold self._lock
+        now = time.time()
+        stale = [wl for wl,e in self.entries.items() if now - e['used'] > self.max_age]
+        extra = len(self.entries) - len(stale) - self.max_entries
+        if extra > 0:
+            fresh = sorted((e['used'],wl) for wl,e in self.entries.items() if wl not in stale)
+            stale += [wl for (used,wl) in fresh[0:extra]]
+        for wl in stale:
+            self._remove(wl)
+            self.stats['evictions'] += 1
+        return bool(stale)
+
+    def _remove(self,wavelength):
+        del self.entries[wavelength]
+        self.wavelengths.pop(bisect.bisect_left(self.wavelengths,wavelength))
+
+    def _save(self):
+        # Must hold self._lock; written to a temporary file first so a crash keeps the old cache
+        if not self.path:
+            return
+        entries = [dict(self.entries[wl],wavelength=wl) for wl in self.wavelengths]
+        with open(self.path+'.tmp','w') as f:
+            json.dump(entries,f)
+        os.replace(self.path+'.tmp',self.path)
+
+    def lookup(self,wavelength):
+        # Returns (wavelength, entry) of the nearest entry within tolerance, else None
+        with self._lock:
+            i = bisect.bisect_left(self.wavelengths,wavelength)
+            near = [wl for wl in self.wavelengths[max(0,i-1):i+1] if abs(wl-wavelength) <= self.tolerance]
+            if not near:
+                self.stats['misses'] += 1
+                return None
+            wl = min(near,key=lambda wl: abs(wl-wavelength))
+            entry = self.entries[wl]
+            entry['used'] = time.time()
+            entry['hits'] += 1
+            self.stats['hits'] += 1
+            return wl,dict(entry)
+
+    def store(self,wavelength,etalon,resonator):
+        with self._lock:
+            now = time.time()
+            if wavelength not in self.entries:
+                bisect.insort(self.wavelengths,wavelength)
+            self.entries[wavelength] = {'etalon':etalon,'resonator':resonator,'stored':now,'used':now,
+                                        'hits':self.entries.get(wavelength,{}).get('hits',0)}
+            self.stats['stores'] += 1
+            self._evict()
+            self._save()
+
+    def discard(self,wavelength):
+        # Drop an entry whose settings did not lead to a successful tune
+        with self._lock:
+            if wavelength in self.entries:
+                self._remove(wavelength)
+                self.stats['failures'] += 1
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.wavelengths = []
+            self._save()
+
+    def status(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats,entries=len(self.entries),path=self.path,tolerance=self.tolerance,
+                        hit_rate=self.stats['hits']/lookups if lookups else None)
+
+class Job:
+    # A long-running operation whose final report ("<op>_f_r") is collected later, or a
+    # task run inside hwserver (e.g. solstis.scan) that fills in data as it goes.
+    # state: running -> finished | cancelled | detached | timeout | failed (timeout=None never
+    # times out). detached: given up by job_cancel but still running on the laser (no abort op)
+    def __init__(self,id,op,transmission_id,response,timeout=None,cancel=None):
+        self.id = id
+        self.op = op
+        self.transmission_id = transmission_id
+        self.response = response  # parameters of the immediate reply
+        self.report = None        # parameters of the final report
+        self.timeout = timeout or None
+        self.cancel = cancel      # callable aborting the operation on the laser (or None)
+        self.on_report = None     # callable(job) run on its own thread once the report arrives
+        self.data = None          # {name: list} partial results of in-server tasks
+        self.started = time.time()
+        self.finished = None
+        self.state = 'running'
+
+    def check(self):
+        if self.state == 'running' and self.timeout and time.time() - self.started > self.timeout:
+            self.state = 'timeout'
+        return self.state
+
+    def status(self):
+        return {'job': self.id,
+                'op': self.op,
+                'state': self.check(),
+                'elapsed': (self.finished or time.time()) - self.started,
+                'response': self.response,
+                'report': self.report,
+                'points': len(next(iter(self.data.values()))) if self.data else None}
 
 class msquared:
     default_timeout = 2 # Default timeout
+    max_jobs = 100 # Completed jobs kept for job_status
+    _live = None # Most recent open instance (per subclass) for in-process users (e.g. wavemeter servo)
     def __init__(self):
         # Begin socket creation
         logger.debug('Creating Socket')
         # Create a TCP/IP socket
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(msquared.default_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Pipelined requests go out immediately
         self.sock = sock
+        self._stream = JSONStream(sock)
         self.transmission_id = 0
+        self._send_lock = threading.Lock() # Serialises transmission_id and sendall
+        self._cond = threading.Condition() # Guards _pending and _jobs; notified on reports
+        self._pending = {} # {transmission_id: (msg, Future)} awaiting their reply
+        self._jobs = {} # {job id: Job}
+        self._job_id = 0
+        self._closing = False
+        self._error = None # Exception that stopped the reader
+        self._reader = threading.Thread(target=self._read_loop,daemon=True,name='msquared reader')
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if type(self)._live is self:
+            type(self)._live = None
         logger.debug('Closing TCP socket')
+        self._closing = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR) # Wakes the reader
+        except OSError:
+            pass
         self.sock.close()
+        if self._reader.is_alive():
+            self._reader.join(self.default_timeout)
         logger.debug('Closed')
 
-    def _clean_input_buffer(self):
-        # Make sure input buffer is clear (mainly in case report is sent, but timeout occurs before receiving)
-        [r,w,x] = select.select([self.sock],[],[],0)
-        if r:
-            self.sock.setblocking(0)
-            try:
-                old = self.sock.recv(4096).decode('utf-8') # Empty buffer by reading
-                logger.error('Found old bytes in input:\n%s'%old)
-            finally:
-                self.sock.setblocking(1)
- 
-    def _waitfor_report(self,op,report_timeout):
-        logger.debug('Waiting for report')
-        self.sock.settimeout(report_timeout)
+    def _connect(self,addr):
+        self.sock.connect(addr)
+        self._reader.start()
+
+    def _read_loop(self):
+        # Reader thread: hands each reply to the future of its transmission_id and
+        # each report to its job, so any number of requests can be in flight
         try:
-            report = recvjson(self.sock)
-            if report['message']['op'] != op+'_f_r':
-                raise Exception('Failed to receive report, instead received:\n%s'%json.dumps(report))
-        finally:
-            self.sock.settimeout(self.default_timeout)
-        logger.debug(report['message'])
-        return report['message']
+            while not self._closing:
+                try:
+                    message = self._stream.recv()['message']
+                except socket.timeout:
+                    continue
+                logger.debug(message)
+                self._dispatch(message)
+        except Exception as err:
+            if not self._closing:
+                logger.exception('M Squared reader stopped')
+            self._fail(err if isinstance(err,IOError) else ClientDisconnected(str(err)))
 
-    def _recv(self,msg,n=5):
-        # Attemt to receive correct transmission_id
-        attempt = 0
-        while True:
+    def _fail(self,err):
+        with self._cond:
+            self._error = err
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._cond.notify_all()
+        for (msg,future) in pending:
+            future.set_exception(err)
+
+    def _dispatch(self,message):
+        tid = message.get('transmission_id',[None])[0]
+        with self._cond:
+            if message['op'].endswith('_f_r'):
+                self._route(message)
+                self._cond.notify_all()
+                return
+            request = self._pending.pop(tid,None)
+            if request is None and message['op'] == 'parse_fail' and self._pending:
+                # Unparseable requests have no id; replies come in order, so it is the oldest
+                request = self._pending.pop(min(self._pending))
+        if request is None:
+            logger.error('Discarding message from another transmission:\n%s'%json.dumps(message))
+        elif message['op'] == 'parse_fail':
+            request[1].set_exception(ParseError(request[0],message))
+        else:
+            request[1].set_result(message)
+
+    def _route(self,message):
+        # Must hold self._cond. Reports go to their job (matching transmission_id first,
+        # else oldest running job with that op)
+        op = message['op'][0:-4]
+        candidates = [job for job in self._jobs.values() if job.op == op and job.report is None]
+        job = next((job for job in candidates if job.transmission_id == message.get('transmission_id',[None])[0]),None)
+        job = job or next((job for job in candidates if job.check() == 'running'),None) \
+                  or next((job for job in candidates if job.state == 'timeout'),None)
+        if job is None:
+            logger.error('Discarding report without a job:\n%s'%json.dumps(message))
+            return
+        logger.debug('Report for job %i: %s'%(job.id,message))
+        job.report = message.get('parameters')
+        job.finished = time.time()
+        if job.state not in ['cancelled','detached']:
+            job.state = 'finished'
+        if job.on_report: # May transmit, so not on the reader thread
+            threading.Thread(target=job.on_report,args=(job,),daemon=True,name='msquared report').start()
+
+    def _new_job(self,op,transmission_id,response,timeout,cancel):
+        with self._cond:
+            self._job_id += 1
+            job = Job(self._job_id,op,transmission_id,response,timeout,cancel)
+            self._jobs[job.id] = job
+            done = [i for i,j in self._jobs.items() if j.check() != 'running']
+            for i in done[0:max(0,len(self._jobs)-self.max_jobs)]:
+                del self._jobs[i]
+        return job
+
+    def _get_job(self,job_id):
+        job = self._jobs.get(int(job_id))
+        if job is None:
+            raise Exception('Unknown job %s (known: %s)'%(job_id,', '.join(str(i) for i in self._jobs)))
+        return job
+
+    def jobs(self):
+        # Status of all tracked jobs
+        with self._cond:
+            return [job.status() for job in self._jobs.values()]
+
+    def job_status(self,job_id):
+        # Non-blocking; state is running, finished, cancelled, detached, timeout or failed
+        with self._cond:
+            return self._get_job(job_id).status()
+
+    def job_wait(self,job_id,timeout=None):
+        # Block until the job leaves "running" or timeout seconds pass; the socket stays
+        # usable by other calls (e.g. status, abort_tune) while waiting
+        job = self._get_job(job_id)
+        tstart = time.time()
+        with self._cond:
+            while job.check() == 'running' and self._error is None:
+                remaining = 0.1 if timeout is None else min(0.1,timeout - (time.time()-tstart))
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job.status()
+
+    def job_cancel(self,job_id):
+        # Abort the operation on the laser and stop tracking it. Operations without an abort
+        # op in the ICE protocol (e.g. tune_resonator, etalon_lock, start_ppln) keep running
+        # on the laser; their job is only detached (state "detached", report ignored).
+        # In-server tasks (e.g. scan) stop themselves and are cancelled.
+        job = self._get_job(job_id)
+        with self._cond:
+            running = job.check() == 'running'
+            if running:
+                job.state = 'cancelled' if job.cancel or job.data is not None else 'detached'
+                job.finished = time.time()
+        if running and job.cancel:
+            job.cancel()
+        return job.status()
+
+    def _request(self,op,parameters=None,report='',job=None):
+        # Sends one request; returns (transmission_id, Future of the reply message)
+        # job: Job for the report, tagged with the transmission_id before sending so a
+        #   fast report cannot arrive ahead of it
+        parameters = dict(parameters or {})
+        if report:
+            parameters['report'] = report
+        future = concurrent.futures.Future()
+        with self._send_lock:
+            if self._error is not None:
+                raise self._error
+            self.transmission_id += 1  # Increment unique transmission ID
+            tid = self.transmission_id
+            msg =   {'message':{'transmission_id':[tid],'op':op}}
+            if parameters:
+                msg['message']['parameters'] = parameters
+            with self._cond:
+                self._pending[tid] = (msg,future)
+                if job:
+                    job.transmission_id = tid
             try:
-                response = recvjson(self.sock)
-                response = response['message']
-                logger.debug(response)
-                if response['op'] == 'parse_fail':
-                    raise ParseError(msg,response)
-                if response['transmission_id'][0] != self.transmission_id:
-                    raise WrongTransmissionID('Received response from wrong transmission_id:\n%s'%json.dumps(response))
-                break
-            except WrongTransmissionID:
-                attempt += 1
-                if attempt >= n:
-                    raise
-        return response
+                self.sock.sendall(json.dumps(msg,separators=(',',':')).encode('utf-8'))
+            except:
+                with self._cond:
+                    self._pending.pop(tid,None)
+                raise
+        return tid,future
+
+    def _reply(self,op,tid,future):
+        # Waits for the reply of a _request
+        try:
+            return future.result(self.default_timeout)
+        except concurrent.futures.TimeoutError:
+            with self._cond:
+                self._pending.pop(tid,None)
+            raise socket.timeout('No reply to %s (transmission %i) within %s s'%(op,tid,self.default_timeout))
 
-    def _transmit(self,op,parameters={},report='',report_timeout=60):
+    def _transmit(self,op,parameters=None,report='',report_timeout=60,job=False,cancel=None,on_report=None):
         # op should be the desired operation
         # parameters should be dictionary of parameters (if None, will omit)
         # report should be a string if desired. will add to parameters
-        # report_timeout should be seconds to wait for recvjson on report (ignored if no report)
+        # report_timeout should be seconds to wait for the report (ignored if no report)
+        # job: return (parameters, job id) right away instead of waiting for the report
+        # cancel: callable used by job_cancel to abort the operation
+        # on_report: callable(Job) run once the report arrives (see Job.on_report)
         #
         # Returns parameters of returned message
-        self._clean_input_buffer()
-        self.transmission_id += 1  # Increment unique transmission ID
-        msg =   {'message':{'transmission_id':[self.transmission_id],'op':op}}
-        if report:
-            parameters['report'] = report
-        if parameters:
-            msg['message']['parameters'] = parameters
-        self.sock.sendall(json.dumps(msg).encode('utf-8'))
-        response = self._recv(msg)
+        new_job = None
         if report:
-            #assert response['parameters']['status'][0]==0, '%s failed with status %i'%(op,response['parameters']['status'][0])
-            report_out = self._waitfor_report(op,report_timeout)
-            return response['parameters'],report_out['parameters']
-        return response['parameters']
+            new_job = self._new_job(op,None,None,report_timeout,cancel)
+            new_job.on_report = on_report
+        try:
+            (tid,future) = self._request(op,parameters,report,new_job)
+            response = self._reply(op,tid,future)
+        except:
+            if new_job:
+                with self._cond:
+                    self._jobs.pop(new_job.id,None)
+            raise
+        if not report:
+            return response['parameters']
+        #assert response['parameters']['status'][0]==0, '%s failed with status %i'%(op,response['parameters']['status'][0])
+        new_job.response = response['parameters']
+        if job:
+            return response['parameters'],new_job.id
+        logger.debug('Waiting for report')
+        status = self.job_wait(new_job.id)
+        if status['state'] != 'finished':
+            raise socket.timeout('No %s report within %s s'%(op,report_timeout))
+        return response['parameters'],status['report']
+
+    def _transmit_many(self,requests):
+        # Pipelined _transmit for [(op, parameters), ...] without reports: all requests
+        # are sent before any reply is awaited. Returns parameters in request order.
+        sent = [(op,)+self._request(op,parameters) for (op,parameters) in requests]
+        return [self._reply(*request)['parameters'] for request in sent]
 
     def _hello(self):
         # Try twice here
@@ -252,7 +630,7 @@ class EMM(msquared):
     def __init__(self):
         super(EMM,self).__init__()
         # Connect the socket to the port where the server is listening
-        self.sock.connect(ADDR['EMM'])
+        self._connect(ADDR['EMM'])
         self._hello()  # Introduce to msquared server
         # Launch man_in_the_middle.py
         self._MITM_proc = None
@@ -296,23 +674,23 @@ class EMM(msquared):
     def status(self):
         return self._transmit('status')
 
-    def start_ppln(self,oven,timeout=60):
+    def start_ppln(self,oven,timeout=60,job=False):
         assert oven in [1,2,3], 'oven must be an integer of either 1, 2 or 3'
-        if timeout:
-            return self._transmit('start_ppln',{'fitted_oven':oven},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('start_ppln',{'fitted_oven':oven},report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('start_ppln',{'fitted_oven':oven})
 
-    def optimise_ppln(self,timeout=60):
+    def optimise_ppln(self,timeout=60,job=False):
         raise Exception('Not working right now, sorry!!')
-        if timeout:
-            return self._transmit('optimise_ppln',report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('optimise_ppln',report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('optimise_ppln')
 
-    def change_ppln(self,timeout=60):
-        if timeout:
-            return self._transmit('change_ppln',report='finished',report_timeout=timeout)
+    def change_ppln(self,timeout=60,job=False):
+        if timeout or job:
+            return self._transmit('change_ppln',report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('change_ppln')
 
@@ -321,19 +699,20 @@ class EMM(msquared):
         assert action in ['start','stop'], 'action must be either "start" or "stop"'
         self._transmit('pba_control',{'action':action})
 
-    def pba_reference(self,action,timeout=60):
+    def pba_reference(self,action,timeout=60,job=False):
         self._check_MITM_proc()
         assert action in ['start','stop'], 'action must be either "start" or "stop"'
-        if timeout:
-            return self._transmit('pba_reference',{'action':action,'solstis':[1]},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('pba_reference',{'action':action,'solstis':[1]},report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('pba_reference',{'action':action,'solstis':[1]})
 
-    def set_wavelength(self,target,timeout=120,wavelength_range='visible'):
+    def set_wavelength(self,target,timeout=120,wavelength_range='visible',job=False):
         assert wavelength_range in ['visible','infrared'], 'Wavelength_range must be either "visible" or "infrared"'
         self._check_MITM_proc()
-        if timeout:
-            return self._transmit('wavelength',{'target':[target],'beam':wavelength_range},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('wavelength',{'target':[target],'beam':wavelength_range},report='finished',report_timeout=timeout,
+                                  job=job,cancel=self.abort_tune)
         else:
             return self._transmit('wavelength',{'target':[target],'beam':wavelength_range})
 
@@ -350,11 +729,28 @@ class EMM(msquared):
 
 
 class solstis(msquared):
+    prepositioned_timeout = 10 # Seconds allowed for set_resonator_val when pre-positioning
+    poll_max_age = 5 # Poll periods a polled reply is served for before reads go live again
+    _tuning_caches = {} # {path: TuningCache} shared by reconnected sessions
+
     def __init__(self):
         super(solstis,self).__init__()
+        self._poller = None  # (thread, stop event, rate) of the status/wavelength poller
+        self._polled = None  # {'time','status','wavelength','updates'} last poll
+        self._poll_error = None
         # Connect the socket to the port where the server is listening
-        self.sock.connect(ADDR['solstis'])
+        self._connect(ADDR['solstis'])
         self._hello()  # Introduce to msquared server
+        if TUNING_CACHE not in solstis._tuning_caches:
+            solstis._tuning_caches[TUNING_CACHE] = TuningCache(TUNING_CACHE)
+        self._tuning = solstis._tuning_caches[TUNING_CACHE]
+        solstis._live = self
+
+    def __exit__(self, *args):
+        try:
+            self.stop_poller()
+        finally:
+            super(solstis,self).__exit__(*args)
 
     def _set_wavelengthMeter_channel(self,channel,recovery=1):
         # Shouldn't really be called, because requires knowledge that clients might not have
@@ -372,19 +768,119 @@ class solstis(msquared):
         else:
             return response
 
-    def set_wavelength_open(self,wavelength,timeout=60):
+    def set_wavelength_open(self,wavelength,timeout=60,job=False):
         # Fails if wavemeter (poll and abort not implemented here; recommend using timeout)
-        if timeout:
-            return self._transmit('move_wave_t',{'wavelength':[wavelength]},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('move_wave_t',{'wavelength':[wavelength]},report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('move_wave_t',{'wavelength':[wavelength]})
 
-    def set_wavelength(self,wavelength,timeout=60):
+    def set_wavelength(self,wavelength,timeout=60,job=False,cached=True):
         # This will also lock the etalon and resonator
-        if timeout:
-            return self._transmit('set_wave_m',{'wavelength':[wavelength]},report='finished',report_timeout=timeout)
-        else:
+        # cached: start from the etalon/resonator settings of a previous tune within
+        #   tuning_cache_status()['tolerance'] nm, and remember the settings once locked.
+        #   Needs the report (timeout or job); without one the cache is not used, since
+        #   nothing could be learned from (or discarded after) the tune.
+        if not (timeout or job):
             return self._transmit('set_wave_m',{'wavelength':[wavelength]})
+        hit = self._preposition(wavelength,job) if cached else None
+        on_report = (lambda job: self._learn(wavelength,job.report,hit)) if cached else None
+        return self._transmit('set_wave_m',{'wavelength':[wavelength]},report='finished',report_timeout=timeout,
+                              job=job,cancel=self.abort_tune,on_report=on_report)
+
+    def _preposition(self,wavelength,job):
+        # Moves etalon/resonator to the cached settings nearest wavelength; returns the hit
+        # (or None). The hint is only a head start: if it fails it is discarded and the tune
+        # goes ahead without it. Jobs do not wait for the resonator, so the id comes back at once.
+        hit = self._tuning.lookup(wavelength)
+        if not hit:
+            return None
+        logger.debug('Pre-positioning for %g nm from cached %g nm: %s'%(wavelength,hit[0],hit[1]))
+        try:
+            self.set_etalon_val(hit[1]['etalon'])
+            self.set_resonator_val(hit[1]['resonator'],0 if job else self.prepositioned_timeout)
+        except Exception as err:
+            logger.warning('Pre-positioning from cached %g nm failed, tuning without it: %s'%(hit[0],err))
+            self._tuning.discard(hit[0])
+            return None
+        return hit
+
+    def _learn(self,wavelength,report,hit):
+        # Report of a cached set_wavelength: remember the settings, or forget a bad hint
+        try:
+            if report and report.get('report') == [0]:
+                status = self._transmit('get_status') # Not the poller's cache
+                self._tuning.store(wavelength,
+                                   100.0*status['etalon_voltage'][0]/PIEZO_FULL_SCALE,
+                                   100.0*status['resonator_voltage'][0]/PIEZO_FULL_SCALE)
+            elif hit:
+                self._tuning.discard(hit[0])
+        except:
+            logger.exception('Could not update the tuning cache for %g nm'%wavelength)
+
+    def scan(self,start,stop,points,control='resonator',settle=0,step_timeout=10):
+        # Steps control ("resonator" or "etalon", percent) from start to stop (inclusive) in
+        # points steps inside hwserver, reading the wavelength after each step (after
+        # settle seconds). Returns a job id at once; scan_data returns the results so far,
+        # job_cancel stops after the current step.
+        assert control in ['resonator','etalon'], 'control must be either "resonator" or "etalon"'
+        assert 0<=min(start,stop) and max(start,stop)<=100, 'Must be percent between [0,100]'
+        setpoints = np.linspace(start,stop,int(points))
+        job = self._new_job('scan',None,{'control':control,'start':start,'stop':stop,'points':int(points)},None,None)
+        job.data = {'setpoint':[],'wavelength':[],'time':[]}
+        threading.Thread(target=self._scan,args=(job,setpoints,control,settle,step_timeout),
+                         daemon=True,name='solstis scan').start()
+        return job.id
+
+    def _scan(self,job,setpoints,control,settle,step_timeout):
+        try:
+            for setpoint in setpoints:
+                if job.state != 'running':
+                    break
+                if control == 'resonator':
+                    self.set_resonator_val(float(setpoint),step_timeout)
+                else:
+                    self.set_etalon_val(float(setpoint))
+                if settle:
+                    time.sleep(settle)
+                wavelength = self._transmit('poll_wave_m')['current_wavelength'][0] # Not the poller's cache
+                with self._cond:
+                    job.data['time'].append(time.time())
+                    job.data['setpoint'].append(float(setpoint))
+                    job.data['wavelength'].append(wavelength)
+            state = 'finished'
+        except Exception as err:
+            logger.exception('Scan %i failed'%job.id)
+            job.report = {'error':str(err)}
+            state = 'failed'
+        with self._cond:
+            if job.state == 'running':
+                job.state = state
+            job.finished = time.time()
+            self._cond.notify_all()
+
+    def scan_data(self,job_id,since=0,encoding='list'):
+        # Results of scan job_id from point index since on (stream by passing the previous
+        # "next"). encoding: "list" or "base64" (little-endian float64 per array)
+        assert encoding in ['list','base64'], 'encoding must be "list" or "base64"'
+        with self._cond:
+            job = self._get_job(job_id)
+            assert job.data is not None, 'Job %s is not a scan'%job_id
+            data = {name:values[int(since):] for name,values in job.data.items()}
+            out = {'job':job.id,'state':job.check(),'since':int(since),'next':int(since)+len(data['time']),
+                   'encoding':encoding,'report':job.report}
+        for name,values in data.items():
+            if encoding == 'base64':
+                values = base64.b64encode(np.asarray(values,dtype='<f8').tobytes()).decode('ascii')
+            out[name] = values
+        return out
+
+    def tuning_cache_status(self):
+        # Hit/miss statistics of the set_wavelength tuning cache
+        return self._tuning.status()
+
+    def tuning_cache_clear(self):
+        self._tuning.clear()
         
     def lock_wavelength_to(self,wavelength,lock_status='on'):
     	##### NOTE: This might not work; msquared said this is for "developmental purposes" and might not be on newer firmware
@@ -406,6 +902,9 @@ class solstis(msquared):
         return response
 
     def get_wavelength(self):
+        polled = self._fresh_poll()
+        if polled:
+            return polled['wavelength']
         return self._transmit('poll_wave_m')
 
     def get_wavelength_range(self):
@@ -416,10 +915,10 @@ class solstis(msquared):
         assert (0<=percent and percent<=100), 'Must be percent between [0,100]'
         return self._transmit('tune_etalon',{'setting':[percent]})
 
-    def set_etalon_lock(self,status,timeout=60):
+    def set_etalon_lock(self,status,timeout=60,job=False):
         assert status in ['on','off'], 'Status must be either "on" or "off".'
-        if timeout:
-            return self._transmit('etalon_lock',{'operation':status},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('etalon_lock',{'operation':status},report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('etalon_lock',{'operation':status})
 
@@ -428,19 +927,111 @@ class solstis(msquared):
         assert response['status']==0, 'Operation Failed.'
         return response
 
-    def set_resonator_val(self,percent,timeout=60):
+    def set_resonator_val(self,percent,timeout=60,job=False):
         # Not sure how to get current percent val, but voltage val will be returned in status
         # Seems that you can only set percent and can only get voltage.
         assert (0<=percent and percent<=100), 'Must be percent between [0,100]'
-        if timeout:
-            return self._transmit('tune_resonator',{'setting':[percent]},report='finished',report_timeout=timeout)
+        if timeout or job:
+            return self._transmit('tune_resonator',{'setting':[percent]},report='finished',report_timeout=timeout,job=job)
         else:
             return self._transmit('tune_resonator',{'setting':[percent]})
 
     def status(self):
+        polled = self._fresh_poll()
+        if polled:
+            return polled['status']
         response = self._transmit('get_status')
         return response
 
+    def status_wavelength(self):
+        # get_status and poll_wave_m in one round trip
+        return self._transmit_many([('get_status',None),('poll_wave_m',None)])
+
+    def start_poller(self,rate=10):
+        # Refresh status and wavelength rate times per second in the background (one
+        # pipelined round trip each); status, get_wavelength and wait_change then read this
+        # cache, so controller traffic does not grow with the number of clients watching
+        self.stop_poller()
+        stop = threading.Event()
+        thread = threading.Thread(target=self._poll_loop,args=(float(rate),stop),daemon=True,name='solstis poller')
+        self._poll_once()  # Serve reads from the cache straight away (raises before anything is running)
+        self._poller = (thread,stop,float(rate))
+        thread.start()
+        return self.poller_status()
+
+    def stop_poller(self):
+        if self._poller:
+            (thread,stop,rate) = self._poller
+            self._poller = None
+            stop.set()
+            if thread.is_alive() and thread is not threading.current_thread():
+                thread.join()
+
+    def poller_status(self):
+        polled = self._polled
+        return {'running': bool(self._poller),
+                'rate': self._poller[2] if self._poller else None,
+                'age': time.time()-polled['time'] if polled else None,
+                'updates': polled['updates'] if polled else 0,
+                'last_error': self._poll_error}
+
+    def _fresh_poll(self):
+        # Last poll if the poller is running and it is under poll_max_age periods old, else
+        # None (reads then go to the controller, e.g. while polls keep failing)
+        (poller,polled) = (self._poller,self._polled)
+        if poller and polled and time.time()-polled['time'] <= self.poll_max_age/poller[2]:
+            return polled
+        return None
+
+    def _poll_once(self):
+        tstart = time.time()
+        (status,wavelength) = self.status_wavelength()
+        self._poll_error = None
+        with self._cond:
+            updates = self._polled['updates']+1 if self._polled else 1
+            self._polled = {'time':tstart,'status':status,'wavelength':wavelength,'updates':updates}
+            self._cond.notify_all()
+
+    def _poll_loop(self,rate,stop):
+        while not stop.is_set() and not self._closing:
+            tstart = time.time()
+            try:
+                self._poll_once()
+            except Exception as err:
+                self._poll_error = str(err)
+                logger.warning('solstis poll failed: %s'%err)
+            stop.wait(max(0,1.0/rate - (time.time()-tstart)))
+
+    def _polled_value(self,field):
+        # field of the cached get_status or poll_wave_m reply; [x] is unwrapped to x
+        for reply in ['wavelength','status']:
+            if field in self._polled[reply]:
+                value = self._polled[reply][field]
+                return value[0] if isinstance(value,list) and len(value) == 1 else value
+        raise KeyError('"%s" is not in get_status or poll_wave_m. Options: %s'%(field,
+            ', '.join(sorted(set(self._polled['status'])|set(self._polled['wavelength'])))))
+
+    def wait_change(self,field='current_wavelength',threshold=None,tolerance=0,timeout=10):
+        # Blocks until the polled field changes (by more than tolerance if numeric) or, with
+        # threshold, until it crosses threshold; needs start_poller. Returns the new value
+        # with "changed" False if timeout seconds pass first.
+        assert self._poller, 'Poller is not running; call start_poller first'
+        tend = time.time() + timeout
+        with self._cond:
+            initial = self._polled_value(field)
+            def changed(value):
+                if threshold is not None:
+                    return (value >= threshold) != (initial >= threshold)
+                if isinstance(value,(int,float)) and isinstance(initial,(int,float)):
+                    return abs(value-initial) > tolerance
+                return value != initial
+            while True:
+                value = self._polled_value(field)
+                if changed(value) or time.time() >= tend or not self._poller:
+                    return {'field':field,'changed':changed(value),'initial':initial,'value':value,
+                            'time':self._polled['time']}
+                self._cond.wait(min(0.1,max(0,tend-time.time())))
+
 
 if __name__=='__main__':
     logger.setLevel(logging.INFO)
@@ -0,0 +1,314 @@
+import argparse, json, logging, random, socket, threading, time
+
+logger = logging.getLogger(__name__)
+
+# Local stand-in for the ICE-BLOC controllers (solstis and EMM) speaking the same JSON
+# protocol over TCP, so msquared.py can run (and be benchmarked) without the lasers.
+#
+# from MSquared import msquared, simulator
+# sim = simulator.SimulatedICE(latency=1e-3,tune_time=0.5)
+# msquared.init('test',sim.address,sim.address)
+# with msquared.solstis() as s:
+#     s.set_wavelength(700)
+#
+# or as a process: python -m MSquared.simulator --port 39933
+#
+# SimulatedICE settings:
+#   wavelength -> initial wavelength (nm)
+#   latency -> seconds before every reply; latencies -> {op: seconds} overrides
+#   tune_time -> seconds before the final report ("<op>_f_r") of report operations
+#   errors -> {op: status} or {op: (status, probability)} replied instead of success
+#   drop -> {op: probability} of sending no reply at all
+#   fail_reports -> probability that a final report says the operation failed
+#   etalon_nm, resonator_nm -> wavelength change (nm) per percent of etalon/resonator
+
+REPORT_OPS = ['set_wave_m','move_wave_t','tune_resonator','etalon_lock',
+              'start_ppln','optimise_ppln','change_ppln','pba_reference','wavelength']
+
+class Laser:
+    # Shared state of the simulated laser; wavelength follows etalon/resonator settings
+    # once a tune completes
+    def __init__(self,wavelength=700.0,etalon_nm=0.02,resonator_nm=0.0005,noise=1e-5):
+        self.target = float(wavelength)
+        self.etalon = 50.0    # percent
+        self.resonator = 50.0 # percent
+        self.etalon_nm = etalon_nm
+        self.resonator_nm = resonator_nm
+        self.noise = noise
+        self.etalon_lock = 'off'
+        self.wave_lock = 'off'
+        self.emission = 'off'
+        self.tuning = None # Event set to abort the running tune
+
+    def wavelength(self):
+        return self.target + (self.etalon-50)*self.etalon_nm + (self.resonator-50)*self.resonator_nm \
+               + random.gauss(0,self.noise)
+
+    def tune(self,wavelength):
+        # Wavelength lock: settle at the target with etalon/resonator where they ended up
+        self.target = float(wavelength) - (self.etalon-50)*self.etalon_nm - (self.resonator-50)*self.resonator_nm
+
+class SimulatedICE:
+    # Accepts any number of clients; each connection is served on its own thread
+    def __init__(self,host='127.0.0.1',port=0,wavelength=700.0,latency=0,latencies=None,tune_time=0.5,
+                 errors=None,drop=None,fail_reports=0,etalon_nm=0.02,resonator_nm=0.0005):
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.tune_time = tune_time
+        self.errors = dict(errors or {})
+        self.drop = dict(drop or {})
+        self.fail_reports = fail_reports
+        self.laser = Laser(wavelength,etalon_nm,resonator_nm)
+        self.calls = {}
+        self._targets = {} # {transmission id: wavelength} of tunes awaiting their report
+        self._tid = None   # transmission id of the operation being handled
+        self._lock = threading.Lock()
+        self._server = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        self._server.bind((host,port))
+        self._server.listen(5)
+        self.address = self._server.getsockname()
+        self._clients = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._accept,daemon=True,name='M Squared simulator')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        self._server.close()
+        for conn in list(self._clients):
+            try: conn.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            conn.close()
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                (conn,addr) = self._server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            self._clients.append(conn)
+            threading.Thread(target=self._serve,args=(conn,),daemon=True,name='M Squared simulator client').start()
+
+    def _serve(self,conn):
+        decoder = json.JSONDecoder()
+        send_lock = threading.Lock()
+        def send(msg):
+            with send_lock:
+                conn.sendall(json.dumps(msg).encode('utf-8'))
+        buf = ''
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buf += data.decode('utf-8')
+                while buf.strip():
+                    buf = buf.lstrip()
+                    try:
+                        (msg,end) = decoder.raw_decode(buf)
+                    except ValueError:
+                        if not buf.startswith('{'):  # Not the start of a message: reject the buffer
+                            send(self._parse_fail(None,1,buf))
+                            buf = ''
+                        break  # Otherwise wait for the rest of the message
+                    buf = buf[end:]
+                    self._handle(msg,send)
+        except OSError:
+            pass
+        finally:
+            if conn in self._clients:
+                self._clients.remove(conn)
+            conn.close()
+
+    def _parse_fail(self,tid,code,text=None):
+        parameters = {'protocol_error':[code]}
+        if text is not None:
+            parameters['JSON_parse_error'] = text
+        message = {'op':'parse_fail','parameters':parameters}
+        if tid is not None:
+            message['transmission_id'] = tid
+        return {'message':message}
+
+    def _handle(self,msg,send):
+        # Protocol checks in the order of ParseError.ErrorCodes
+        if not isinstance(msg,dict) or 'message' not in msg:
+            return send(self._parse_fail(None,2))
+        message = msg['message']
+        if 'transmission_id' not in message:
+            return send(self._parse_fail(None,3))
+        tid = message['transmission_id']
+        if not tid:
+            return send(self._parse_fail(None,4))
+        if 'op' not in message:
+            return send(self._parse_fail(tid,5))
+        op = message['op']
+        if not op:
+            return send(self._parse_fail(tid,6))
+        handler = getattr(self,'op_'+op,None)
+        if handler is None:
+            return send(self._parse_fail(tid,7))
+        parameters = message.get('parameters',{})
+        with self._lock:
+            self.calls[op] = self.calls.get(op,0) + 1
+        latency = self.latencies.get(op,self.latency)
+        if latency:
+            time.sleep(latency)
+        if random.random() < self.drop.get(op,0):
+            return
+        error = self.errors.get(op)
+        if error is not None:
+            (status,probability) = error if isinstance(error,(tuple,list)) else (error,1)
+            if random.random() < probability:
+                return send({'message':{'transmission_id':tid,'op':op+'_reply','parameters':{'status':[status]}}})
+        try:
+            with self._lock:
+                self._tid = tid[0]
+                reply = handler(parameters)
+        except (KeyError,IndexError,TypeError,ValueError):
+            return send(self._parse_fail(tid,9))
+        send({'message':{'transmission_id':tid,'op':op+'_reply','parameters':reply}})
+        if op in REPORT_OPS and parameters.get('report'):
+            threading.Thread(target=self._report,args=(tid,op,send),daemon=True).start()
+
+    def _report(self,tid,op,send):
+        # Final report after tune_time; stop_wave_m/wavelength_stop abort a wavelength tune
+        abort = threading.Event()
+        if op in ['set_wave_m','wavelength']:
+            if self.laser.tuning:
+                self.laser.tuning.set()
+            self.laser.tuning = abort
+        aborted = abort.wait(self.tune_time)
+        with self._lock:
+            if self.laser.tuning is abort:
+                self.laser.tuning = None
+            failed = aborted or random.random() < self.fail_reports
+            if not failed and op in ['set_wave_m','wavelength','move_wave_t']:
+                self.laser.tune(self._targets.pop(tid[0],self.laser.target))
+        try:
+            send({'message':{'transmission_id':tid,'op':op+'_f_r','parameters':{'report':[1 if failed else 0]}}})
+        except OSError:
+            pass
+
+    # Operations (called holding self._lock, self._tid set): parameters -> reply parameters
+    def op_start_link(self,p):
+        return {'status':'ok','ip_address':p['ip_address']}
+
+    def op_get_status(self,p):
+        laser = self.laser
+        return {'status':[0],
+                'wavelength':[laser.wavelength()],
+                'temperature':[20.0],
+                'temperature_status':'on',
+                'etalon_lock':laser.etalon_lock,
+                'etalon_voltage':[laser.etalon*2.0],  # Percent of a 0-200 V drive
+                'cavity_lock':laser.wave_lock,
+                'resonator_voltage':[laser.resonator*2.0],
+                'output_monitor':[0.5]}
+
+    def op_poll_wave_m(self,p):
+        return {'status':[0],'current_wavelength':[self.laser.wavelength()],
+                'lock_status':[1 if self.laser.wave_lock == 'on' else 0],'extended_zone':[0]}
+
+    def op_get_wavelength_range(self,p):
+        return {'status':[0],'minimum_wavelength':[650.0],'maximum_wavelength':[1100.0],
+                'extended_zone':[0]}
+
+    def op_set_wave_m(self,p):
+        self._targets[self._tid] = float(p['wavelength'][0])
+        self.laser.wave_lock = 'on'
+        return {'status':[0],'wavelength':[p['wavelength'][0]]}
+
+    def op_move_wave_t(self,p):
+        self._targets[self._tid] = float(p['wavelength'][0])
+        return {'status':[0],'wavelength':[p['wavelength'][0]]}
+
+    def op_stop_wave_m(self,p):
+        self.laser.wave_lock = 'off'
+        if self.laser.tuning:
+            self.laser.tuning.set()
+        return {'status':[0]}
+
+    def op_lock_wave_m(self,p):
+        self.laser.wave_lock = p['operation']
+        return {'status':[0]}
+
+    def op_lock_wave_m_fixed(self,p):
+        self.laser.wave_lock = p['operation']
+        if p['operation'] == 'on':
+            self.laser.tune(p['lock_wavelength'][0])
+        return {'status':[0]}
+
+    def op_set_w_meter_channel(self,p):
+        return {'status':[0] if 0 <= p['channel'][0] <= 8 else [2]}
+
+    def op_tune_etalon(self,p):
+        self.laser.etalon = float(p['setting'][0])
+        return {'status':[0]}
+
+    def op_tune_resonator(self,p):
+        self.laser.resonator = float(p['setting'][0])
+        return {'status':[0]}
+
+    def op_etalon_lock(self,p):
+        self.laser.etalon_lock = p['operation']
+        return {'status':[0]}
+
+    def op_etalon_lock_status(self,p):
+        return {'status':0,'condition':self.laser.etalon_lock}
+
+    # EMM
+    def op_status(self,p):
+        return {'status':[0],'laser_emission':self.laser.emission,
+                'wavelength':[self.laser.wavelength()/2],'solstis':[1]}
+
+    def op_laser_control(self,p):
+        self.laser.emission = p['action']
+        return {'status':[0]}
+
+    def op_wavelength(self,p):
+        # EMM tunes the solstis to twice the (visible) target
+        scale = 2 if p.get('beam','visible') == 'visible' else 1
+        self._targets[self._tid] = float(p['target'][0])*scale
+        return {'status':[0]}
+
+    def op_wavelength_stop(self,p):
+        return self.op_stop_wave_m(p)
+
+    def op_start_ppln(self,p):
+        return {'status':[0]}
+
+    def op_optimise_ppln(self,p):
+        return {'status':[0]}
+
+    def op_change_ppln(self,p):
+        return {'status':[0]}
+
+    def op_pba_control(self,p):
+        return {'status':[0]}
+
+    def op_pba_reference(self,p):
+        return {'status':[0]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulated M Squared ICE-BLOC (solstis/EMM) JSON server.')
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=39933)
+    parser.add_argument('--latency',type=float,default=0,help='seconds before every reply')
+    parser.add_argument('--tune-time',type=float,default=0.5,help='seconds before final reports')
+    parser.add_argument('--wavelength',type=float,default=700.0,help='initial wavelength (nm)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sim = SimulatedICE(args.host,args.port,args.wavelength,args.latency,tune_time=args.tune_time)
+    logger.info('Listening on %s:%i'%sim.address)
+    try:
+        sim._thread.join()
+    except KeyboardInterrupt:
+        sim.close()
@@ -21,11 +21,11 @@ def wait_until_ready(socket):
 
 def send_task_request (socket, task_name):       
         msg = {'message_type':'task_request','task':[task_name]}
-        socket.send(json.dumps(msg).replace(' ',''))
+        socket.send(json.dumps(msg,separators=(',',':')))
 
 def send_page_update (socket, msg):
         msg['message_type'] = 'page_update'
-        socket.send(json.dumps(msg).replace(' ',''))
+        socket.send(json.dumps(msg,separators=(',',':')))
 
 def set_remote_ip(IP):
     socket = websocket.create_connection(URL)
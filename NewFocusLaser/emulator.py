@@ -0,0 +1,141 @@
+import argparse, logging, time
+from serial_emulator import PTYEmulator
+
+logger = logging.getLogger(__name__)
+
+# New Focus Velocity 6700 behind a Prologix GPIB-USB controller on a pty.
+#
+# from NewFocusLaser import emulator, Laser
+# with emulator.NewFocusEmulator(tune_time=0.5) as emu:
+#     with Laser.laser(port=emu.port) as l:
+#         l.setWavelength(637.5)
+#
+# or as a process: python -m NewFocusLaser.emulator
+#
+# Lines starting with ++ go to the Prologix: "++read eoi" returns the instrument's reply
+# to the last query, other ++ commands are accepted silently. Everything else is SCPI for
+# the laser (case insensitive); unknown commands are counted and get no reply.
+# NewFocusEmulator settings (besides latency/baudrate, see serial_emulator):
+#   wavelength -> initial wavelength (nm)
+#   tune_time -> seconds a :SOURCE:WAVELENGTH move takes (*OPC? reads 0 meanwhile)
+
+class NewFocusEmulator(PTYEmulator):
+    name = 'New Focus'
+
+    def __init__(self,latency=0,baudrate=None,wavelength=637.0,tune_time=0):
+        self.tune_time = tune_time
+        self.wavelength = float(wavelength)
+        self.tune = (self.wavelength,self.wavelength,0)  # from, to, end time
+        self.diode = False
+        self.piezo = 50.0
+        self.power = 10.0
+        self.track = 'OFF'
+        self.cpower = 'OFF'
+        self.errors = 0
+        self._response = None
+        self._buffer = b''
+        super().__init__(latency,baudrate)
+
+    def received(self,data):
+        self._buffer += data
+        while b'\n' in self._buffer:
+            (line,self._buffer) = self._buffer.split(b'\n',1)
+            line = line.strip().decode('ascii','replace')
+            if line:
+                self._line(line)
+
+    def _line(self,line):
+        if line.startswith('++'):
+            self.count(line)
+            if line.split()[0] == '++read':
+                if self._response is not None:
+                    self.reply(self._response.encode()+b'\n')
+                    self._response = None
+            return
+        parts = line.split(None,1)
+        command = parts[0].upper()
+        arg = parts[1] if len(parts) > 1 else None
+        handler = self.commands.get(command)
+        self.count(command)
+        if handler is None:
+            self.errors += 1
+            logger.debug('New Focus emulator does not know %r'%line)
+            return
+        response = handler(self,arg)
+        if response is not None:
+            self._response = response
+
+    def _current_wavelength(self):
+        (start,stop,end) = self.tune
+        remaining = end - time.time()
+        if remaining <= 0 or not self.tune_time:
+            return stop
+        return stop + (start-stop)*remaining/self.tune_time
+
+    # SCPI commands: fn(self, argument or None) -> reply or None
+    def idn(self,arg):
+        return 'NewFocus 6700 emulator,SN0,v1.0'
+
+    def opc(self,arg):
+        return '1' if time.time() >= self.tune[2] else '0'
+
+    def output(self,arg):
+        if arg is None:
+            return '1' if self.diode else '0'
+        self.diode = arg.upper() == 'ON'
+        return 'OK'
+
+    def piezo_level(self,arg):
+        if arg is None:
+            return '%.2f'%self.piezo
+        self.piezo = float(arg)
+
+    def sense_wavelength(self,arg):
+        return '%.3f'%self._current_wavelength()
+
+    def sense_power(self,arg):
+        return '%.3f'%(self.power if self.diode else 0.0)
+
+    def power_level(self,arg):
+        self.power = float(arg)
+
+    def set_track(self,arg):
+        self.track = arg.upper()
+
+    def set_cpower(self,arg):
+        self.cpower = arg.upper()
+
+    def set_wavelength(self,arg):
+        self.tune = (self._current_wavelength(),float(arg),time.time()+self.tune_time)
+        return 'OK'
+
+    commands = {
+        '*IDN?': idn,
+        '*OPC?': opc,
+        ':OUTP?': output,
+        ':OUTPUT:STATE': output,
+        ':SOURCE:VOLTAGE:LEVEL:PIEZO?': piezo_level,
+        ':SOURCE:VOLTAGE:LEVEL:PIEZO': piezo_level,
+        ':SENSE:WAVELENGTH?': sense_wavelength,
+        ':SENSE:POWER:LEVEL:FRONT': sense_power,
+        ':SENSE:POWER:LEVEL:FRONT?': sense_power,
+        ':SOURCE:POWER:LEVEL': power_level,
+        ':OUTPUT:TRACK': set_track,
+        ':SOURCE:CPOWER': set_cpower,
+        ':SOURCE:WAVELENGTH': set_wavelength,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='New Focus laser (via Prologix) emulator on a pseudo-terminal.')
+    parser.add_argument('--latency',type=float,default=0,help='seconds before every reply')
+    parser.add_argument('--baudrate',type=int,default=0,help='reply pacing (0: none)')
+    parser.add_argument('--tune-time',type=float,default=1.0,help='seconds per wavelength move')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with NewFocusEmulator(args.latency,args.baudrate or None,tune_time=args.tune_time) as emu:
+        logger.info('New Focus emulator on %s'%emu.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
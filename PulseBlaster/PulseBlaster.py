@@ -1,233 +1,531 @@
-import os, logging, fnmatch
-from subprocess import check_output
-logger = logging.getLogger(__name__)
-
-# PulseBlaster boards from SpinCore stream digital pulses on many RF channels.
-# TODO: Add more documentation, make client robust to crashes by stashing in file
-
-def find_files(directory, pattern):
-    '''Recursively go through directory to find pattern'''
-
-    for root, _, files in os.walk(directory):
-        for basename in files:
-            if fnmatch.fnmatch(basename, pattern):
-                filename = os.path.join(root, basename)
-                yield filename
-
-def decode(message):
-    return message.decode("utf-8").strip()
-
-class PulseBlaster:
-    numlines = 21           # This is true for PulseBlasterESR-PRO boards, but not necessary for others
-    pathSpinCore = os.path.join('C:', os.sep, 'SpinCore')
-    program = ''            # Currently-loaded program.
-    defaultClock = 500      # MHz
-    static = False          # Whether the board is not currently running a program and is in the staticlines idle state.
-    client = None           # Allow client to exclusively request access
-
-    def __init__(self):
-        logger.debug("Initializing PulseBlaster!")
-
-        # Find where the PulseBlaster executable is.
-        self.pathEXE = ''
-        try:
-            potentialFiles = [fname for fname in find_files(self.pathSpinCore,'spbicl.exe')]
-            if len(potentialFiles) == 1:
-                logger.debug("Found SpinCore's spbicl.exe at:\n    " + potentialFiles[0])
-            elif len(potentialFiles) > 1:
-                logger.warning("Found multiple candidates for SpinCore's spbicl.exe, choosing the first:\n    " + str(potentialFiles))
-
-            self.pathEXE = potentialFiles[0]
-        except:
-            pass
-
-        if not self.pathEXE:
-            raise RuntimeError("Could not find SpinCore's spbicl.exe. Are you sure that you installed SpinCore?")
-
-        # Choose a location for PulseBlaster .pb program files to be stored.
-        self.pathProgram = os.path.join(self.pathSpinCore,'temp.pb')
-        logger.debug("Program files (.pb) will be stored at:\n    " + self.pathProgram)
-
-        # Make a list to keep track of the lines of the PulseBlaster when in StaticLines mode.
-        self.lines = [False] * self.numlines
-        logger.debug("Lines initialized to " + self._linesStr())
-
-        # Start the staticlines idle state (this will overwrite any program from a previous session; change?).
-        self._loadStaticLines()
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        return  # Do not change current state.
-
-    def _linesStr(self):
-        '''Returns string format for the interpreter to understand'''
-
-        return '0b ' + ''.join(['1' if v else '0' for v in reversed(self.lines)])   # Line order reversed due to interpreter little endian convention.
-
-    def _loadStaticLines(self, lines=None):
-        '''Load staticlines program using lines specified in input.
-
-        If lines are None, the last programmed lines are reloaded.
-        If lines are unchanged to currently running set, no action is taken.
-        '''
-
-        logger.debug("Loading StaticLines")
-
-        abortset = False
-
-        if lines:   # If not None, something was passed
-            assert(len(lines) == self.numlines)
-
-            abortset = True     # By default, assume that lines == self.lines, and plan to not do anything.
-            for ii in range(len(self.lines)):
-                if self.lines[ii] != bool(lines[ii]):   # If at least one line is changed, then decide to do something (don't abort the set).
-                    self.lines[ii] = bool(lines[ii])
-                    abortset = False
-
-            if not abortset:
-                self.lines = lines
-
-        if not abortset:
-            program = 'START: '  + self._linesStr() + ', 100 ms\n' \
-                                 + self._linesStr() + ', 100 ms, BRANCH, START'    # Branch acts like GOTO in C or assembly. i.e. go back to start. Do not pass jail.
-            self._load(program, None, True, True)
-            self.static = True
-
-        return self.lines
-
-    def _com(self, command):
-        '''Helper function to communicate with the executable.'''
-
-        logger.debug("Sending command: " + str(command))
-        return decode(check_output([self.pathEXE] + command, shell=True))
-
-    def _load(self, program, clock=None, startImmediately=False, isStaticLines=False):
-        '''Load a text program onto the board via a temp file.'''
-
-        logger.debug("Loading program:\n" + program)
-
-        if not clock:
-            clock = self.defaultClock
-
-        self.program = program
-
-        with open(self.pathProgram,'w') as f:  # This will overwrite an existing file
-            f.write(self.program)
-
-        try:
-            out = self._com(['load', self.pathProgram, str(clock)])
-            logger.debug(out)
-            if startImmediately:
-                self.start()
-            return out
-        except:
-            if not isStaticLines:
-                self._loadStaticLines()
-            raise
-
-    def _validate(self):
-        '''validate a request in case another client has requested full access.'''
-
-        if self.client and self._ModuleServer_Client[1][0] != self.client:
-            raise RuntimeError('Another client has requested exclusive access: ' + self.client)
-
-    ## Access Control methods (will only work when loaded by ModuleServer)
-
-    def checkout(self):
-        '''Request exclusive access to device.'''
-
-        self._validate()
-        self.client = self._ModuleServer_Client[1][0] # IP address
-
-    def checkin(self):
-        '''Return general access to other clients.'''
-
-        self._validate()
-        self.client = None
-
-    def force_reset_client(self):
-        '''Force the client to reset. This could interrupt someone's experiment. Be careful.'''
-
-        logger.warning('Client %s forced client %s off.'%(self._ModuleServer_Client[1][0], self.client))
-        self.client = None
-
-    ## Set methods
-
-    def start(self):
-        '''Starts the PulseBlaster.'''
-
-        self._validate()
-        out = self._com(['start'])
-        logger.debug(out)
-        return out
-
-    def stop(self):
-        '''Stop the PulseBlaster.'''
-
-        self._validate()
-        out = self._com(['stop'])
-        logger.debug(out)
-        return out
-
-    def load(self, program, clock=None):
-        '''Load a text program onto the PulseBlaster.'''
-
-        self._validate()
-        logger.info('Loading new program to pulseblaster!')
-        self.static = False
-        return self._load(program, clock)
-
-    def setAllLines(self, lines):
-        '''Sets the output to the values of the boolean array `lines` which must have dimension 1x21.'''
-
-        self._validate()
-        return self._loadStaticLines(lines)
-
-    def setLines(self, indices=None, values=None):
-        '''Sets the output of the (1-indexed) `indices` to the boolean state of `values`.'''
-
-        self._validate()
-        if indices is not None and values is not None:
-            if not isinstance(indices, list):
-                indices = [indices]
-            if not isinstance(values, list):
-                values = [values] * len(indices)
-
-            assert len(indices) == len(values)
-            assert max(indices) <= self.numlines and min(indices) > 0, \
-                "Line indices must integers between 1 and " + str(self.numlines) + ". Was given " + str(self.lines)
-
-            newlines = self.lines.copy()
-
-            for (i,v) in zip(indices, values):
-                newlines[i-1] = bool(v)
-
-            return self._loadStaticLines(newlines)
-        else:   # Refresh staticlines state.
-            return self._loadStaticLines()
-
-    ## Get methods (no need to validate)
-
-    def isStatic(self):
-        '''Whether the board is not currently running a program and is in the staticLines idle state.'''
-
-        return self.static
-
-    def getProgram(self):
-        '''Returns the currently-loaded program.'''
-
-        return self.program
-
-    def getLines(self):
-        '''Returns the current state of staticLines. If a user program is running, then the state of the lines is unknown (NaN/None returned).'''
-
-        if self.static:
-            return self.lines
-        else:
-            return [None] * self.numlines
-
-if __name__=='__main__':
-    with PulseBlaster() as pb:
-        print("TODO: Add tests.")
+import os, time, logging, fnmatch, threading
+from PulseBlaster.backends import SpbiclBackend, SpinAPIBackend
+from PulseBlaster import program as pbprogram
+logger = logging.getLogger(__name__)
+
+# PulseBlaster boards from SpinCore stream digital pulses on many RF channels.
+# TODO: Add more documentation, make client robust to crashes by stashing in file
+
+def find_files(directory, pattern):
+    '''Recursively go through directory to find pattern'''
+
+    for root, _, files in os.walk(directory):
+        for basename in files:
+            if fnmatch.fnmatch(basename, pattern):
+                filename = os.path.join(root, basename)
+                yield filename
+
+class PulseBlaster:
+    numlines = 21           # This is true for PulseBlasterESR-PRO boards, but not necessary for others
+    pathSpinCore = os.path.join('C:', os.sep, 'SpinCore')
+    program = ''            # Currently-loaded program.
+    table = None            # Currently-loaded compiled sequence (see loadSequence), if any.
+    defaultClock = 500      # MHz
+    static = False          # Whether the board is not currently running a program and is in the staticlines idle state.
+    client = None           # Allow client to exclusively request access
+    backend = 'auto'        # 'spinapi' (in-process), 'spbicl' (spbicl.exe per call) or 'auto' (spinapi if its library is found)
+    pathLibrary = None      # SpinAPI library; searched for in pathSpinCore if None
+    libraryNames = ['spinapi64.dll', 'spinapi.dll', 'libspinapi.so']
+    cacheSize = 32          # Compiled programs kept for reloading without recompiling
+    maxInstructions = 4096  # Instruction memory (PulseBlasterESR-PRO: 4k words)
+    coalesceWindow = 0      # Seconds to gather setLines changes into one board update (0: update on every call)
+    staged = None           # Program prepared by stage/stageSequence for commit
+
+    def __init__(self):
+        logger.debug("Initializing PulseBlaster!")
+
+        if self.backend in ['auto', 'spinapi']:
+            pathLibrary = self.pathLibrary
+            for name in self.libraryNames:
+                if pathLibrary:
+                    break
+                pathLibrary = self._find(name)
+            if pathLibrary:
+                self.driver = SpinAPIBackend(pathLibrary)
+            elif self.backend == 'spinapi':
+                raise RuntimeError("Could not find SpinCore's spinapi library. Are you sure that you installed SpinAPI?")
+        if self.backend == 'spbicl' or (self.backend == 'auto' and not pathLibrary):
+            # Find where the PulseBlaster executable is.
+            self.pathEXE = self._find('spbicl.exe')
+            if not self.pathEXE:
+                raise RuntimeError("Could not find SpinCore's spbicl.exe. Are you sure that you installed SpinCore?")
+
+            # Choose a location for PulseBlaster .pb program files to be stored.
+            self.pathProgram = os.path.join(self.pathSpinCore,'temp.pb')
+            self.driver = SpbiclBackend(self.pathEXE, self.pathProgram)
+        if not hasattr(self, 'driver'):
+            raise RuntimeError('Unknown PulseBlaster backend "%s". Options: auto, spinapi, spbicl'%self.backend)
+        logger.debug("Using the %s backend"%self.driver.name)
+
+        # Compiled programs by content hash; loadedKey identifies the program on the board.
+        self.cache = pbprogram.ProgramCache(self.cacheSize)
+        self.loadedKey = None
+        self.swapStats = {'swaps': 0, 'last': None, 'mean': None, 'max': None}  # commit dead time (s)
+
+        # Static line state as bitmasks (bit i = line i+1): mask is on the board, pendingMask is
+        # requested but not yet loaded (coalescing window or open transaction), None if nothing is.
+        self.mask = 0
+        self.pendingMask = None
+        self.transaction = False
+        self._timer = None
+        self._flushError = None
+        self._lock = threading.RLock()  # Board access (the coalescing timer flushes from its own thread)
+        logger.debug("Lines initialized to " + self._linesStr(self.mask))
+
+        # Start the staticlines idle state (this will overwrite any program from a previous session; change?).
+        self._loadStaticLines()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.driver.close()  # Releases the driver only; the current program keeps running.
+
+    def _find(self, name):
+        '''Path of SpinCore's `name` under pathSpinCore, or '' if not found.'''
+
+        try:
+            potentialFiles = [fname for fname in find_files(self.pathSpinCore,name)]
+            if len(potentialFiles) == 1:
+                logger.debug("Found SpinCore's " + name + " at:\n    " + potentialFiles[0])
+            elif len(potentialFiles) > 1:
+                logger.warning("Found multiple candidates for SpinCore's " + name + ", choosing the first:\n    " + str(potentialFiles))
+
+            return potentialFiles[0]
+        except:
+            return ''
+
+    def _linesStr(self, mask):
+        '''Returns string format for the interpreter to understand'''
+
+        return '0b ' + format(mask, '0%ib'%self.numlines)   # Highest line first due to interpreter little endian convention.
+
+    def _toMask(self, lines):
+        '''Bitmask of a list of numlines booleans (or a bitmask).'''
+
+        if isinstance(lines, int) and not isinstance(lines, bool):
+            assert 0 <= lines < 1 << self.numlines, "Line mask must be between 0 and " + str((1 << self.numlines) - 1)
+            return lines
+        assert(len(lines) == self.numlines)
+        return sum(1 << i for (i,v) in enumerate(lines) if v)
+
+    def _toLines(self, mask):
+        return [bool(mask >> i & 1) for i in range(self.numlines)]
+
+    def _loadStaticLines(self, mask=None):
+        '''Load staticlines program with the lines of bitmask `mask`.
+
+        If mask is None, the last programmed lines are reloaded.
+        If the board is already showing these static lines, no action is taken.
+        '''
+
+        with self._lock:
+            if mask is None:
+                mask = self.mask
+            elif mask == self.mask and self.static:
+                return self._toLines(self.mask)
+
+            logger.debug("Loading StaticLines " + self._linesStr(mask))
+            program = 'START: '  + self._linesStr(mask) + ', 100 ms\n' \
+                                 + self._linesStr(mask) + ', 100 ms, BRANCH, START'    # Branch acts like GOTO in C or assembly. i.e. go back to start. Do not pass jail.
+            self._load(program, None, True, True)
+            self.mask = mask
+            self.static = True
+
+            return self._toLines(self.mask)
+
+    def _requestLines(self, mask):
+        '''Load `mask` now, or leave it pending for the coalescing window / open transaction.
+
+        Returns the requested lines; getLines() shows them once they are on the board.
+        '''
+
+        with self._lock:
+            if self._flushError:
+                error = self._flushError
+                self._flushError = None
+                raise RuntimeError('Previous coalesced line update failed (pending changes dropped): ' + error)
+            self.pendingMask = mask
+            if self.transaction:
+                return self._toLines(mask)
+            if not self.coalesceWindow:
+                return self._flush()
+            if self._timer is None:
+                self._timer = threading.Timer(self.coalesceWindow, self._flushTimer)
+                self._timer.daemon = True
+                self._timer.start()
+            return self._toLines(mask)
+
+    def _flushTimer(self):
+        try:
+            self._flush()  # No _validate: the timer thread has no current client
+        except Exception as err:
+            logger.exception('Coalesced line update failed')
+            self._flushError = str(err)
+
+    def _dropPending(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self.pendingMask = None
+
+    def _load(self, program, clock=None, startImmediately=False, isStaticLines=False, table=None):
+        '''Load a text program (or a compiled sequence `table`, with program None) onto the board through the backend.'''
+
+        if not clock:
+            clock = self.defaultClock
+
+        self.program = program
+        self.table = table  # getProgram formats it on demand
+
+        if table is None:
+            logger.debug("Loading program:\n" + program)
+        else:
+            logger.debug("Loading compiled sequence of %i instructions"%len(table))
+        (key, compile) = self._compiler(program, clock, table)
+        if key == self.loadedKey:   # The board already holds this program; only (re)start if asked.
+            self.cache.stats['skipped'] += 1
+            if startImmediately:
+                self._start()
+            return 'Program already loaded'
+        self.loadedKey = None
+
+        try:
+            compiled = self.cache.get(key, compile)
+            out = self.driver.program(compiled, clock)
+            self.loadedKey = key
+            logger.debug(out)
+            if startImmediately:
+                self._start()
+            return out
+        except:
+            if not isStaticLines:
+                self._loadStaticLines()
+            raise
+
+    def _compiler(self, program, clock, table=None):
+        '''Cache key and compile function of a text program (or a compiled sequence `table`).'''
+
+        if table is None:
+            return (pbprogram.key(program, clock), lambda: self.driver.compile(program))
+        else:
+            return (pbprogram.key(table, clock), lambda: self.driver.compileTable(table))
+
+    def _stage(self, program, clock, table, info):
+        '''Compile, validate and prepare the next program while the current one keeps running.'''
+
+        tstart = time.perf_counter()
+        if table is None:   # Validate text here: spbicl.exe would only complain during the swap.
+            try:
+                instructions = pbprogram.parse(program)
+            except pbprogram.ProgramError as err:
+                if self.driver.name != 'spbicl':
+                    raise
+                # spbicl.exe reads more than program.parse does (e.g. other opcodes); let it judge.
+                logger.warning('Staging a program program.parse rejects; spbicl.exe checks it at commit: %s'%err)
+                instructions = None
+            info['instructions'] = None if instructions is None else len(instructions)
+            short = [ii for (ii,inst) in enumerate(instructions or []) if inst[3] < 5e3/clock]
+            if short:
+                raise pbprogram.ProgramError('Instructions %s are shorter than 5 clock cycles at %g MHz.'%(short, clock))
+        if (info['instructions'] or 0) > self.maxInstructions:
+            raise RuntimeError('Program has %i instructions; the board holds %i.'%(info['instructions'], self.maxInstructions))
+        (key, compile) = self._compiler(program, clock, table)
+        prepared = self.driver.prepare(self.cache.get(key, compile), clock)
+        info['stage'] = time.perf_counter() - tstart
+        with self._lock:
+            self.staged = {'key': key, 'prepared': prepared, 'program': program, 'table': table, 'clock': clock, 'info': info}
+        logger.debug('Staged %s instructions in %.3g s'%(info['instructions'], info['stage']))
+        return info
+
+    def _start(self):
+        '''Start the board without access control (callers validate).'''
+
+        with self._lock:
+            out = self.driver.start()
+        logger.debug(out)
+        return out
+
+    def _flush(self):
+        '''Load pending static line changes without access control (callers validate).'''
+
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self.pendingMask is None:
+                return self.getLines()
+            mask = self.pendingMask
+            self.pendingMask = None
+            return self._loadStaticLines(mask)
+
+    def _validate(self):
+        '''validate a request in case another client has requested full access.'''
+
+        if self.client and self._ModuleServer_Client[1][0] != self.client:
+            raise RuntimeError('Another client has requested exclusive access: ' + self.client)
+
+    ## Access Control methods (will only work when loaded by ModuleServer)
+
+    def checkout(self):
+        '''Request exclusive access to device.'''
+
+        self._validate()
+        self.client = self._ModuleServer_Client[1][0] # IP address
+
+    def checkin(self):
+        '''Return general access to other clients.'''
+
+        self._validate()
+        self.client = None
+
+    def force_reset_client(self):
+        '''Force the client to reset. This could interrupt someone's experiment. Be careful.'''
+
+        logger.warning('Client %s forced client %s off.'%(self._ModuleServer_Client[1][0], self.client))
+        self.client = None
+
+    ## Set methods
+
+    def start(self):
+        '''Starts the PulseBlaster.'''
+
+        self._validate()
+        return self._start()
+
+    def stop(self):
+        '''Stop the PulseBlaster.'''
+
+        self._validate()
+        with self._lock:
+            out = self.driver.stop()
+        logger.debug(out)
+        return out
+
+    def load(self, program, clock=None):
+        '''Load a text program onto the PulseBlaster. Pending static line changes are dropped.'''
+
+        self._validate()
+        logger.info('Loading new program to pulseblaster!')
+        with self._lock:
+            self._dropPending()
+            self.static = False
+            return self._load(program, clock)
+
+    def loadSequence(self, sequence, duration=None, clock=None, units='ns', repeat=False, start=False):
+        '''Compile and load a pulse sequence.
+
+        `sequence` maps (1-indexed) lines to either a list of edge times (each edge toggles the
+        line, which starts low) or a list of [on, off] intervals, in `units` (ns, us, ms or s).
+        `duration` is the total length (default: the last edge). With `repeat` the sequence
+        branches back to the start; otherwise it stops holding the final state. Start it with
+        start() or `start`=True. Returns compile statistics.
+        '''
+
+        self._validate()
+        if not clock:
+            clock = self.defaultClock
+        (table, info) = pbprogram.compile_sequence(sequence, duration, clock, units, repeat, self.numlines)
+        if len(table) > self.maxInstructions:
+            raise RuntimeError('Sequence compiles to %i instructions; the board holds %i.'%(len(table), self.maxInstructions))
+        logger.info('Loading compiled sequence to pulseblaster!')
+        with self._lock:
+            self._dropPending()
+            self.static = False
+            info['out'] = self._load(None, clock, start, table=table)
+        return info
+
+    def stage(self, program, clock=None):
+        '''Compile, validate and prepare a text program without touching the running one.
+
+        commit() then swaps it in. Staging again replaces the staged program. Returns
+        {'instructions', 'stage' (seconds spent staging)}. With the spbicl backend, text the
+        parser does not understand is staged as is ('instructions' None) for spbicl.exe to check.
+        '''
+
+        self._validate()
+        return self._stage(program, clock or self.defaultClock, None, {})
+
+    def stageSequence(self, sequence, duration=None, clock=None, units='ns', repeat=False):
+        '''Like stage for a pulse sequence (see loadSequence). Returns compile statistics.'''
+
+        self._validate()
+        if not clock:
+            clock = self.defaultClock
+        (table, info) = pbprogram.compile_sequence(sequence, duration, clock, units, repeat, self.numlines)
+        return self._stage(None, clock, table, info)
+
+    def commit(self, start=True):
+        '''Swap the staged program onto the board and start it (unless `start` is False).
+
+        The board is stopped, programmed and restarted in one backend call; the outputs are
+        undefined for the returned 'gap' (seconds, an upper bound on the dead time). Pending
+        static line changes are dropped.
+        '''
+
+        self._validate()
+        with self._lock:
+            if self.staged is None:
+                raise RuntimeError('No program staged; call stage or stageSequence first.')
+            staged = self.staged
+            self.staged = None
+            self._dropPending()
+            self.static = False
+            self.program = staged['program']
+            self.table = staged['table']
+            if staged['key'] == self.loadedKey:    # Already on the board; only (re)start if asked.
+                self.cache.stats['skipped'] += 1
+                tstart = time.perf_counter()
+                out = self.driver.start() if start else 'Program already loaded'
+            else:
+                self.loadedKey = None
+                tstart = time.perf_counter()
+                try:
+                    out = self.driver.swap(staged['prepared'], staged['clock'], start)
+                except:
+                    self._loadStaticLines()
+                    raise
+                self.loadedKey = staged['key']
+            gap = time.perf_counter() - tstart
+
+            stats = self.swapStats
+            stats['swaps'] += 1
+            stats['mean'] = gap if stats['mean'] is None else stats['mean'] + (gap - stats['mean'])/stats['swaps']
+            stats['max'] = gap if stats['max'] is None else max(stats['max'], gap)
+            stats['last'] = gap
+        logger.info('Committed staged program (%.3g ms dead time)'%(gap*1e3))
+        logger.debug(out)
+        return {'gap': gap, 'instructions': staged['info']['instructions'], 'out': out}
+
+    def discardStaged(self):
+        '''Drop the staged program.'''
+
+        self._validate()
+        with self._lock:
+            self.staged = None
+
+    def setAllLines(self, lines):
+        '''Sets the output to the values of the boolean array `lines` which must have dimension 1x21 (or to the bitmask `lines`, bit 0 = line 1).'''
+
+        self._validate()
+        return self._requestLines(self._toMask(lines))
+
+    def setLines(self, indices=None, values=None):
+        '''Sets the output of the (1-indexed) `indices` to the boolean state of `values`.
+
+        Changes are applied immediately unless a coalescing window is set (setCoalesceWindow) or a
+        transaction is open (beginLines); then they are merged into one board update and the
+        requested lines are returned.
+        '''
+
+        self._validate()
+        if indices is not None and values is not None:
+            if not isinstance(indices, list):
+                indices = [indices]
+            if not isinstance(values, list):
+                values = [values] * len(indices)
+
+            assert len(indices) == len(values)
+            assert max(indices) <= self.numlines and min(indices) > 0, \
+                "Line indices must integers between 1 and " + str(self.numlines) + ". Was given " + str(indices)
+
+            with self._lock:
+                mask = self.mask if self.pendingMask is None else self.pendingMask
+                for (i,v) in zip(indices, values):
+                    if v:
+                        mask |= 1 << (i-1)
+                    else:
+                        mask &= ~(1 << (i-1))
+
+                return self._requestLines(mask)
+        else:   # Refresh staticlines state.
+            with self._lock:
+                if self.pendingMask is not None:
+                    return self._flush()
+                return self._loadStaticLines()
+
+    def setCoalesceWindow(self, seconds):
+        '''setLines/setAllLines changes within `seconds` of the first are loaded as one update (0: load every change).'''
+
+        self._validate()
+        self.coalesceWindow = max(0, float(seconds))
+        if not self.coalesceWindow and not self.transaction:
+            self._flush()
+        return self.coalesceWindow
+
+    def flushLines(self):
+        '''Loads pending static line changes now. Returns the lines.'''
+
+        self._validate()
+        return self._flush()
+
+    def beginLines(self):
+        '''Open a transaction: setLines/setAllLines changes are held until commitLines.'''
+
+        self._validate()
+        with self._lock:
+            self.transaction = True
+
+    def commitLines(self):
+        '''Close the transaction and load its line changes as one update. Returns the lines.'''
+
+        self._validate()
+        with self._lock:
+            self.transaction = False
+            return self._flush()
+
+    def abortLines(self):
+        '''Close the transaction, discarding its (and any other pending) line changes.'''
+
+        self._validate()
+        with self._lock:
+            self.transaction = False
+            self._dropPending()
+            return self.getLines()
+
+    ## Get methods (no need to validate)
+
+    def isStatic(self):
+        '''Whether the board is not currently running a program and is in the staticLines idle state.'''
+
+        return self.static
+
+    def getProgram(self):
+        '''Returns the currently-loaded program.'''
+
+        if self.program is None and self.table is not None:
+            self.program = pbprogram.format(pbprogram.instructions(self.table))
+        return self.program
+
+    def getStaged(self):
+        '''Staging statistics of the staged program, or None if nothing is staged.'''
+
+        return None if self.staged is None else self.staged['info']
+
+    def getSwapStats(self):
+        '''Dead time (seconds) of commit: number of swaps, last, mean and max.'''
+
+        return dict(self.swapStats)
+
+    def getCacheStats(self):
+        '''Program cache counters: hits/misses (compiled program reused or not), skipped (identical reloads not sent to the board), evictions.'''
+
+        return self.cache.status()
+
+    def getLines(self, pending=False):
+        '''Returns the current state of staticLines. If a user program is running, then the state of the lines is unknown (NaN/None returned).
+
+        With `pending`, returns the lines as requested, including changes not yet loaded.
+        '''
+
+        if pending and self.pendingMask is not None:
+            return self._toLines(self.pendingMask)
+        if self.static:
+            return self._toLines(self.mask)
+        else:
+            return [None] * self.numlines
+
+if __name__=='__main__':
+    with PulseBlaster() as pb:
+        print("TODO: Add tests.")
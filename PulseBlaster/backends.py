@@ -0,0 +1,166 @@
+import ctypes, logging, os
+from subprocess import check_output
+from PulseBlaster import program as pbprogram
+logger = logging.getLogger(__name__)
+
+# Ways of getting a program onto the board. Each backend implements
+#   compile(program text) -> compiled program (what program() takes; cached by PulseBlaster)
+#   compileTable(program.compile_sequence table) -> compiled program
+#   program(compiled, clock MHz) -> str, load(program text, clock MHz) -> str
+#   start() -> str, stop() -> str, close()
+#   prepare(compiled, clock MHz) -> prepared program (off the board, while another one runs)
+#   swap(prepared, clock MHz, start) -> str: stop, program and (re)start with as little in between as possible
+# SpinAPIBackend programs the board in-process through SpinCore's spinapi library;
+# SpbiclBackend drives spbicl.exe through a temporary .pb file (one process per call).
+
+def decode(message):
+    return message.decode("utf-8").strip()
+
+class SpbiclBackend:
+    name = 'spbicl'
+
+    def __init__(self, pathEXE, pathProgram):
+        self.pathEXE = pathEXE
+        self.pathProgram = pathProgram
+        logger.debug("Program files (.pb) will be stored at:\n    " + self.pathProgram)
+
+    def _com(self, command):
+        '''Helper function to communicate with the executable.'''
+
+        logger.debug("Sending command: " + str(command))
+        return decode(check_output([self.pathEXE] + command, shell=True))
+
+    def compile(self, program):
+        return program  # spbicl.exe interprets the text itself
+
+    def compileTable(self, table):
+        return pbprogram.format(pbprogram.instructions(table))
+
+    def program(self, program, clock):
+        with open(self.pathProgram,'w') as f:  # This will overwrite an existing file
+            f.write(program)
+        return self._com(['load', self.pathProgram, str(clock)])
+
+    def load(self, program, clock):
+        return self.program(self.compile(program), clock)
+
+    def prepare(self, program, clock):
+        # Written ahead to its own file so the swap does not wait on the disk
+        path = os.path.splitext(self.pathProgram)[0] + '_staged.pb'
+        with open(path,'w') as f:
+            f.write(program)
+        return path
+
+    def swap(self, path, clock, start=True):
+        out = [self._com(['stop']), self._com(['load', path, str(clock)])]
+        if start:
+            out.append(self._com(['start']))
+        return '\n'.join(o for o in out if o)
+
+    def start(self):
+        return self._com(['start'])
+
+    def stop(self):
+        return self._com(['stop'])
+
+    def close(self):
+        pass
+
+class SpinAPIBackend:
+    '''Programs instructions directly with pb_inst_pbonly; .pb text is parsed by program.parse.'''
+
+    name = 'spinapi'
+    LibraryLoader = None    # Callable(path) returning the library; ctypes.CDLL if None (e.g. fake_spinapi.load)
+    shortPulseBits = 0xE00000   # ESR-PRO: bits 21-23 set = normal (not short-pulse) outputs
+    PULSE_PROGRAM = 0
+    prototypes = {  # name: (restype, argtypes)
+        'pb_init': (ctypes.c_int, []),
+        'pb_close': (ctypes.c_int, []),
+        'pb_count_boards': (ctypes.c_int, []),
+        'pb_select_board': (ctypes.c_int, [ctypes.c_int]),
+        'pb_get_error': (ctypes.c_char_p, []),
+        'pb_core_clock': (None, [ctypes.c_double]),
+        'pb_start_programming': (ctypes.c_int, [ctypes.c_int]),
+        'pb_inst_pbonly': (ctypes.c_int, [ctypes.c_uint, ctypes.c_int, ctypes.c_int, ctypes.c_double]),
+        'pb_stop_programming': (ctypes.c_int, []),
+        'pb_reset': (ctypes.c_int, []),
+        'pb_start': (ctypes.c_int, []),
+        'pb_stop': (ctypes.c_int, []),
+    }
+
+    def __init__(self, pathLibrary, board=0):
+        self.pathLibrary = pathLibrary
+        self.lib = (SpinAPIBackend.LibraryLoader or ctypes.CDLL)(pathLibrary)
+        self.fn = {}
+        for (name,(restype,argtypes)) in self.prototypes.items():
+            fn = self.lib[name]
+            fn.restype = restype
+            fn.argtypes = argtypes
+            self.fn[name] = fn
+        self.clock = None
+        boards = self._call('pb_count_boards')
+        if boards <= board:
+            raise RuntimeError('SpinAPI found %i PulseBlaster board(s); cannot use board %i.'%(boards,board))
+        self._call('pb_select_board', board)
+        self._call('pb_init')
+
+    def _call(self, name, *args):
+        ret = self.fn[name](*args)
+        if ret is not None and ret < 0:
+            error = self.fn['pb_get_error']()
+            raise RuntimeError('%s failed (%i): %s'%(name,ret,decode(error) if error else 'unknown error'))
+        return ret
+
+    def program(self, instructions, clock):
+        '''Program (flags, opcode, data, length ns) instructions.'''
+
+        return self._program(self.prepare(instructions, clock), clock)
+
+    def _program(self, prepared, clock):
+        # prepared: output of prepare, passed to pb_inst_pbonly as is
+        if clock != self.clock:
+            self.fn['pb_core_clock'](clock)
+            self.clock = clock
+        self._call('pb_start_programming', self.PULSE_PROGRAM)
+        try:
+            inst = self.fn['pb_inst_pbonly']
+            for (ii,(flags,opcode,data,length)) in enumerate(prepared):
+                if inst(flags, opcode, data, length) < 0:
+                    error = self.fn['pb_get_error']()
+                    raise RuntimeError('pb_inst_pbonly failed at instruction %i: %s'%(ii,decode(error) if error else 'unknown error'))
+        finally:
+            self._call('pb_stop_programming')
+        return 'Programmed %i instructions at %g MHz'%(len(prepared),clock)
+
+    def prepare(self, instructions, clock):
+        # Plain Python values with the output bits already set, ready for pb_inst_pbonly
+        return [(int(flags) | self.shortPulseBits, int(opcode), int(data), float(length))
+                for (flags,opcode,data,length) in instructions]
+
+    def swap(self, prepared, clock, start=True):
+        self._call('pb_stop')
+        out = self._program(prepared, clock)
+        if start:
+            self.start()
+        return out
+
+    def compile(self, program):
+        return pbprogram.parse(program)
+
+    def compileTable(self, table):
+        return pbprogram.instructions(table)
+
+    def load(self, program, clock):
+        return self.program(self.compile(program), clock)
+
+    def start(self):
+        self._call('pb_reset')
+        self._call('pb_start')
+        return ''
+
+    def stop(self):
+        self._call('pb_stop')
+        return ''
+
+    def close(self):
+        self._call('pb_close')
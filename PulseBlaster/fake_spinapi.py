@@ -0,0 +1,134 @@
+from fake_library import FakeLibrary, exported
+from PulseBlaster.PulseBlaster import PulseBlaster
+from PulseBlaster.backends import SpinAPIBackend
+
+# Simulated spinapi library so PulseBlaster can run (and be tested/profiled) without a
+# board. Plugs in through SpinAPIBackend.LibraryLoader.
+#
+# from PulseBlaster import fake_spinapi
+# fake_spinapi.install(latency=1e-5)  # PulseBlaster now uses the spinapi backend on FakeSpinAPI
+# with PulseBlaster() as pb:
+#     pb.setLines(1,True)
+#     fake_spinapi.board().instructions
+#
+# FakeSpinAPI settings (also keyword arguments of install):
+#   boards -> number of boards reported by pb_count_boards
+#   latency, latencies, errors -> see fake_library.FakeLibrary (injected errors set pb_get_error)
+
+SETTINGS = {}   # FakeSpinAPI keyword arguments used by load (set by install)
+BOARDS = []     # FakeSpinAPI instances created by load, most recent last
+
+class FakeSpinAPI(FakeLibrary):
+    def __init__(self, boards=1, latency=0, latencies=None, errors=None):
+        super().__init__(latency, latencies, errors)
+        self.boards = boards
+        self.error = ''
+        self.board = None
+        self.initialized = False
+        self.clock = None
+        self.programming = False
+        self.instructions = []  # (flags, opcode, data, length ns) of the loaded program
+        self.running = False
+        self.loads = 0          # Completed pb_stop_programming calls
+
+    def _injected(self, name):
+        self.error = 'Injected error in ' + name
+
+    def _fail(self, message):
+        self.error = message
+        return -1
+
+    @exported
+    def pb_count_boards(self):
+        return self.boards
+
+    @exported
+    def pb_select_board(self, board):
+        if not 0 <= board < self.boards:
+            return self._fail('Board %i does not exist'%board)
+        self.board = board
+        return 0
+
+    @exported
+    def pb_init(self):
+        self.initialized = True
+        return 0
+
+    @exported
+    def pb_close(self):
+        self.initialized = False  # The loaded program keeps running
+        return 0
+
+    @exported
+    def pb_get_error(self):
+        return self.error.encode('utf-8')
+
+    @exported
+    def pb_core_clock(self, clock):
+        self.clock = clock
+
+    @exported
+    def pb_start_programming(self, device):
+        if not self.initialized:
+            return self._fail('Board not initialized')
+        self.programming = True
+        self.pending = []
+        return 0
+
+    @exported
+    def pb_inst_pbonly(self, flags, inst, inst_data, length):
+        if not self.programming:
+            return self._fail('Not programming')
+        if length < 5*1e3/self.clock:
+            return self._fail('Instruction %i is shorter than 5 clock cycles'%len(self.pending))
+        self.pending.append((flags, inst, inst_data, length))
+        return len(self.pending) - 1
+
+    @exported
+    def pb_stop_programming(self):
+        if not self.programming:
+            return self._fail('Not programming')
+        self.programming = False
+        self.instructions = self.pending
+        self.loads += 1
+        return 0
+
+    @exported
+    def pb_reset(self):
+        self.running = False
+        return 0
+
+    @exported
+    def pb_start(self):
+        if not self.instructions:
+            return self._fail('No program loaded')
+        self.running = True
+        return 0
+
+    @exported
+    def pb_stop(self):
+        self.running = False
+        return 0
+
+def load(path=None):
+    # SpinAPIBackend.LibraryLoader signature (path ignored)
+    BOARDS.append(FakeSpinAPI(**SETTINGS))
+    return BOARDS[-1]
+
+def board():
+    # Most recently loaded FakeSpinAPI
+    return BOARDS[-1]
+
+def install(**settings):
+    # Point PulseBlaster at this backend; settings are FakeSpinAPI keyword arguments
+    SETTINGS.clear()
+    SETTINGS.update(settings)
+    SpinAPIBackend.LibraryLoader = load
+    PulseBlaster.backend = 'spinapi'
+    PulseBlaster.pathLibrary = 'fake_spinapi'
+
+if __name__ == '__main__':
+    install()
+    with PulseBlaster() as pb:
+        print(pb.setLines(1,True))
+        print(board().instructions, board().running)
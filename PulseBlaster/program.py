@@ -0,0 +1,266 @@
+import re, hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Parser for the SpinCore interpreter (.pb) program text accepted by PulseBlaster.load, so
+# programs can be sent to the board through SpinAPI instead of spbicl.exe.
+#
+#   // comment
+#   label: flags, length, OPCODE, data
+#
+# flags: 0b... (spaces/underscores allowed), 0x... or decimal.
+# length: number with unit ns, us, ms or s (ns if omitted).
+# OPCODE defaults to CONTINUE; data is a count (LOOP, LONG_DELAY) or a label or instruction
+# index (BRANCH, END_LOOP, JSR).
+
+OPCODES = {'CONTINUE':0, 'STOP':1, 'LOOP':2, 'END_LOOP':3, 'JSR':4, 'RTS':5, 'BRANCH':6, 'LONG_DELAY':7, 'WAIT':8}
+LABEL_OPCODES = ['BRANCH','END_LOOP','JSR']
+UNITS = {'ns':1, 'us':1e3, 'ms':1e6, 's':1e9}
+
+class ProgramError(ValueError):
+    pass
+
+_line = re.compile(r'^\s*(?:(?P<label>\w+)\s*:)?\s*(?P<body>.*?)\s*$')
+_length = re.compile(r'^(?P<value>[0-9.eE+-]+)\s*(?P<unit>ns|us|ms|s)?$')
+
+def _flags(text):
+    text = text.replace(' ','').replace('_','').lower()
+    if text.startswith('0b'):
+        return int(text[2:],2)
+    if text.startswith('0x'):
+        return int(text[2:],16)
+    return int(text)
+
+def _parse_length(text):
+    match = _length.match(text.strip())
+    if not match:
+        raise ValueError(text)
+    return float(match.group('value'))*UNITS[match.group('unit') or 'ns']
+
+def parse(text):
+    '''Returns the program as a list of (flags, opcode, data, length in ns) instructions with
+    labels resolved to instruction indices. Raises ProgramError naming the offending line.'''
+
+    instructions = []
+    labels = {}
+    pending = []    # (instruction index, label, line number) to resolve
+    for (n,line) in enumerate(text.splitlines(),1):
+        line = line.split('//')[0]
+        if not line.strip():
+            continue
+        match = _line.match(line)
+        (label,body) = match.group('label','body')
+        if label:
+            if label in labels:
+                raise ProgramError('Line %i: label "%s" defined twice'%(n,label))
+            labels[label] = len(instructions)
+        if not body:
+            continue
+        fields = [field.strip() for field in body.split(',')]
+        if len(fields) < 2 or len(fields) > 4:
+            raise ProgramError('Line %i: expected "flags, length[, OPCODE[, data]]": %s'%(n,line.strip()))
+        try:
+            flags = _flags(fields[0])
+            length = _parse_length(fields[1])
+        except ValueError:
+            raise ProgramError('Line %i: could not read flags/length: %s'%(n,line.strip()))
+        opcode = fields[2].upper() if len(fields) > 2 else 'CONTINUE'
+        if opcode not in OPCODES:
+            raise ProgramError('Line %i: unknown opcode "%s". Options: %s'%(n,fields[2],', '.join(OPCODES)))
+        data = fields[3] if len(fields) > 3 else '0'
+        if opcode in LABEL_OPCODES and not data.isdigit():
+            pending.append((len(instructions),data,n))
+            data = 0
+        else:
+            try:
+                data = int(data)
+            except ValueError:
+                raise ProgramError('Line %i: %s data must be an integer, got "%s"'%(n,opcode,data))
+        instructions.append([flags,OPCODES[opcode],data,length])
+    for (i,label,n) in pending:
+        if label not in labels:
+            raise ProgramError('Line %i: unknown label "%s"'%(n,label))
+        instructions[i][2] = labels[label]
+    if not instructions:
+        raise ProgramError('Program has no instructions')
+    return [tuple(inst) for inst in instructions]
+
+def key(program, clock):
+    '''Content hash identifying a program (text or compiled table) at a clock.'''
+
+    if isinstance(program, np.ndarray):
+        return hashlib.sha1(('%r\ntable\n'%float(clock)).encode('utf-8') + np.ascontiguousarray(program).tobytes()).hexdigest()
+    return hashlib.sha1(('%r\n%s'%(float(clock),program)).encode('utf-8')).hexdigest()
+
+def instructions(table):
+    '''(flags, opcode, data, length ns) tuples of a compile_sequence table.'''
+
+    ints = table[:,0:3].astype(np.int64)
+    return list(zip(ints[:,0].tolist(), ints[:,1].tolist(), ints[:,2].tolist(), table[:,3].tolist()))
+
+def format(instructions):
+    '''.pb text of (flags, opcode, data, length ns) instructions (inverse of parse).'''
+
+    names = {v:k for (k,v) in OPCODES.items()}
+    return '\n'.join('0x%06X, %.17g ns, %s, %i'%(flags, length, names[opcode], data)
+                     for (flags,opcode,data,length) in instructions)
+
+def compile_sequence(sequence, duration=None, clock=500, units='ns', repeat=False, numlines=24,
+                     minCycles=5, maxCycles=2**32-1, maxLoopCount=2**20-1, maxPeriod=32):
+    '''Compile per-line edges into an instruction table.
+
+    sequence: {line (1-indexed): edges}, edges being a flat list of edge times (each toggles
+    the line, which starts low) or a list of [on, off] intervals, in `units`.
+    duration: total length (default: the last edge). Times are rounded to clock cycles.
+
+    Identical consecutive states are merged, repeated blocks of up to maxPeriod instructions
+    become LOOP/END_LOOP, and states longer than maxCycles use LONG_DELAY. The program ends
+    with a STOP holding the final state, or branches back to the start if repeat.
+
+    Returns (table, info): table is an (n, 4) float array of flags, opcode, data, length (ns);
+    info holds instruction/loop counts and the validated duration. Raises ProgramError.
+    '''
+
+    tick = 1e3/clock    # ns per clock cycle
+    if units not in UNITS:
+        raise ProgramError('units must be one of: %s'%', '.join(UNITS))
+    times = []
+    masks = []
+    for (line, edges) in sequence.items():
+        line = int(line)
+        if not 1 <= line <= numlines:
+            raise ProgramError('Line indices must be integers between 1 and %i. Was given %i'%(numlines,line))
+        edges = np.asarray(edges, dtype=float)*UNITS[units]
+        if edges.ndim == 2:     # [[on, off], ...]
+            if edges.shape[1] != 2 or np.any(edges[:,1] < edges[:,0]):
+                raise ProgramError('Line %i: intervals must be [on, off] pairs with off >= on'%line)
+            edges = edges.ravel()
+        if edges.ndim != 1 or np.any(np.diff(edges) < 0) or np.any(edges < 0):
+            raise ProgramError('Line %i: edges must be non-negative and increasing (intervals must not overlap)'%line)
+        times.append(edges)
+        masks.append(np.full(len(edges), 1 << (line-1), dtype=np.int64))
+    t = np.round(np.concatenate(times or [np.zeros(0)])/tick).astype(np.int64)
+    m = np.concatenate(masks or [np.zeros(0, dtype=np.int64)])
+    if duration is None:
+        if repeat:
+            raise ProgramError('A repeating sequence needs a duration')
+        end = int(t.max()) if len(t) else 0
+    else:
+        end = int(round(duration*UNITS[units]/tick))
+    if len(t) and t.max() > end:
+        raise ProgramError('Edge at %g ns is after the end of the sequence (%g ns)'%(t.max()*tick, end*tick))
+
+    # States between edges: XOR of the toggles at each distinct time, accumulated
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    first = np.flatnonzero(np.concatenate([[True], t[1:] != t[:-1]])) if len(t) else np.zeros(0, dtype=np.int64)
+    boundaries = t[first]
+    changes = np.bitwise_xor.reduceat(m[order], first) if len(first) else np.zeros(0, dtype=np.int64)
+    states = np.concatenate([[0], np.bitwise_xor.accumulate(changes)])
+    starts = np.concatenate([[0], boundaries])
+    finalState = int(states[-1])
+    keep = np.diff(np.concatenate([starts, [end]])) > 0
+    (starts, states) = (starts[keep], states[keep])
+    keep = np.concatenate([[True], states[1:] != states[:-1]])
+    (starts, states) = (starts[keep], states[keep])
+    lengths = np.diff(np.concatenate([starts, [end]]))
+    n = len(states)
+    if n == 0:
+        raise ProgramError('Sequence has no duration')
+    short = np.flatnonzero(lengths < minCycles)
+    if len(short):
+        i = short[0]
+        raise ProgramError('State at %g ns lasts %g ns; instructions need at least %i clock cycles (%g ns) at %g MHz'
+                           %(starts[i]*tick, lengths[i]*tick, minCycles, minCycles*tick, clock))
+
+    # Repeated blocks: ids[i] == ids[i+p] over a run of L instructions means the block at
+    # the run start repeats L//p + 1 times. Long states (and the BRANCH) never repeat.
+    long = lengths > maxCycles
+    ids = (states.astype(np.int64) << 32) | np.minimum(lengths, maxCycles)
+    ids[long] = -1 - np.flatnonzero(long)
+    if repeat:
+        ids[-1] = -1 - n
+    candidates = []
+    eq = np.zeros(n+1, dtype=bool)     # eq[1:n-p+1] = ids[i] == ids[i+p], False padded
+    for p in range(2, min(maxPeriod, n//2) + 1):
+        eq[n-p+1] = False
+        np.equal(ids[p:], ids[:-p], out=eq[1:n-p+1])
+        changes = np.flatnonzero(eq[1:n-p+2] != eq[0:n-p+1])
+        (runStarts, runLengths) = (changes[0::2], changes[1::2] - changes[0::2])
+        ok = runLengths >= p
+        if ok.any():
+            reps = np.minimum(runLengths[ok]//p + 1, maxLoopCount)
+            candidates.append(np.stack([(reps-1)*p, runStarts[ok], np.full(len(reps), p), reps], 1))
+    candidates = np.concatenate(candidates) if candidates else np.zeros((0,4), dtype=np.int64)
+    candidates = candidates[np.lexsort((candidates[:,2], -candidates[:,0]))] if len(candidates) else candidates
+    used = np.zeros(n, dtype=bool)
+    loops = []
+    for (saving, start, p, r) in candidates.tolist():
+        if not used[start:start+p*r].any():
+            used[start:start+p*r] = True
+            loops.append((start, p, r))
+    opcodes = np.zeros(n, dtype=np.int64)
+    data = np.zeros(n, dtype=np.int64)
+    keep = np.ones(n, dtype=bool)
+    multiplier = np.ones(n, dtype=np.int64)
+    for (start, p, r) in loops:
+        keep[start+p:start+p*r] = False
+        multiplier[start:start+p] = r
+        opcodes[start] = OPCODES['LOOP']
+        data[start] = r
+        opcodes[start+p-1] = OPCODES['END_LOOP']
+        data[start+p-1] = start     # remapped to the output index below
+    if int((lengths*multiplier)[keep].sum()) != end:
+        raise ProgramError('Compiled duration does not match the sequence (internal error)')
+
+    # Output: kept instructions, long states as LONG_DELAY + remainder
+    index = np.flatnonzero(keep)
+    count = np.where(long[index], 2, 1)
+    position = np.cumsum(count) - count     # output index of each kept instruction
+    newIndex = np.zeros(n, dtype=np.int64)
+    newIndex[index] = position
+    data[opcodes == OPCODES['END_LOOP']] = newIndex[data[opcodes == OPCODES['END_LOOP']]]
+    source = np.repeat(index, count)
+    table = np.stack([states[source], opcodes[source], data[source], lengths[source]], 1).astype(float)
+    for i in position[long[index]]:
+        total = table[i,3]
+        parts = -(-int(total)//(maxCycles//2))  # ceil; >= 3 since total > maxCycles
+        chunk = int(total)//parts
+        table[i,1:4] = [OPCODES['LONG_DELAY'], parts-1, chunk]
+        table[i+1,3] = total - (parts-1)*chunk
+    if repeat:
+        table[-1,1:3] = [OPCODES['BRANCH'], 0]
+    else:
+        table = np.concatenate([table, [[finalState, OPCODES['STOP'], 0, minCycles]]])
+    table[:,3] *= tick
+    info = {'edges': len(t), 'states': n, 'instructions': len(table), 'loops': len(loops),
+            'duration': end*tick, 'clock': clock, 'repeat': bool(repeat)}
+    return table, info
+
+class ProgramCache:
+    '''LRU of compiled programs keyed by key(program, clock), with hit/miss counters.'''
+
+    def __init__(self, size=32):
+        self.size = size
+        self.entries = OrderedDict()
+        self.stats = {'hits':0, 'misses':0, 'evictions':0, 'skipped':0}
+
+    def get(self, key, compile):
+        '''Compiled program for key, calling compile() on a miss.'''
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.entries[key]
+        self.stats['misses'] += 1
+        compiled = compile()
+        self.entries[key] = compiled
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+        return compiled
+
+    def status(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, entries=len(self.entries), size=self.size,
+                    hitRate=self.stats['hits']/lookups if lookups else None)
@@ -0,0 +1,128 @@
+import argparse, random, time
+from SuperK import superk
+
+# Telegram encode/decode throughput of the superk codec against the per-byte implementation
+# it replaced (kept below as legacy_send/legacy_recv).
+#
+# python -m SuperK.benchmark --calls 20000
+
+def legacy_crc(data,crc=0):
+    crc = (((crc>>8)&superk.CHAR)|(crc<<8))&superk.INT
+    crc ^= data
+    crc ^= (crc&superk.CHAR)>>4
+    crc ^= (((crc<<8)&superk.INT)<<4)&superk.INT
+    crc ^= ((((crc&superk.CHAR)<<4)&superk.INT)<<1)&superk.INT
+    return crc&superk.INT
+
+def legacy_int2bytes(val,nbytes=None):
+    out = []
+    if nbytes:
+        for i in range(nbytes):
+            out.append(val&0xFF)
+            val = val >> 8
+    else:
+        if val == 0:
+            return [0]
+        while val:
+            out.append(val & 0xFF)
+            val = val >> 8
+    return out
+
+def legacy_send(dest,src,typ,reg,data=[],nbytes=None):
+    # com.send before the table-driven codec: one list append per byte; returns what was written
+    msg = []
+    def putc(byte):
+        msg.append(byte)
+    def txnocrc(byte):
+        assert byte < 2**8, Exception('Data needs to be an 8 bit value')
+        if byte == superk.SOT or byte == superk.EOT or byte == superk.SOE:
+            putc(superk.SOE)
+            byte += superk.ECC
+        putc(byte)
+    def tx1(byte,crc):
+        assert crc <= superk.INT, Exception('crc needs to be a 16 bit value')
+        assert byte <= superk.CHAR, Exception('Data needs to be an 8 bit value')
+        crc = legacy_crc(byte,crc)
+        txnocrc(byte)
+        return crc
+    if type(data)!=list:
+        data = [data]
+    putc(superk.SOT)
+    crc = tx1(dest,0)
+    crc = tx1(src,crc)
+    crc = tx1(typ,crc)
+    crc = tx1(reg,crc)
+    for dat in data:
+        for byte in legacy_int2bytes(int(dat),nbytes):
+            crc = tx1(byte,crc)
+    txnocrc((crc>>8)&0xFF)
+    txnocrc(crc&0xFF)
+    putc(superk.EOT)
+    return bytearray(msg)
+
+def legacy_recv(raw):
+    # Frame decoding of com.recv before the table-driven codec
+    tlg = []
+    crc = 0
+    special_char = False
+    for byte in raw:
+        if byte == superk.SOT:
+            continue
+        elif byte == superk.EOT:
+            assert crc == 0, Exception('Checksum failed.')
+            break
+        elif byte == superk.SOE:
+            special_char = True
+        else:
+            if special_char:
+                special_char = False
+                byte -= superk.ECC
+            crc = legacy_crc(byte,crc)
+            tlg.append(byte)
+    return [tlg[1],tlg[2],tlg[3],tlg[4:-2]]
+
+def telegrams(n,size):
+    # n random (dest, src, typ, reg, data) with size data bytes
+    rnd = random.Random(0)
+    return [(rnd.choice([15,17]),0xA2,rnd.choice([superk.READ,superk.WRITE,superk.DATAGRAM]),
+             rnd.randrange(256),[rnd.randrange(256) for _ in range(size)]) for _ in range(n)]
+
+def check(frames):
+    # The new codec must produce and accept exactly what the old one did
+    for (dest,src,typ,reg,data) in frames:
+        raw = superk.encode_telegram(dest,src,typ,reg,superk.pack(data,1))
+        assert raw == legacy_send(dest,src,typ,reg,data,1), (dest,src,typ,reg,data)
+        assert list(superk.decode_telegram(raw)) == [dest,src,typ,reg,bytes(data)]
+        assert legacy_recv(raw) == [src,typ,reg,data]
+
+def throughput(fn,items,duration):
+    # Calls/s and mean us over items, repeated for at least duration seconds
+    calls = 0
+    tstart = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        calls += len(items)
+        elapsed = time.perf_counter() - tstart
+        if elapsed > duration:
+            return calls/elapsed, elapsed/calls*1e6
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the SuperK telegram codec.')
+    parser.add_argument('--calls',type=int,default=2000,help='telegrams per size')
+    parser.add_argument('--duration',type=float,default=1.0,help='minimum seconds per measurement')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[0,2,4,16],help='data bytes per telegram')
+    args = parser.parse_args()
+
+    print('%-8s %-8s %12s %9s %12s %9s %8s'%('bytes','','legacy/s','us','new/s','us','speedup'))
+    for size in args.sizes:
+        frames = telegrams(args.calls,size)
+        check(frames)
+        raws = [superk.encode_telegram(d,s,t,r,superk.pack(data,1)) for (d,s,t,r,data) in frames]
+        cases = [('encode',lambda f: legacy_send(f[0],f[1],f[2],f[3],f[4],1),
+                           lambda f: superk.encode_telegram(f[0],f[1],f[2],f[3],superk.pack(f[4],1)),frames),
+                 ('decode',legacy_recv,superk.decode_telegram,raws)]
+        for (name,legacy,new,items) in cases:
+            (lrate,lus) = throughput(legacy,items,args.duration)
+            (nrate,nus) = throughput(new,items,args.duration)
+            print('%-8i %-8s %12.0f %9.2f %12.0f %9.2f %7.1fx'%(size,name,lrate,lus,nrate,nus,nrate/lrate))
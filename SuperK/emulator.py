@@ -0,0 +1,112 @@
+import argparse, logging, random, time
+from serial_emulator import PTYEmulator
+from SuperK import superk
+
+logger = logging.getLogger(__name__)
+
+# SuperK Extreme (module 15) and Varia (17) speaking the NKT telegram protocol on a pty.
+#
+# from SuperK import emulator, superk
+# with emulator.SuperKEmulator(baudrate=115200) as emu:
+#     with superk.superk(port=emu.port) as s:
+#         s.setwavelength(600)
+#
+# or as a process: python -m SuperK.emulator
+#
+# SuperKEmulator settings (besides latency/baudrate, see serial_emulator):
+#   busy -> probability of answering BUSY instead of handling a telegram
+#   crc_errors -> probability of answering CRC_ERR (as if the telegram arrived corrupted)
+#   registers -> {(address, register): value} overriding the initial register values
+# Telegrams that fail the checksum are answered with CRC_ERR, unknown registers and
+# invalid writes with NACK; telegrams for absent addresses get no answer.
+
+# (address, register): [value, bytes, writable]
+REGISTERS = {
+    (15,0x30): [0,1,True],      # Emission (0 off, 3 on)
+    (15,0x34): [1,2,True],      # Pulse picker divider
+    (15,0x37): [500,2,True],    # Power (0.1 %)
+    (15,0x38): [0,2,False],     # Current (0.1 %)
+    (17,0x32): [1000,2,True],   # ND filter (0.1 %)
+    (17,0x33): [5550,2,True],   # SWP (0.1 nm)
+    (17,0x34): [5450,2,True],   # LWP (0.1 nm)
+}
+
+class SuperKEmulator(PTYEmulator):
+    name = 'SuperK'
+
+    def __init__(self,latency=0,baudrate=None,busy=0,crc_errors=0,registers=None):
+        self.busy = busy
+        self.crc_errors = crc_errors
+        self.registers = {key:list(reg) for (key,reg) in REGISTERS.items()}
+        for (key,value) in (registers or {}).items():
+            self.registers[key][0] = value
+        self._buffer = bytearray()
+        super().__init__(latency,baudrate)
+
+    def received(self,data):
+        self._buffer += data
+        while superk.EOT in self._buffer:
+            end = self._buffer.index(superk.EOT)
+            raw = bytes(self._buffer[:end+1])
+            del self._buffer[:end+1]
+            self._telegram(raw)
+
+    def _telegram(self,raw):
+        try:
+            (dest,src,typ,reg,data) = superk.decode_telegram(raw)
+        except superk.SuperKerror:
+            self.count('checksum')
+            # Best guess at the addresses of a corrupted telegram: | SOT | dest | src | ...
+            (dest,src) = (raw[1],raw[2]) if len(raw) > 3 else (15,0xA2)
+            return self.reply(superk.encode_telegram(src,dest,superk.CRC_ERR,0))
+        if not any(address == dest for (address,_) in self.registers):
+            return  # Nothing at that address
+        self.count({superk.READ:'read',superk.WRITE:'write'}.get(typ,'type %i'%typ)+' %i 0x%02X'%(dest,reg))
+        answer = lambda typ,payload=b'': self.reply(superk.encode_telegram(src,dest,typ,reg,payload))
+        if random.random() < self.busy:
+            return answer(superk.BUSY)
+        if random.random() < self.crc_errors:
+            return answer(superk.CRC_ERR)
+        register = self.registers.get((dest,reg))
+        if register is None or typ not in [superk.READ,superk.WRITE]:
+            return answer(superk.NACK)
+        if typ == superk.READ:
+            return answer(superk.DATAGRAM,register[0].to_bytes(register[1],'little'))
+        value = superk.bytes2int(data)
+        if not register[2] or len(data) > register[1] or not self._valid(dest,reg,value):
+            return answer(superk.NACK)
+        register[0] = value
+        self._update()
+        answer(superk.ACK)
+
+    def _valid(self,dest,reg,value):
+        if (dest,reg) == (15,0x30):
+            return value in [0,3]
+        if (dest,reg) == (15,0x34):
+            return value > 0
+        if (dest,reg) in [(15,0x37),(17,0x32)]:
+            return value <= 1000
+        if (dest,reg) == (17,0x34):
+            return value < self.registers[(17,0x33)][0]
+        if (dest,reg) == (17,0x33):
+            return value > self.registers[(17,0x34)][0]
+        return True
+
+    def _update(self):
+        # Current follows the power setting while emitting
+        on = self.registers[(15,0x30)][0] == 3
+        self.registers[(15,0x38)][0] = self.registers[(15,0x37)][0] if on else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SuperK Extreme/Varia emulator on a pseudo-terminal.')
+    parser.add_argument('--latency',type=float,default=0,help='seconds before every reply')
+    parser.add_argument('--baudrate',type=int,default=115200,help='reply pacing (0: none)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with SuperKEmulator(args.latency,args.baudrate or None) as emu:
+        logger.info('SuperK emulator on %s'%emu.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
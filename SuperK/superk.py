@@ -1,6 +1,8 @@
-import serial
+import serial, logging, time
+import numpy as np
 from serial.tools import list_ports
 from serial import rs485
+logger = logging.getLogger(__name__)
 
 # Telegram special characters
 SOT = 0x0D  # Start of telegram
@@ -38,13 +40,76 @@ def int2bytes(val,nbytes=None):
     return bytes
 
 def bytes2int(bytes):
-    # Bytes in Little-endian
-    val = 0
-    bytes.reverse()
-    for byte in bytes:
-        val = val << 8
-        val ^= byte
-    return val
+    # Bytes in Little-endian (list, bytes or bytearray)
+    return int.from_bytes(bytearray(bytes),'little')
+
+def _crc_table():
+    # crc(byte, crc=0) for every byte, from the bitwise update in the manual
+    table = []
+    for data in range(256):
+        crc = data
+        crc ^= (crc&CHAR)>>4
+        crc ^= (((crc<<8)&INT)<<4)&INT
+        crc ^= ((((crc&CHAR)<<4)&INT)<<1)&INT
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = _crc_table()
+
+def crc16(data,crc=0):
+    # CRC of a bytes-like object, continuing from crc; 0 over a telegram including its CRC
+    for byte in data:
+        crc = ((crc<<8)&INT) ^ CRC_TABLE[(crc>>8) ^ byte]
+    return crc
+
+_SPECIAL = bytes([SOT,EOT,SOE])
+_ESCAPES = [(bytes([SOE]),bytes([SOE,SOE+ECC])),  # SOE first: the others insert SOE
+            (bytes([SOT]),bytes([SOE,SOT+ECC])),
+            (bytes([EOT]),bytes([SOE,EOT+ECC]))]
+
+def encode_telegram(dest,src,typ,reg,payload=b''):
+    # Complete telegram (SOT, escaped body and CRC, EOT) as bytes
+    body = bytes([dest,src,typ,reg]) + bytes(payload)
+    crc = crc16(body)
+    body += bytes([crc>>8,crc&CHAR])
+    if any(special in body for special in _SPECIAL):
+        for (char,escaped) in _ESCAPES:
+            body = body.replace(char,escaped)
+    return bytes([SOT]) + body + bytes([EOT])
+
+def decode_telegram(raw):
+    # raw telegram (bytes-like, with or without SOT/EOT) -> dest, src, typ, reg, data (bytes)
+    raw = bytes(raw)
+    start = raw.rfind(SOT) + 1  # 0 without SOT
+    end = raw.find(EOT,start)
+    body = raw[start:] if end < 0 else raw[start:end]
+    if SOE in body:
+        parts = body.split(bytes([SOE]))
+        if not all(parts[1:]):
+            raise SuperKerror('Bad substitution in telegram.')
+        body = parts[0] + b''.join(bytes([part[0]-ECC]) + part[1:] for part in parts[1:])
+    if len(body) < 6:
+        raise SuperKerror('Telegram too short (%i bytes).'%len(body))
+    if crc16(body):
+        raise SuperKerror('Checksum failed.')
+    return body[0],body[1],body[2],body[3],body[4:-2]
+
+def pack(data,nbytes=None):
+    # Integer (or list of integers) -> little-endian payload bytes, nbytes per value if given
+    if type(data)!=list:
+        data = [data]
+    payload = b''
+    for dat in data:
+        if type(dat)!=int:
+            try:
+                if int(dat)==float(dat):
+                    dat = int(dat)
+                else:
+                    raise ValueError()
+            except ValueError:  # Catch if data is non-numeric string or non-integer value
+                raise ValueError('Data needs to be integer or list of integer values.')
+        payload += dat.to_bytes(nbytes or max(1,(dat.bit_length()+7)//8),'little')
+    return payload
 
 class com:
     # A frame is as follows (each section 1 Byte):
@@ -62,8 +127,9 @@ class com:
         self.serial.reset_input_buffer()
         self.serial.reset_output_buffer()
         
-        self._msg = []         # Used to build a telegram before sending
         self.my_address = None # HOST address in hex (must be larger than 160)
+        self._rx = bytearray() # Received bytes not yet decoded (partial or following telegrams)
+        self.misdirected = 0   # Telegrams received for other addresses (skipped)
     
     # Carry over some serial functions
     def isOpen(self):
@@ -74,70 +140,34 @@ class com:
     # Calculate CRC value
     @staticmethod
     def _crc(data,crc=0):
-        assert crc <= INT, Exception('crc needs to be a 16 bit value')
-        assert data <= CHAR, Exception('Data needs to be an 8 bit value')
-        # Code adapted from C code in manual
         #   crc should be 16 bit integer
         #   data should be 8 bit integer
-        crc = (((crc>>8)&CHAR)|(crc<<8))&INT
-        crc ^= data
-        crc ^= (crc&CHAR)>>4
-        crc ^= (((crc<<8)&INT)<<4)&INT
-        crc ^= ((((crc&CHAR)<<4)&INT)<<1)&INT
-        return crc&INT
-
-    # Place Byte
-    def _com_putc(self,data):
-        self._msg.append(data)
-        if data == EOT:
-            self.serial.write(bytearray(self._msg))
-            self.serial.flush()
-            self._msg = []
-
-    # Transmit without CRC calc
-    def _TXnocrc(self,data):
-        assert data < 2**8, Exception('Data needs to be an 8 bit value')
-        if data == SOT or data == EOT or data == SOE:
-            self._com_putc(SOE)
-            data += ECC
-        self._com_putc(data)
-
-    # Transmit 1 byte and calculate CRC
-    def _TX1(self,data,crc):
-        crc = self._crc(data,crc)
-        self._TXnocrc(data)
-        return crc
+        return ((crc<<8)&INT) ^ CRC_TABLE[(crc>>8) ^ data]
 
     # Transmit complete telegram
     def send(self,dest,typ,reg,data=[],nbytes=None):
         # data needs to be an array or integer
-        # nbytes (if specified) will force int2bytes to return nbytes
-
-        # Format data correctly, and check type
-        if type(data)!=list:
-            data = [data]
-        for i, dat in enumerate(data):
-            if type(dat)==int:
-                continue
-            try:
-                if int(dat)==float(dat):
-                    data[i] = int(dat)
-                else:
-                    raise ValueError()
-            except ValueError:  # Catch if data is non-numeric string or non-integer value
-                raise ValueError('Data needs to be integer or list of integer values.')
-
-        self._com_putc(SOT)                     # Start telegram
-        crc = self._TX1(dest,0)                 # Destination address
-        crc = self._TX1(self.my_address,crc)    # Source address
-        crc = self._TX1(typ,crc)                # Message type
-        crc = self._TX1(reg,crc)                # Register number
-        for dat in data:
-            for byte in int2bytes(dat,nbytes):
-                crc = self._TX1(byte,crc)        # Transmit data
-        self._TXnocrc((crc>>8)&0xFF)            # Transmit CRC MSB
-        self._TXnocrc(crc&0xFF)                 # Transmit CRC LSB
-        self._com_putc(EOT)                     # End telegram
+        # nbytes (if specified) will force each value to nbytes bytes
+        self.write(encode_telegram(dest,self.my_address,typ,reg,pack(data,nbytes)))
+
+    # Transmit telegram(s) already encoded with encode_telegram
+    def write(self,raw):
+        self.serial.write(raw)
+        self.serial.flush()
+
+    def _frame(self):
+        # Next raw telegram (up to EOT) from the buffer, reading whatever the port has
+        # available (at least 1 byte, waiting up to the timeout) until one is complete
+        while True:
+            end = self._rx.find(EOT)
+            if end >= 0:
+                raw = bytes(self._rx[:end+1])
+                del self._rx[:end+1]
+                return raw
+            data = self.serial.read(max(1,self.serial.in_waiting))
+            if not data:
+                raise IOError('Did not receive a response in time.')
+            self._rx += data
 
     def recv(self):
         # Receives data and checks for accuracy and destination
@@ -145,38 +175,14 @@ class com:
         # Data will be empty unless type = DATAGRAM
         # Data is in raw format and will depend on query
         #   Remember an integer is little-endian
-
-        # Get full message
-        raw = []
-        while len(raw)==0 or raw[-1] != EOT:
-            byte = self.serial.read(1)
-            assert len(byte) == 1, IOError('Did not receive a response in time.')
-            raw.append(ord(byte))
-        # Decode frame
-        tlg = []
-        crc = 0
-        special_char = False
-        for byte in raw:
-            if byte == SOT:
-                continue
-            elif byte == EOT:
-                assert crc == 0, Exception('Checksum failed.')
-                break
-            elif byte == SOE:
-                special_char = True
-            else: # Default
-                if special_char:
-                    special_char = False
-                    byte -= ECC
-                crc = self._crc(byte,crc)
-                tlg.append(byte)
-        dest = tlg[0]
-        src = tlg[1]
-        typ = tlg[2]
-        reg = tlg[3]
-        data = tlg[4:-2]
-       # assert dest==self.my_address, Exception('Wrong destination address.')
-        return [src,typ,reg,data]
+        # Telegrams for another destination are logged and skipped
+        while True:
+            (dest,src,typ,reg,data) = decode_telegram(self._frame())
+            if self.my_address is None or dest == self.my_address:
+                return [src,typ,reg,list(data)]
+            self.misdirected += 1
+            logger.warning('Skipped telegram for address %i (this host is %i): source %i, type %i, register 0x%02X'%(
+                dest,self.my_address,src,typ,reg))
 
 class SuperKerror(Exception):
     # Wrapper for superk._com transmission/reply errors
@@ -194,16 +200,24 @@ getcurrent - gets current (%)
 *reprate - reprate (MHz); pulsepicker is changed by this
 *wavelength - sets center wavelength (nm)
 *bandwidth - sets bandwidth (nm)
-*ND - sets ND filter (%)'''
-
-    def __init__(self):
-        ui = None  # add your unique identifier! format: '0000:0000'
-        if not ui:
-            raise SuperKerror('No unique identifier set')
-        port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
-        if not len(port)==1:
-            raise SuperKerror('Found %i ports matching the unique identifier'%len(port))
-        self.serial = com(port[0])
+*ND - sets ND filter (%)
+sweep - steps center wavelength (nm) through a list; optional bandwidths (nm), ND/power (%) and dwell (s); returns timestamps
+*cacheage - seconds register reads are served from the shadow cache (0 disables)
+cachestatus - shadow cache hits/misses/skipped writes
+invalidate - forget all cached register values'''
+
+    def __init__(self,port=None):
+        # port: serial device to use instead of searching by unique identifier (e.g. SuperK/emulator.py)
+        if port is None:
+            ui = None  # add your unique identifier! format: '0000:0000'
+            if not ui:
+                raise SuperKerror('No unique identifier set')
+            port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
+            if not len(port)==1:
+                raise SuperKerror('Found %i ports matching the unique identifier'%len(port))
+            port = port[0]
+        self.serial = com(port)
+        self.serial.my_address = 0xA2  # HOST address (must be larger than 160)
 
         self.retries = 3  # Retries on checksum failure or busy
 
@@ -212,6 +226,15 @@ getcurrent - gets current (%)
         self._module = 15
         self._varia = 17
 
+        # Shadow cache of setpoint registers {(addr, reg): (data, time)}: filled by
+        # acknowledged writes and by reads, used for reads younger than cache_age seconds
+        self.cache_age = 5.0
+        # (not emission: interlocks switch it off behind our back)
+        self._shadowed = {(self._module,0x34),(self._module,0x37),
+                          (self._varia,0x32),(self._varia,0x33),(self._varia,0x34)}
+        self._shadow = {}
+        self.cache_stats = {'hits':0,'misses':0,'skipped':0}
+
     def __enter__(self):
         return self
     def __exit__(self, exc_type, exc_value, traceback):
@@ -221,23 +244,43 @@ getcurrent - gets current (%)
         if self.serial.isOpen():
             self.serial.close()
 
-    def _com(self,dest,typ,reg,data=[]):
+    def _com(self,dest,typ,reg,data=[],cached=True,raw=None):
         # Return true on ACK
         # Return data on DATAGRAM
         # Error otherwise
+        # Shadowed registers are read from the cache while fresh (unless cached is False)
+        # raw: the request already encoded (sent instead of encoding dest, typ, reg, data)
+        key = (dest,reg)
+        shadow = cached and key in self._shadowed
+        if shadow and typ == READ:
+            value = self._cached(key)
+            if value is not None:
+                self.cache_stats['hits'] += 1
+                return value
+            self.cache_stats['misses'] += 1
+        request = typ
+        written = list(pack(data)) if shadow and typ == WRITE else None
+        self._shadow.pop(key,None)  # Unknown until this transaction succeeds
         tries = 0
         while tries < self.retries:
             tries += 1
-            self.serial.send(dest,typ,reg,data)
-            [src,typ,reg,data] = self.serial.recv()
+            if raw is None:
+                self.serial.send(dest,request,reg,data)
+            else:
+                self.serial.write(raw)
+            [src,typ,reg,rdata] = self.serial.recv()
             if typ == NACK:
                 raise SuperKerror('Message not understood, not applicable, or not allowed.')
             elif typ == CRC_ERR or typ == BUSY:
                 tries += 1
             elif typ == ACK:
+                if written is not None:
+                    self._shadow[key] = (written,time.monotonic())
                 return True
             elif typ == DATAGRAM:
-                return data
+                if shadow:
+                    self._shadow[key] = (list(rdata),time.monotonic())
+                return rdata
         if typ == CRC_ERR:
             raise SuperKerror('CRC Error.')
         elif typ == BUSY:
@@ -245,6 +288,21 @@ getcurrent - gets current (%)
         else:
             raise SuperKerror('Unhandled Error.')
 
+    def _cached(self,key):
+        # Shadowed data of (addr, reg) if younger than cache_age, else None
+        entry = self._shadow.get(key)
+        if entry and time.monotonic()-entry[1] < self.cache_age:
+            return list(entry[0])
+        return None
+
+    def _write(self,dest,reg,val):
+        # Write unless the fresh shadow already holds val (for composite operations)
+        current = self._cached((dest,reg))
+        if current is not None and bytes2int(current) == val:
+            self.cache_stats['skipped'] += 1
+            return True
+        return self._com(dest,WRITE,reg,val)
+
     def _help():
         return superk.HELP
 
@@ -302,37 +360,105 @@ getcurrent - gets current (%)
         return set_reprate
 
     # SuperK Varia Controls
+    def _filters(self):
+        # LWP, SWP register values (0.1 nm)
+        return bytes2int(self._com(self._varia,READ,0x34)),bytes2int(self._com(self._varia,READ,0x33))
+
+    def _setfilters(self,LWP,SWP,current=None):
+        # LWP, SWP in nm; only writes registers that change
+        # current: the (LWP, SWP) register values just read by the caller (read if None)
+        assert LWP<SWP, SuperKerror('LWP is greater than SWP!')
+        LWP = int(round(LWP*10))
+        SWP = int(round(SWP*10))
+        (lwp,swp) = self._filters() if current is None else current
+        if LWP >= lwp:  # Moving up: open SWP first so LWP never passes it
+            self._write(self._varia,0x33,SWP)
+            self._write(self._varia,0x34,LWP)
+        else:
+            self._write(self._varia,0x34,LWP)
+            self._write(self._varia,0x33,SWP)
+        return True
+
     def getwavelength(self):
         # nm
-        LWP = bytes2int(self._com(self._varia,READ,0x34))*0.1
-        SWP = bytes2int(self._com(self._varia,READ,0x33))*0.1
-        return (LWP+SWP)/2.0
+        (LWP,SWP) = self._filters()
+        return (LWP+SWP)*0.1/2.0
 
     def setwavelength(self,center):
         # nm
-        BW = self.getbandwidth()
-        LWP = float(center) - BW/2.0
-        SWP = float(center) + BW/2.0
-        assert LWP<SWP, SuperKerror('LWP is greater than SWP!')
-        self._com(self._varia,WRITE,0x34,LWP*10)
-        self._com(self._varia,WRITE,0x33,SWP*10)
-        return True
+        current = self._filters()
+        BW = (current[1]-current[0])*0.1
+        return self._setfilters(float(center) - BW/2.0,float(center) + BW/2.0,current)
 
     def getbandwidth(self):
         # nm
-        LWP = bytes2int(self._com(self._varia,READ,0x34))*0.1
-        SWP = bytes2int(self._com(self._varia,READ,0x33))*0.1
-        return SWP-LWP
+        (LWP,SWP) = self._filters()
+        return (SWP-LWP)*0.1
 
     def setbandwidth(self,BW):
         # nm
-        center = self.getwavelength()
-        LWP = center - float(BW)/2.0
-        SWP = center + float(BW)/2.0
-        assert LWP<SWP, SuperKerror('LWP is greater than SWP!')
-        self._com(self._varia,WRITE,0x34,LWP*10)
-        self._com(self._varia,WRITE,0x33,SWP*10)
-        return True
+        current = self._filters()
+        center = (current[0]+current[1])*0.1/2.0
+        return self._setfilters(center - float(BW)/2.0,center + float(BW)/2.0,current)
+
+    def sweep(self,centers,bandwidths=None,ND=None,power=None,dwell=0):
+        # centers, bandwidths in nm (bandwidths default to the current bandwidth)
+        # ND, power in percent (optional); dwell in s after each point (scalar or per point)
+        # All register values and telegrams are prepared before the first write; per point
+        # only the registers that change are written. Returns t0 (epoch s) and per point
+        # t (s since t0, when its writes were acknowledged), LWP and SWP (nm)
+        centers = np.atleast_1d(np.asarray(centers,dtype=float))
+        n = len(centers)
+        if bandwidths is None:
+            bandwidths = self.getbandwidth()
+        LWP = np.rint((centers - np.asarray(bandwidths,dtype=float)/2.0)*10).astype(int)
+        SWP = np.rint((centers + np.asarray(bandwidths,dtype=float)/2.0)*10).astype(int)
+        if not np.all(LWP < SWP):
+            raise SuperKerror('LWP is greater than SWP at points %s!'%np.flatnonzero(LWP >= SWP).tolist())
+        dwell = np.broadcast_to(np.asarray(dwell,dtype=float),(n,))
+        # Register columns, in the order written for each point
+        columns = []
+        if ND is not None:
+            columns.append((self._varia,0x32,np.broadcast_to(np.rint(np.asarray(ND,dtype=float)*10).astype(int),(n,))))
+        if power is not None:
+            columns.append((self._module,0x37,np.broadcast_to(np.rint(np.asarray(power,dtype=float)*10).astype(int),(n,))))
+        for (dest,reg,values) in columns:
+            if np.any(values < 0):
+                raise SuperKerror('Negative value for register 0x%02X.'%reg)
+        # Moving up: SWP before LWP so LWP never passes SWP (point 0 compares to the current LWP)
+        (lwp,swp) = self._filters()
+        up = np.diff(LWP,prepend=lwp) >= 0
+        last = {(self._varia,0x34):lwp,(self._varia,0x33):swp}  # Register values on the device, None if unknown
+        for (dest,reg,values) in columns:
+            cached = self._cached((dest,reg))
+            last[(dest,reg)] = None if cached is None else bytes2int(cached)
+        plan = []  # per point: [(dest, reg, value, raw telegram)]
+        for i in range(n):
+            edges = [(self._varia,0x33,SWP[i]),(self._varia,0x34,LWP[i])]
+            writes = [(dest,reg,values[i]) for (dest,reg,values) in columns] + (edges if up[i] else edges[::-1])
+            point = []
+            for (dest,reg,val) in writes:
+                val = int(val)
+                if last[(dest,reg)] != val:
+                    point.append((dest,reg,val,encode_telegram(dest,self.serial.my_address,WRITE,reg,pack(val))))
+                    last[(dest,reg)] = val
+            plan.append(point)
+
+        t = np.empty(n)
+        writes = 0
+        t0 = time.time()
+        tstart = time.perf_counter()
+        deadline = tstart
+        for i in range(n):
+            for (dest,reg,val,raw) in plan[i]:
+                self._com(dest,WRITE,reg,val,raw=raw)
+            writes += len(plan[i])
+            now = time.perf_counter()
+            t[i] = now - tstart
+            deadline = max(deadline,now) + dwell[i]
+            if deadline > now:
+                time.sleep(deadline - now)
+        return {'t0':t0,'t':t.tolist(),'LWP':(LWP*0.1).tolist(),'SWP':(SWP*0.1).tolist(),'writes':writes}
 
     def getND(self):
         # percent
@@ -344,14 +470,35 @@ getcurrent - gets current (%)
         return self._com(self._varia,WRITE,0x32,data)
 
 
+    # Register shadow cache
+    def getcacheage(self):
+        return self.cache_age
+
+    def setcacheage(self,val):
+        # seconds; 0 disables the cache
+        self.cache_age = max(0.0,float(val))
+        return self.cache_age
+
+    def cachestatus(self):
+        status = dict(self.cache_stats)
+        status['age'] = self.cache_age
+        status['registers'] = len(self._shadow)
+        return status
+
+    def invalidate(self):
+        self._shadow.clear()
+        return True
+
     # General access to full control (advanced users)
     def custom(self,addr,reg,data=[]):
         # Assumes read if data=[], write otherwise
+        # Bypasses the shadow cache; a write invalidates the register
         typ = READ
         data = [float(item) for item in data]
         if len(data):
             typ = WRITE
-        return self._com(addr,typ,reg,data)
+        self._shadow.pop((int(addr),int(reg)),None)
+        return self._com(addr,typ,reg,data,cached=False)
 
 if __name__=='__main__':
     print(superk._help())
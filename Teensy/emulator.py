@@ -0,0 +1,102 @@
+import argparse, logging, time
+from serial_emulator import PTYEmulator
+
+logger = logging.getLogger(__name__)
+
+# Teensy filter wheel controller on a pty: the single-character commands of teensy.py.
+#
+# from Teensy import emulator, teensy
+# with emulator.TeensyEmulator() as emu:
+#     with teensy.teensy(port=emu.port) as t:
+#         t.reset()
+#         t.change_filter(3)
+#
+# or as a process: python -m Teensy.emulator
+#
+# Commands (no terminator; replies end in \r\n):
+#   ^ identify (no reply), ! reset/home the wheel, *<n> move to filter n (1-6),
+#   @ filter position (-1 not calibrated, 0 unknown/moving), ? calibrated (1/0),
+#   #<pin>;<0|1> set a digital output
+# TeensyEmulator settings (besides latency/baudrate, see serial_emulator):
+#   move_time -> seconds a reset or filter move takes (position reads 0 meanwhile)
+
+class TeensyEmulator(PTYEmulator):
+    name = 'Teensy'
+    filters = 6
+
+    def __init__(self,latency=0,baudrate=None,move_time=0):
+        self.move_time = move_time
+        self.calibrated = False
+        self.position = 1
+        self.moving_until = 0
+        self.pins = {}
+        self._buffer = ''
+        super().__init__(latency,baudrate)
+
+    def received(self,data):
+        self._buffer += data.decode('ascii','replace')
+        while self._buffer:
+            command = self._command()
+            if command is None:
+                return  # Wait for the rest
+            self._handle(command)
+
+    def _command(self):
+        # Pops the next complete command from the buffer (None if incomplete)
+        buf = self._buffer
+        if buf[0] == '*':
+            if len(buf) < 2:
+                return None
+            (command,self._buffer) = (buf[:2],buf[2:])
+        elif buf[0] == '#':
+            end = buf.find(';')
+            if end < 0 or len(buf) < end+2:
+                return None
+            (command,self._buffer) = (buf[:end+2],buf[end+2:])
+        else:
+            (command,self._buffer) = (buf[0],buf[1:])
+        return command
+
+    def _handle(self,command):
+        self.count(command[0])
+        if command == '^':
+            pass
+        elif command == '!':
+            self.calibrated = True
+            self.position = 1
+            self.moving_until = time.time() + self.move_time
+        elif command[0] == '*':
+            if self.calibrated and command[1:].isdigit() and 1 <= int(command[1:]) <= self.filters:
+                self.position = int(command[1:])
+                self.moving_until = time.time() + self.move_time
+        elif command == '@':
+            if not self.calibrated:
+                position = -1
+            elif time.time() < self.moving_until:
+                position = 0
+            else:
+                position = self.position
+            self.reply(('%i\r\n'%position).encode())
+        elif command == '?':
+            self.reply(b'1\r\n' if self.calibrated else b'0\r\n')
+        elif command[0] == '#':
+            (pin,out) = command[1:].split(';')
+            if pin.isdigit() and out in ['0','1']:
+                self.pins[int(pin)] = int(out)
+        else:
+            logger.debug('Teensy emulator ignored %r'%command)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Teensy filter wheel emulator on a pseudo-terminal.')
+    parser.add_argument('--latency',type=float,default=0,help='seconds before every reply')
+    parser.add_argument('--baudrate',type=int,default=9600,help='reply pacing (0: none)')
+    parser.add_argument('--move-time',type=float,default=1.0,help='seconds per reset/filter move')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with TeensyEmulator(args.latency,args.baudrate or None,args.move_time) as emu:
+        logger.info('Teensy emulator on %s'%emu.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
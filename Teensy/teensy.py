@@ -5,15 +5,18 @@ http://assets.newport.com/webDocuments-EN/images/15224.pdf
 page 47
 '''
 class teensy:
-    def __init__(self,baudrate=9600):
-        ui = None  # add your unique identifier! format: '0000:0000'
-        if not ui:
-            raise FilterWheelIOError('No unique identifier set')
-        port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
-        if not len(port)==1:
-            raise FilterWheelIOError('Found %i ports matching the unique identifier'%len(port))
-
-        self.serial = serial.Serial(port[0],baudrate,timeout=3)
+    def __init__(self,baudrate=9600,port=None):
+        # port: serial device to use instead of searching by unique identifier (e.g. Teensy/emulator.py)
+        if port is None:
+            ui = None  # add your unique identifier! format: '0000:0000'
+            if not ui:
+                raise FilterWheelIOError('No unique identifier set')
+            port = [port.device for port in list_ports.comports() if ui in port.usb_info()]
+            if not len(port)==1:
+                raise FilterWheelIOError('Found %i ports matching the unique identifier'%len(port))
+            port = port[0]
+
+        self.serial = serial.Serial(port,baudrate,timeout=3)
 
     # General methods for the server class
     def __enter__(self):
@@ -28,7 +31,7 @@ class teensy:
     # Specific methods to talk to the Teensy
 
     def idn(self):
-        self.serial.write('^')
+        self.serial.write(b'^')
 
     def change_filter(self, filter):
         try:
@@ -37,14 +40,14 @@ class teensy:
             raise IncorrectInputError('Expected a string with an integer filter number')
         if filter_number not in list(range(1, 7)):
             raise IncorrectInputError('Not in the range [1, 6]')
-        self.serial.write('*' + filter)
+        self.serial.write(('*' + str(filter)).encode())
         # '*' tells the Teensy we're starting to send a motor command. 
         # So we should send something like '*4' to tell the motor to turn to 
         # filter position 4.
 
     def get_filter(self):
-        self.serial.write('@') # '@' tells the Teensy to return the filter position
-        r = self.serial.readline().strip()
+        self.serial.write(b'@') # '@' tells the Teensy to return the filter position
+        r = self.serial.readline().strip().decode()
         if r == '-1':
             raise UnknownPositionError('Position of wheel has not been calibrated. Please reset first.')
         elif r == '0':
@@ -53,11 +56,11 @@ class teensy:
             return r
 
     def reset(self): # '!' tells the Teensy to run the reset operation
-        self.serial.write('!')
+        self.serial.write(b'!')
 
     def check_position_state(self): 
-        self.serial.write('?')
-        r = self.serial.readline().strip()
+        self.serial.write(b'?')
+        r = self.serial.readline().strip().decode()
         return r
         # '?' queries the Teensy to see if the wheel knows where it is (i.e. if a reset
         # operation has already been conducted on the Teensy or not)
@@ -76,7 +79,7 @@ class teensy:
         if out_number not in [0, 1]:
             raise IncorrectInputError('Expected either a string "1" (high) or "0" (low)')
 
-        self.serial.write('#' + pin + ';' + out)
+        self.serial.write(('#' + str(pin) + ';' + str(out)).encode())
 
         # Inputs: pin is a string with a valid pin number, e.g. '12'
         # out is a string with a valid output, either '0' (low) or '1' (high)
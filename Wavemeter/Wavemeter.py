@@ -1,8 +1,8 @@
 from ctypes import *
-import logging, re, time, os, subprocess
-from functools import lru_cache
+import logging, re, time, os, subprocess, threading, queue, base64
 from types import FunctionType
-import time
+import numpy as np
+from Wavemeter import servo
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,14 @@ c_dref = c_double
 c_LONG_PTR = c_long
 c_unsigned_short = c_ushort
 
+C_NM_THZ = 299792.458 # Speed of light (nm*THz); frequency = C_NM_THZ/vacuum wavelength
+
+# void CallbackProcEx(long Ver, long Mode, long IntVal, double DblVal, long Res1)
+try:
+    CallbackProcEx = WINFUNCTYPE(None,c_long,c_long,c_long,c_double,c_long)
+except NameError: # Not on windows (e.g. fake_wlm backend)
+    CallbackProcEx = CFUNCTYPE(None,c_long,c_long,c_long,c_double,c_long)
+
 def check_proc_status(target):
     out = subprocess.check_output(['tasklist']).decode('utf-8')
     for line in out.split(os.linesep):
@@ -25,6 +33,58 @@ def check_proc_status(target):
             return True
     return False
 
+class RingBuffer:
+    # Fixed-size timestamped history for one channel (oldest samples overwritten).
+    # Every sample is kept, equal values included; only a repeated read of the same
+    # measurement (same stamp, e.g. the WLM timestamp of a callback) is skipped.
+    # Error codes (<= 0, e.g. -3 under or -4 over exposed) are not samples: the last one
+    # is kept in error (cleared by the next valid sample) so readers still see it.
+    # checked is the last time the source was read.
+    def __init__(self,size):
+        self.size = int(size)
+        self.t = np.full(self.size,np.nan)
+        self.value = np.full(self.size,np.nan)
+        self.count = 0     # Total samples ever appended
+        self.checked = 0   # time.time() of last read from the source
+        self.stamp = None  # Measurement identity of the last sample (None: unknown)
+        self.error = None  # Error code of the last read if it failed, else None
+
+    def append(self,t,value,stamp=None):
+        self.checked = t
+        if value <= 0:
+            self.error = value
+            return False
+        self.error = None
+        if stamp is not None and self.count and stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        i = self.count%self.size
+        self.t[i] = t
+        self.value[i] = value
+        self.count += 1
+        return True
+
+    def latest(self):
+        # Returns (t, value) of the most recent sample or None if empty
+        if not self.count:
+            return None
+        i = (self.count-1)%self.size
+        return (self.t[i],self.value[i])
+
+    def current(self):
+        # Latest value, or the error code if the last read failed; None if nothing yet
+        if self.error is not None:
+            return self.error
+        latest = self.latest()
+        return None if latest is None else latest[1]
+
+    def history(self):
+        # Returns copies of (t, value) in chronological order
+        if self.count <= self.size:
+            return self.t[:self.count].copy(),self.value[:self.count].copy()
+        i = self.count%self.size
+        return np.roll(self.t,-i),np.roll(self.value,-i)
+
 class wavemeter:
     # Make sure to call using python's with syntax:
     #
@@ -39,20 +99,127 @@ class wavemeter:
     #   ERRORS -> dictionary with all possible error values
     # Instance  Properties
     #   lib -> handle to loaded DLL
+    #
+    # Sampler (opt-in): a background thread reads GetWavelengthNum for every channel in
+    # use into per-channel RingBuffers. While running, GetWavelengthNum/GetFrequencyNum
+    # answer from the latest sample; an optional extra argument (ms) requests a sample
+    # fresher than that, waiting for the next sweep if necessary. Polling gives no
+    # measurement identity, so every sweep is a sample: history is the WLM reading sampled
+    # (and held) at the sampler period.
+    #
+    # Callback mode (opt-in, alternative to the sampler): registers CallbackProcEx through
+    # Instantiate(cInstNotification,...) so the WLM pushes each measurement as it is made.
+    # The DLL thread only enqueues (never blocks); a consumer thread fills the same buffers.
+    #
+    # History (needs sampler or callback running): GetHistory, GetStatistics and
+    # GetAllanDeviation work on the last `window` seconds of a channel's buffer.
+    #
+    # Servo: StartServo locks a channel by driving an actuator of another module loaded
+    # in this hwserver (see servo.ACTUATORS); SetServo/ServoStatus/StopServo manage it.
 
     DLLpath = None #path to DLL. r'C:/Path/to/wlmData.dll' 
     HeaderPath = None #path to header file. r'C:/Path/to/wlmData.h'
+    LibraryLoader = None # callable(DLLpath) returning the library; windll.LoadLibrary if None (see fake_wlm.py)
+    SamplerPeriod = None # seconds between sampler sweeps; set (e.g. 0.005) to start sampler on init
+    SamplerDepth = 10000 # samples kept per channel
+    SummaryMaxAge = 0 # seconds a GetSummary snapshot may be reused (concurrent callers always share a sweep)
+    PIDSettings = {'cmiPID_P':[1034,1],  # [value, placement]
+                   'cmiPID_T':[1033,1],
+                   'cmiPID_I':[1035,1],
+                   'cmiPID_dt':[1060,1],
+                   'cmiPID_D':[1036,1],
+                   'cmiDeviation-SensitivityFactor':[1037,1],
+                   'cmiDeviationUnit':[1041,0],
+                   'cmiDeviation-SensitivityDim':[1040,0],
+                   'cmiPID_AutoClearHistory':[1061,0],
+                   'cmiPIDUseTa':[1031,0],
+                   'cmiPIDConstdt':[1059,0],
+                   'cmiDeviationPolartiy':[1038,0],
+                   'cmiDeviationChannel':[1063,0],
+                   'all':[-1,-1]}
+    CallbackQueueSize = 10000 # notifications buffered between DLL thread and consumer (excess dropped)
 
     def __init__(self):
-        self.lib = windll.LoadLibrary(wavemeter.DLLpath)
-        # Load all of header file to memory
+        self.lib = (wavemeter.LibraryLoader or windll.LoadLibrary)(wavemeter.DLLpath)
+        # Parse header file once into the binding/error tables (header text is not kept)
         with open(wavemeter.HeaderPath,'rt') as f:
-            self.header = f.read().split('\n')
+            self._parseHeader(f.read().split('\n'))
+        self._samples = {}  # {channel: RingBuffer}
+        self._samplesCond = threading.Condition()
+        self._sampler = None  # (thread, stop event, period)
+        self._callback = None # (consumer thread, queue, CallbackProcEx ref, stats)
+        self._servo = None
+        self._summary = (0,None,None) # (sweep start time, output, error) of the last sweep
+        self._summaryCond = threading.Condition()
+        self._summarySweeping = False # A sweep is in progress (its callers wait on _summaryCond)
+        self._summarySweeps = 0       # Completed (or failed) sweeps
+        self._summaryRefs = (c_lref(0),c_lref(0),c_lref(0),c_dref(0)) # [use, show, iSet, dSet]
         # Startup WLM
         try:
             self.launchWLM()
         except: # Make non fatal error
             logger.exception('Failed to launch WLM')
+        if wavemeter.SamplerPeriod:
+            self.StartSampler(wavemeter.SamplerPeriod)
+
+    def _parseHeader(self,header):
+        # Builds:
+        #   self._bindings -> {fn: (restype str, [argtype str], ctypes function or None)}
+        #   self._errorBlocks -> [(comment line, {code: name})] in header order
+        #   self._errorMaps -> {fn: {code: name}} filled lazily by getError
+        #   self._constants -> {name: int} from "const int name = value;" lines
+        # Functions are bound through self.lib[fn] so each gets its own function
+        # object; custom methods using self.lib.fn (byref arguments) are unaffected.
+        regex = r"^\s\w+\(([\w ]+)\)\s+(\w+)\((.*?)\)\s+\;$"
+        self._bindings = {}
+        for ln in header:
+            if len(ln)==0 or ln[0]!='\t': continue
+            match = re.match(regex,ln,re.DOTALL)
+            if not match: continue
+            groups = match.groups()
+            fn_str = groups[1]
+            if fn_str in self._bindings: continue  # First declaration wins
+            out = groups[0].replace(' ','_')
+            inp = ['_'.join(inp.strip().split(' ')[0:-1]) for inp in groups[2].split(',') if inp.strip() not in ['','void']]
+            self._bindings[fn_str] = (out,inp,self._bind(fn_str,out,inp))
+        self._constants = {}
+        for ln in header:
+            match = re.match(r"^\s*const\s+int\s+(\w+)\s*=\s*([-+]?\w+)\s*;",ln)
+            if not match: continue
+            (name,val) = match.groups()
+            try:
+                self._constants[name] = int(val,0) if val.lower().startswith(('0x','-0x')) else int(val)
+            except ValueError: # Defined in terms of another constant
+                if val in self._constants:
+                    self._constants[name] = self._constants[val]
+        regex = r"^\s\w+\s\w+\s(\w+)[\s=]+([-+0-9]+)"
+        self._errorBlocks = []
+        for i,ln in enumerate(header):
+            if len(ln)>=2 and ln[0:2]=='//':
+                codes = {}
+                i += 1 # Error values start on next line
+                while i < len(header) and len(header[i])>0 and header[i][0]=='\t':
+                    match = re.match(regex,header[i],re.DOTALL)
+                    if match:
+                        codes.setdefault(int(match.groups()[1]),match.groups()[0])
+                    i += 1
+                self._errorBlocks.append((ln,codes))
+        self._errorMaps = {}
+
+    def _bind(self,fn_str,out,inp):
+        # Returns ctypes function with restype/argtypes set, or None if it can't be bound
+        try:
+            fn = self.lib[fn_str]
+        except AttributeError:
+            logger.debug('%s declared in header but not found in DLL'%fn_str)
+            return None
+        try:
+            fn.restype = None if out == 'void' else globals()['c_%s'%out]
+            fn.argtypes = [globals()['c_%s'%i] for i in inp]
+        except KeyError as err:
+            logger.debug('%s has unsupported type %s'%(fn_str,err))
+            return None
+        return fn
 
     def __enter__(self):
         return self
@@ -72,56 +239,47 @@ class wavemeter:
         self.SendCommand('','ControlWLM',3,0,0)
 
     def _Close(self):
-        windll.kernel32.FreeLibrary.argtypes = [c_void_p]
-        windll.kernel32.FreeLibrary(self.lib._handle)
+        self.StopServo()
+        self.StopSampler()
+        self.StopCallback()
+        if wavemeter.LibraryLoader is None:
+            windll.kernel32.FreeLibrary.argtypes = [c_void_p]
+            windll.kernel32.FreeLibrary(self.lib._handle)
+        elif hasattr(self.lib,'close'):
+            self.lib.close()
         del(self.lib)
         error = 0
         return error,None
 
-    @lru_cache(maxsize=256) # This is a global cache for all instances (fine for this implementation)
     def getError(self,fn,out):
         fn = fn.replace('Num','')
         if len(fn)>=3 and fn[0:3].lower()=='set':
             fn = 'ResultError'
-        regex = r"^\s\w+\s\w+\s(\w+)[\s=]+([-+0-9]+)"
-        found = False
-        for i,ln in enumerate(self.header):
-            if len(ln)>=2 and ln[0:2]=='//' and fn in ln:
-                found = True
-                break
-        if found:
-            i += 1 # Error values start on next line
-            out = str(int(out))
-            while len(self.header[i])>0 and self.header[i][0]=='\t':
-                if out in self.header[i]:
-                    matches = re.finditer(regex,self.header[i],re.DOTALL)
-                    try:
-                        match = next(matches)
-                        return WavemeterDLLError(match.groups()[0])
-                    except:
-                        continue
-                i += 1
-        return WavemeterDLLError('Code: %s'%out)
+        codes = self._errorMaps.get(fn)
+        if codes is None:
+            codes = next((codes for ln,codes in self._errorBlocks if fn in ln),{})
+            self._errorMaps[fn] = codes
+        out = int(out)
+        if out in codes:
+            return WavemeterDLLError(codes[out])
+        return WavemeterDLLError('Code: %i'%out)
 
-    @lru_cache(maxsize=256) # This is a global cache for all instances (fine for this implementation)
     def getPrototype(self,fn):
-        regex = r"^\s\w+\(([\w ]+)\)\s+(\w+)\((.*?)\)\s+\;$"
-        found = False
-        for ln in self.header:
-            if len(ln)>0 and ln[0]=='\t' and fn in ln:
-                found = True
-                break
-        assert found, WavemeterDLLError('%s not found in header!'%fn)
-        matches = re.finditer(regex,ln,re.DOTALL)
-        try:
-            match = next(matches)
-        except:
-            raise WavemeterDLLError('regex failed: %s'%ln.strip())
-        groups = match.groups()
-        out = groups[0].replace(' ','_')
-        inp = ['_'.join(inp.strip().split(' ')[0:-1]) for inp in groups[2].split(',')]
+        if fn not in self._bindings:
+            raise WavemeterDLLError('%s not found in header!'%fn)
+        (out,inp,_) = self._bindings[fn]
         return (out,inp)
 
+    def _getFunction(self,fn_str):
+        # Single dict lookup on the hot path; binding errors surface here
+        binding = self._bindings.get(fn_str)
+        if binding is None:
+            raise WavemeterDLLError('%s not found in header!'%fn_str)
+        fn = binding[2]
+        if fn is None:
+            raise WavemeterDLLError('%s could not be bound (missing from DLL or unsupported type)'%fn_str)
+        return fn
+
     def GetVersion(self):
         ver = self.lib.GetWLMVersion(0)
         return ver
@@ -140,16 +298,11 @@ class wavemeter:
         elif 'GetFrequency' in fn_str or 'GetWavelength' in fn_str:
             return self.GetMeasurement(fn_str,*args)
 
-        if fn_str in [x for x, y in wavemeter.__dict__.items() if type(y) == FunctionType]:
+        if type(wavemeter.__dict__.get(fn_str)) == FunctionType:
             # Means function overloaded in this class
             return getattr(self,fn_str)(*args)
-        [out,inp] = self.getPrototype(fn_str)
-        fn = getattr(self.lib,fn_str)
-        fn.restype = eval('c_%s'%out)  # this could fail if custom data type...
-        fn.argtypes = [eval('c_%s'%i) for i in inp]
-        response = fn(*args)
+        response = self._getFunction(fn_str)(*args)
         if type(response) in [float,int] and response < 0 and 'getdeviationsignal' not in fn_str.lower() and 'return_error' not in kwargs.keys():
-            error = self.getError(fn_str,response)
             raise self.getError(fn_str,response)  # Will return error
         return response
 
@@ -160,33 +313,424 @@ class wavemeter:
         # -2: High Signal
         # -3: Out of Range
         # Try for 1 second max if no value
+        # GetWavelengthNum/GetFrequencyNum accept an optional 3rd arg: max sample age (ms)
+        max_age = None
+        if fn_str in ['GetWavelengthNum','GetFrequencyNum']:
+            if len(args) > 2:
+                max_age = float(args[2])/1000
+                args = args[0:2]
+            if self._sampler or self._callback:
+                response = self._latestSample(int(args[0]),max_age)
+                if response is not None:
+                    if fn_str == 'GetFrequencyNum' and response > 0:
+                        return C_NM_THZ/response
+                    return response
         response = 0
+        fn = self._getFunction(fn_str)
         tstart = time.time()
         while response == 0:
-            [out,inp] = self.getPrototype(fn_str)
-            fn = getattr(self.lib,fn_str)
-            fn.restype = eval('c_%s'%out)
-            fn.argtypes = [eval('c_%s'%i) for i in inp]
             response = fn(*args)
             if time.time() - tstart > 1.0: break # timeout
+            if response == 0: time.sleep(0.001)  # Don't hog the GIL while waiting
         return response
 
-    def GetSummary(self):
-        # Output: 'ch,wavelength,PID;ch,wavelength,PID;...'
-        if not self.SendCommand('','GetSwitcherMode',0):
+    # Sampler
+    def _record(self,ch,value,t,stamp=None):
+        # Must hold self._samplesCond; stamp identifies the measurement if the source says
+        buf = self._samples.get(ch)
+        if buf is None:
+            buf = self._samples[ch] = RingBuffer(self.SamplerDepth)
+        if value == 0:  # No value; nothing new measured
+            buf.checked = t
+            return False
+        return buf.append(t,value,stamp)
+
+    def _latestSample(self,ch,max_age=None,timeout=1.0):
+        # Returns latest wavelength (or error code) for ch; None if the channel is not
+        # sampled or no sample fresher than max_age (s) arrives within timeout
+        def fresh():
+            buf = self._samples.get(ch)
+            return buf is not None and buf.current() is not None and \
+                (max_age is None or time.time() - buf.checked <= max_age)
+        with self._samplesCond:
+            if ch not in self._samples:
+                return None
+            if not fresh() and not self._samplesCond.wait_for(fresh,timeout):
+                return None
+            return float(self._samples[ch].current())
+
+    def _sampleLoop(self,period,stop):
+        fn = self._getFunction('GetWavelengthNum')
+        channels = []
+        trefresh = 0
+        while not stop.is_set():
+            tstart = time.time()
+            if tstart - trefresh > 1.0: # Pick up channels (un)marked in use by clients
+                try:
+                    channels = [x['channel'] for x in self.GetSwitcherSignalStates('all') if x['use']] or [1]
+                except Exception:
+                    logger.exception('Sampler failed to read switcher states')
+                    channels = channels or [1]
+                trefresh = tstart
+            try:
+                values = [fn(ch,0) for ch in channels]
+            except Exception:
+                logger.exception('Sampler failed to read wavelengths')
+                stop.wait(1.0)
+                continue
+            t = time.time()
+            with self._samplesCond:
+                for ch,value in zip(channels,values):
+                    self._record(ch,value,t)
+                self._samplesCond.notify_all()
+            stop.wait(max(0,period - (time.time()-tstart)))
+
+    def StartSampler(self,period=0.005,depth=None):
+        # period in seconds between sweeps of all channels in use
+        self.StopSampler()
+        self.StopCallback()
+        if depth:
+            self.SamplerDepth = int(depth)
+        with self._samplesCond:
+            self._samples = {}
+        stop = threading.Event()
+        thread = threading.Thread(target=self._sampleLoop,args=(float(period),stop),daemon=True,name='wavemeter sampler')
+        self._sampler = (thread,stop,float(period))
+        thread.start()
+        logger.info('Started wavemeter sampler (%g s period)'%float(period))
+
+    def StopSampler(self):
+        if self._sampler:
+            (thread,stop,_) = self._sampler
+            self._sampler = None
+            stop.set()
+            thread.join()
+            logger.info('Stopped wavemeter sampler')
+
+    def SamplerStatus(self):
+        with self._samplesCond:
+            channels = {ch:{'samples':min(buf.count,buf.size),'age':time.time()-buf.checked}
+                        for ch,buf in self._samples.items()}
+        return {'running': self._sampler is not None and self._sampler[0].is_alive(),
+                'period': self._sampler[2] if self._sampler else None,
+                'depth': self.SamplerDepth,
+                'channels': channels}
+
+    # Callback (event-driven) mode
+    def _constant(self,name):
+        if name not in self._constants:
+            raise WavemeterDLLError('%s not found in header!'%name)
+        return self._constants[name]
+
+    def _callbackModes(self):
+        # {cmiWavelengthN: N} plus cmiSwitcherChannel (mapped to None)
+        modes = {}
+        for name,val in self._constants.items():
+            match = re.match(r"^cmiWavelength(\d+)$",name)
+            if match:
+                modes[val] = int(match.groups()[0])
+        if not modes:
+            raise WavemeterDLLError('No cmiWavelength constants found in header!')
+        if 'cmiSwitcherChannel' in self._constants:
+            modes[self._constants['cmiSwitcherChannel']] = None
+        return modes
+
+    def _notify(self,events,modes,stats,ver,mode,intval,dblval,res1):
+        # Runs on the DLL thread: filter and enqueue only, never block
+        if mode in modes:
+            try:
+                events.put_nowait((time.time(),mode,intval,dblval))
+            except queue.Full:
+                stats['dropped'] += 1
+
+    def _callbackLoop(self,events,modes,stats):
+        switcher = None  # Current switcher channel (cmiSwitcherChannel notifications)
+        done = False
+        while not done:
+            batch = [events.get()]
+            while batch[-1] is not None:  # Drain whatever else is waiting into one locked update
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            with self._samplesCond:
+                for (t,mode,intval,dblval) in batch:
+                    ch = modes[mode]
+                    if ch is None:
+                        switcher = intval
+                        continue
+                    if ch == 1 and switcher:  # Switcher mode reports all channels as cmiWavelength1
+                        ch = switcher
+                    self._record(ch,dblval,t,intval)  # intval: WLM timestamp (ms) of the measurement
+                    stats['events'] += 1
+                self._samplesCond.notify_all()
+
+    def StartCallback(self,depth=None):
+        # Install CallbackProcEx; measurements are pushed into the sample buffers
+        self.StopCallback()
+        self.StopSampler()
+        if depth:
+            self.SamplerDepth = int(depth)
+        modes = self._callbackModes()
+        events = queue.Queue(maxsize=wavemeter.CallbackQueueSize)
+        stats = {'events':0,'dropped':0}
+        with self._samplesCond:
+            self._samples = {}
+        callback = CallbackProcEx(lambda *args: self._notify(events,modes,stats,*args))
+        thread = threading.Thread(target=self._callbackLoop,args=(events,modes,stats),daemon=True,name='wavemeter callback')
+        thread.start()
+        fn = self.lib['Instantiate']  # Own function object; P1 is a pointer here
+        fn.restype = c_void_p
+        fn.argtypes = [c_long,c_long,c_void_p,c_long]
+        try:
+            fn(self._constant('cInstNotification'),self._constant('cNotifyInstallCallbackEx'),callback,0)
+        except:
+            events.put(None)
+            thread.join()
+            raise
+        self._callback = (thread,events,callback,stats)
+        logger.info('Installed wavemeter callback')
+
+    def StopCallback(self):
+        if self._callback:
+            (thread,events,callback,stats) = self._callback
+            self._callback = None
+            fn = self.lib['Instantiate']
+            fn.restype = c_void_p
+            fn.argtypes = [c_long,c_long,c_void_p,c_long]
+            try:
+                fn(self._constant('cInstNotification'),self._constant('cNotifyRemoveCallback'),None,0)
+            finally:
+                events.put(None)
+                thread.join()
+            logger.info('Removed wavemeter callback (%i events, %i dropped)'%(stats['events'],stats['dropped']))
+
+    def CallbackStatus(self):
+        with self._samplesCond:
+            channels = {ch:{'samples':min(buf.count,buf.size),'age':time.time()-buf.checked}
+                        for ch,buf in self._samples.items()}
+        return {'running': self._callback is not None and self._callback[0].is_alive(),
+                'events': self._callback[3]['events'] if self._callback else 0,
+                'dropped': self._callback[3]['dropped'] if self._callback else 0,
+                'depth': self.SamplerDepth,
+                'channels': channels}
+
+    # History and statistics
+    def _window(self,ch,window=None,quantity='wavelength'):
+        # Returns (t, value) of valid samples in the last window seconds (all if None)
+        assert quantity in ['wavelength','frequency'], 'quantity must be "wavelength" or "frequency"'
+        with self._samplesCond:
+            buf = self._samples.get(int(ch))
+            if buf is None:
+                raise Exception('No history for channel %i; start the sampler (StartSampler) or callback (StartCallback) first.'%int(ch))
+            (t,value) = buf.history()
+        mask = value > 0  # Drop error codes
+        if window is not None:
+            mask &= t >= time.time() - float(window)
+        (t,value) = (t[mask],value[mask])
+        if quantity == 'frequency':
+            value = C_NM_THZ/value
+        return t,value
+
+    def GetHistory(self,ch,window=None,quantity='wavelength',encoding='list'):
+        # Raw samples as one array: rows of [t-t0 (s), value]
+        # encoding: "list" (nested lists) or "base64" (little-endian float64, row major)
+        assert encoding in ['list','base64'], 'encoding must be "list" or "base64"'
+        (t,value) = self._window(ch,window,quantity)
+        t0 = t[0] if len(t) else time.time()
+        samples = np.column_stack((t-t0,value))
+        if encoding == 'base64':
+            samples = base64.b64encode(samples.astype('<f8').tobytes()).decode('ascii')
+        else:
+            samples = samples.tolist()
+        return {'channel':int(ch),'quantity':quantity,'t0':t0,'n':len(t),'encoding':encoding,'samples':samples}
+
+    def GetStatistics(self,ch,window=10,quantity='wavelength'):
+        # mean, std, min, max and linear drift (units/s) over the last window seconds
+        # Every recorded sample counts once (each sweep of the sampler, each measurement
+        # delivered by the callback), repeated values included.
+        (t,value) = self._window(ch,window,quantity)
+        out = {'channel':int(ch),'quantity':quantity,'n':len(t),'span':None,
+               'mean':None,'std':None,'min':None,'max':None,'drift':None}
+        if len(t) == 0:
+            return out
+        out.update(span=float(t[-1]-t[0]),mean=float(value.mean()),std=float(value.std()),
+                   min=float(value.min()),max=float(value.max()))
+        if len(t) > 1 and t[-1] > t[0]:
+            dt = t - t.mean()
+            out['drift'] = float(np.dot(dt,value-out['mean'])/np.dot(dt,dt))
+        return out
+
+    def GetAllanDeviation(self,ch,window=10,taus=None,quantity='wavelength'):
+        # Overlapping Allan deviation of the samples in the last window seconds.
+        # The samples are resampled (holding the latest value) onto a uniform grid of
+        # tau0 = median sample interval, so jittered or irregular arrivals are not treated
+        # as evenly spaced.
+        # taus: list of averaging times (s); octave spacing up to half the record if None
+        (t,value) = self._window(ch,window,quantity)
+        if len(value) < 3:
+            return {'channel':int(ch),'quantity':quantity,'n':len(value),'tau0':None,'tau':[],'adev':[]}
+        tau0 = float(np.median(np.diff(t)))
+        if tau0 <= 0:
+            tau0 = float((t[-1]-t[0])/(len(t)-1)) or 1.0
+        grid = t[0] + tau0*np.arange(int((t[-1]-t[0])/tau0)+1)
+        value = value[np.searchsorted(t,grid,side='right')-1]
+        N = len(value)
+        if N < 3:
+            return {'channel':int(ch),'quantity':quantity,'n':N,'tau0':tau0,'tau':[],'adev':[]}
+        if taus is None:
+            m = 2**np.arange(int(np.log2(N//2))+1)
+        else:
+            m = np.unique(np.maximum(1,np.round(np.asarray(taus,dtype=float)/tau0).astype(int)))
+            m = m[m <= N//2]
+        c = np.concatenate(([0],np.cumsum(value-value.mean())))
+        adev = []
+        for mi in m:
+            avg = (c[mi:]-c[:-mi])/mi    # Averages over mi samples starting at each index
+            d = avg[mi:]-avg[:-mi]
+            adev.append(float(np.sqrt(0.5*np.mean(d**2))))
+        return {'channel':int(ch),'quantity':quantity,'n':N,'tau0':tau0,
+                'tau':(m*tau0).tolist(),'adev':adev}
+
+    # Servo
+    def _servoReader(self,ch,quantity):
+        # Returns measure() for servo.Servo: newest valid value or None if nothing new
+        assert quantity in ['wavelength','frequency'], 'quantity must be "wavelength" or "frequency"'
+        last = [0]
+        def measure():
+            if self._sampler or self._callback:
+                with self._samplesCond:
+                    buf = self._samples.get(ch)
+                    if buf is None or buf.count == last[0]:
+                        return None
+                    last[0] = buf.count
+                    value = buf.latest()[1]
+            else:
+                value = self.GetMeasurement('GetWavelengthNum',ch,0)
+            if value <= 0:
+                return None
+            return C_NM_THZ/value if quantity == 'frequency' else value
+        return measure
+
+    def StartServo(self,ch,setpoint,target,P=0,I=0,D=0,rate=50,quantity='frequency',output=None):
+        # Lock channel ch to setpoint (THz or nm per quantity) by writing target at rate Hz.
+        # target is a servo.ACTUATORS name (e.g. "solstis.set_resonator_val"); the output
+        # starts from the actuator's current value, else output, else mid range.
+        rate = servo.check_rate(rate)
+        self.StopServo()
+        (actuate,current,limits) = servo.resolve(target)
+        if output is None:
+            output = current if current is not None else sum(limits)/2.0
+        self._servo = servo.Servo(self._servoReader(int(ch),quantity),actuate,setpoint,output,limits,
+                                  P=P,I=I,D=D,rate=rate)
+        self._servo.channel = int(ch)
+        self._servo.target = target
+        self._servo.start()
+        logger.info('Started servo on channel %i driving %s'%(int(ch),target))
+
+    def SetServo(self,prop,value):
+        # prop: setpoint, P, I, D, rate, limits ([min, max]), slew, tolerance or lock_cycles
+        if not self._servo:
+            raise servo.ServoError('Servo is not running.')
+        self._servo.set(prop,value)
+
+    def ServoStatus(self):
+        if not self._servo:
+            return {'running': False}
+        out = self._servo.status()
+        out.update(channel=self._servo.channel,target=self._servo.target)
+        return out
+
+    def StopServo(self):
+        if self._servo:
+            self._servo.stop()
+            self._servo = None
+            logger.info('Stopped servo')
+
+    def GetSummary(self,max_age=None):
+        # Output: [{'channel','PIDstatus','wavelength'},...] for channels in use
+        # Callers arriving during a sweep share its result; a snapshot younger than
+        # max_age seconds (default SummaryMaxAge) is returned without touching the WLM.
+        max_age = wavemeter.SummaryMaxAge if max_age is None else float(max_age)
+        with self._summaryCond:
+            if self._summarySweeping:  # Wait for the sweep in progress and share it
+                sweeps = self._summarySweeps
+                self._summaryCond.wait_for(lambda: self._summarySweeps != sweeps)
+                (tsweep,out,err) = self._summary
+                if err is not None:
+                    raise err
+                return [dict(x) for x in out]
+            (tsweep,out,err) = self._summary
+            if out is not None and time.time() - tsweep <= max_age:
+                return [dict(x) for x in out]
+            self._summarySweeping = True
+        tsweep = time.time()
+        (out,err) = (None,None)
+        try:
+            out = self._summarySweep()
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            with self._summaryCond:
+                self._summary = (tsweep,out,err)
+                self._summarySweeping = False
+                self._summarySweeps += 1
+                self._summaryCond.notify_all()
+        return [dict(x) for x in out]
+
+    def _summarySweep(self):
+        # One pass over switcher states, PID channel settings and wavelengths
+        # reusing the same out-parameters (only one runs at a time, see GetSummary)
+        (use,show,iSet,dSet) = self._summaryRefs
+        response = self._getFunction('GetSwitcherMode')(0)
+        if response < 0:
+            raise self.getError('GetSwitcherMode',response)
+        if not response:
             raise Exception('Not in switcher mode.')
-        SwitchStates = self.GetSwitcherSignalStates('all')
-        channels = [x['channel'] for x in SwitchStates if x['use']] # indexed from 1
-        GlobalPID = self.SendCommand('','GetDeviationMode',0)
+        states = self.lib.GetSwitcherSignalStates
+        channels = [] # indexed from 1
+        for ch in range(1,9):
+            states(ch,byref(use),byref(show))
+            if use.value:
+                channels.append(ch)
+        GlobalPID = self._getFunction('GetDeviationMode')(0)
+        (PS,pos) = wavemeter.PIDSettings['cmiDeviationChannel']
+        pid = self.lib.GetPIDSetting
+        wavelengths = self._summaryWavelengths(channels)
         out = []
-        for i in channels:
+        for ch in channels:
+            PIDstatus = GlobalPID
+            if GlobalPID:
+                pid(PS,ch,byref(iSet),byref(dSet))
+                PIDstatus = [{'prop':'cmiDeviationChannel','val':[iSet,dSet][pos].value}]
             out.append({
-                        'channel':i,
-                        'PIDstatus': GlobalPID and self.SendCommand('','GetPIDSetting','cmiDeviationChannel',i),
-                        'wavelength': self.SendCommand('','GetWavelengthNum',i,0,return_error=True)
+                        'channel':ch,
+                        'PIDstatus': PIDstatus,
+                        'wavelength': wavelengths[ch]
                         })
         return out
 
+    def _summaryWavelengths(self,channels):
+        # Latest samples if ingesting, else one DLL pass retrying only channels
+        # without a value (same 1 s limit as GetMeasurement)
+        out = {}
+        if self._sampler or self._callback:
+            out = {ch:self._latestSample(ch,timeout=0) for ch in channels}
+        fn = self._getFunction('GetWavelengthNum')
+        pending = [ch for ch in channels if out.get(ch) is None]
+        tstart = time.time()
+        while pending:
+            for ch in pending:
+                out[ch] = fn(ch,0)
+            pending = [ch for ch in pending if out[ch] == 0]
+            if time.time() - tstart > 1.0: break # timeout
+            if pending: time.sleep(0.001)
+        return out
+
     def GetSwitcherSignalStates(self,ch):
         if 'all' == ch:
             chs = [1,2,3,4,5,6,7,8]
@@ -204,20 +748,7 @@ class wavemeter:
         return out
 
     def PIDSetting(self,fn_str,*args):
-        PS = {'cmiPID_P':[1034,1],  # [value, placement]
-              'cmiPID_T':[1033,1],
-              'cmiPID_I':[1035,1],
-              'cmiPID_dt':[1060,1],
-              'cmiPID_D':[1036,1],
-              'cmiDeviation-SensitivityFactor':[1037,1],
-              'cmiDeviationUnit':[1041,0],
-              'cmiDeviation-SensitivityDim':[1040,0],
-              'cmiPID_AutoClearHistory':[1061,0],
-              'cmiPIDUseTa':[1031,0],
-              'cmiPIDConstdt':[1059,0],
-              'cmiDeviationPolartiy':[1038,0],
-              'cmiDeviationChannel':[1063,0],
-              'all':[-1,-1]}
+        PS = wavemeter.PIDSettings
         assert len(args) in [2,3], Exception('PIDSetting requires 2 input argument for getting and 3 for setting.')
         assert args[0] in PS, Exception('%s is not an option for PIDSetting (case sensitive). Options: %s'%(args[0],', '.join(PS.keys())))
         fn = getattr(self.lib,fn_str)
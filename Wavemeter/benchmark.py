@@ -0,0 +1,47 @@
+import argparse, time
+from benchmark_tools import run, report, header
+from Wavemeter import fake_wlm
+from Wavemeter.Wavemeter import wavemeter
+
+# Calls/second and per-call latency of the wavemeter entry points against fake_wlm.
+#
+# python -m Wavemeter.benchmark --latency 0.0001 --calls 2000
+
+def entry_points(w):
+    # name: call
+    return [
+        ('SendCommand GetSwitcherMode', lambda: w.SendCommand('','GetSwitcherMode',0)),
+        ('GetMeasurement GetWavelengthNum', lambda: w.SendCommand('','GetWavelengthNum',1,0)),
+        ('GetMeasurement GetFrequencyNum', lambda: w.SendCommand('','GetFrequencyNum',1,0)),
+        ('GetSummary', lambda: w.GetSummary()),
+        ('GetSwitcherSignalStates all', lambda: w.SendCommand('','GetSwitcherSignalStates','all')),
+        ('PIDSetting get', lambda: w.SendCommand('','GetPIDSetting','cmiPID_P',1)),
+        ('PIDSetting set', lambda: w.SendCommand('','SetPIDSetting','cmiDeviationChannel',1,1)),
+        ('PIDCourse get', lambda: w.SendCommand('','GetPIDCourseNum',1,0)),
+        ('PIDCourse set', lambda: w.SendCommand('','SetPIDCourseNum',1,'470.52')),
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark wavemeter entry points on the simulated WLM.')
+    parser.add_argument('--calls',type=int,default=1000,help='maximum calls per entry point')
+    parser.add_argument('--duration',type=float,default=2.0,help='maximum seconds per entry point')
+    parser.add_argument('--latency',type=float,default=0,help='simulated seconds per DLL call')
+    parser.add_argument('--noise',type=float,default=1e-5,help='simulated wavelength noise (nm)')
+    parser.add_argument('--sampler',type=float,default=None,help='also run with the sampler at this period (s)')
+    args = parser.parse_args()
+
+    fake_wlm.install(latency=args.latency,noise=args.noise)
+    with wavemeter() as w:
+        time.sleep(0.1)  # Let the fake WLM measure every channel once
+        modes = [('direct',None)]
+        if args.sampler:
+            modes.append(('sampler',args.sampler))
+        for (mode,period) in modes:
+            if period:
+                w.StartSampler(period)
+                time.sleep(0.1)
+            print('\n%s (DLL latency %g s)'%(mode,args.latency))
+            header()
+            for (name,fn) in entry_points(w):
+                report(name,run(fn,args.calls,args.duration))
+            w.StopSampler()
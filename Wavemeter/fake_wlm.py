@@ -0,0 +1,213 @@
+import os, time, random, threading, logging
+from fake_library import FakeLibrary, exported
+from Wavemeter.Wavemeter import wavemeter, CallbackProcEx
+
+logger = logging.getLogger(__name__)
+
+# Simulated wlmData.dll so the Wavemeter module can run (and be tested/profiled) without
+# a WLM. Plugs in through wavemeter.LibraryLoader and ships its own header.
+#
+# from Wavemeter import fake_wlm
+# fake_wlm.install(latency=1e-4,noise=1e-5)  # wavemeter now loads FakeWLM with fake_wlmData.h
+# with wavemeter() as w:
+#     w.StartCallback()
+#
+# FakeWLM settings (also keyword arguments of install):
+#   wavelengths -> {channel: nm} simulated switcher channels
+#   period -> seconds per measurement (channels are measured in turn)
+#   noise -> std of measured wavelengths (nm)
+#   latency, latencies, errors -> per DLL call, see fake_library.FakeLibrary
+#   signal_errors -> {channel: code} measured instead of a wavelength (e.g. ErrLowSignal
+#     for an under-exposed channel); change it on the instance to restore the signal
+
+HEADER = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fake_wlmData.h')
+SETTINGS = {}  # FakeWLM keyword arguments used by load (set by install)
+
+# Must match fake_wlmData.h
+cInstCheckForWLM = -1
+cInstNotification = 1
+cNotifyInstallCallback = 2
+cNotifyRemoveCallback = 3
+cNotifyInstallCallbackEx = 6
+cmiWavelength1 = 42
+cmiSwitcherChannel = 96
+ErrNoValue = 0
+ErrLowSignal = -3
+ErrBigSignal = -4
+ResERR_NoErr = 0
+ResERR_ParmOutOfRange = -3
+
+def _deref(ref):
+    # byref(x) -> x (pure python functions receive the CArgObject)
+    return getattr(ref,'_obj',ref)
+
+def _val(arg):
+    # c_long(1) -> 1; plain python values pass through
+    return getattr(arg,'value',arg)
+
+class FakeWLM(FakeLibrary):
+    # Switcher WLM measuring channels in turn every `period` seconds
+    version = 7
+
+    def __init__(self,wavelengths=None,period=0.001,latency=0,latencies=None,noise=1e-5,errors=None,
+                 signal_errors=None):
+        self.wavelengths = dict(wavelengths or {1:737.1,2:619.4,3:1550.2})
+        super().__init__(latency,latencies,errors)
+        self.period = period
+        self.noise = noise
+        self.signal_errors = dict(signal_errors or {})
+        self.switcherMode = 1
+        self.deviationMode = True
+        self.operationState = 2
+        self.use = {ch:1 for ch in range(1,9)}
+        self.show = {ch:1 for ch in range(1,9)}
+        self.last = {ch:ErrNoValue for ch in range(1,9)}
+        self.pidSettings = {}  # {(PS, Port): (iSet, dSet)}
+        self.pidCourse = {ch:b'0' for ch in range(1,9)}
+        self._callback = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,daemon=True,name='fake WLM')
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _measure(self,ch):
+        if ch in self.signal_errors:
+            return self.signal_errors[ch]
+        return random.gauss(self.wavelengths[ch],self.noise)
+
+    def _run(self):
+        # Acquisition loop: measure next channel in use and notify the callback
+        ch = 0
+        while not self._stop.wait(self.period):
+            channels = [i for i in sorted(self.wavelengths) if self.use[i]]
+            if not channels:
+                continue
+            ch = next((i for i in channels if i > ch),channels[0])
+            self.last[ch] = self._measure(ch)
+            callback = self._callback
+            if callback:
+                callback(self.version,cmiSwitcherChannel,ch,0,0)
+                callback(self.version,cmiWavelength1,int(time.time()*1000)&0x7FFFFFFF,self.last[ch],0)
+
+    # DLL functions
+    @exported
+    def Instantiate(self,RFC,Mode,P1,P2):
+        if RFC == cInstNotification:
+            if Mode in [cNotifyInstallCallback,cNotifyInstallCallbackEx]:
+                if isinstance(P1,int):
+                    P1 = CallbackProcEx(P1)
+                if Mode == cNotifyInstallCallback:  # CallbackProc has no Ver/Res1
+                    P1 = (lambda fn: lambda ver,mode,intval,dblval,res1: fn(mode,intval,dblval))(P1)
+                self._callback = P1
+            elif Mode == cNotifyRemoveCallback:
+                self._callback = None
+        return 1
+
+    @exported
+    def ControlWLM(self,Action,App,Ver):
+        return 1
+
+    @exported
+    def ControlWLMEx(self,Action,App,Ver,Delay,Res):
+        return 1
+
+    @exported
+    def GetWLMVersion(self,Ver):
+        return self.version
+
+    @exported
+    def GetOperationState(self,Op):
+        return self.operationState
+
+    @exported
+    def Operation(self,Op):
+        self.operationState = _val(Op)
+        return ResERR_NoErr
+
+    @exported
+    def GetWavelengthNum(self,num,WL):
+        return self.last.get(_val(num),ErrNoValue)
+
+    @exported
+    def GetFrequencyNum(self,num,F):
+        wl = self.last.get(_val(num),ErrNoValue)
+        return 299792.458/wl if wl > 0 else wl
+
+    @exported
+    def GetSwitcherMode(self,SM):
+        return self.switcherMode
+
+    @exported
+    def SetSwitcherMode(self,SM):
+        self.switcherMode = _val(SM)
+        return ResERR_NoErr
+
+    @exported
+    def GetSwitcherSignalStates(self,Signal,Use,Show):
+        Signal = _val(Signal)
+        _deref(Use).value = self.use[Signal] if Signal in self.wavelengths else 0
+        _deref(Show).value = self.show[Signal] if Signal in self.wavelengths else 0
+        return ResERR_NoErr
+
+    @exported
+    def SetSwitcherSignalStates(self,Signal,Use,Show):
+        if _val(Signal) not in self.use:
+            return ResERR_ParmOutOfRange
+        self.use[_val(Signal)] = _val(Use)
+        self.show[_val(Signal)] = _val(Show)
+        return ResERR_NoErr
+
+    @exported
+    def GetDeviationMode(self,DM):
+        return self.deviationMode
+
+    @exported
+    def SetDeviationMode(self,DM):
+        self.deviationMode = bool(_val(DM))
+        return ResERR_NoErr
+
+    @exported
+    def GetPIDSetting(self,PS,Port,iSet,dSet):
+        (i,d) = self.pidSettings.get((_val(PS),_val(Port)),(0,0.0))
+        _deref(iSet).value = i
+        _deref(dSet).value = d
+        return 1
+
+    @exported
+    def SetPIDSetting(self,PS,Port,iSet,dSet):
+        self.pidSettings[(_val(PS),_val(Port))] = (_val(iSet),_val(dSet))
+        return ResERR_NoErr
+
+    @exported
+    def GetPIDCourseNum(self,Port,PIDC):
+        _deref(PIDC).value = self.pidCourse.get(_val(Port),b'')
+        return ResERR_NoErr
+
+    @exported
+    def SetPIDCourseNum(self,Port,PIDC):
+        self.pidCourse[_val(Port)] = _val(PIDC)
+        return ResERR_NoErr
+
+def load(path=None):
+    # wavemeter.LibraryLoader signature (path ignored)
+    return FakeWLM(**SETTINGS)
+
+def install(**settings):
+    # Point the wavemeter class at this backend; settings are FakeWLM keyword arguments
+    SETTINGS.clear()
+    SETTINGS.update(settings)
+    wavemeter.LibraryLoader = load
+    wavemeter.HeaderPath = HEADER
+
+if __name__ == '__main__':
+    install()
+    with wavemeter() as w:
+        w.StartCallback()
+        time.sleep(0.5)
+        print(w.CallbackStatus())
+        print(w.GetSummary())
+        for ch in [1,2,3]:
+            print(ch,w.SendCommand('','GetWavelengthNum',ch,0,10))
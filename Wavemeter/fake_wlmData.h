@@ -0,0 +1,67 @@
+// Synthetic subset of wlmData.h for the simulated WLM in fake_wlm.py.
+// Same layout as the vendor header so wavemeter._parseHeader treats it identically.
+// Constant values must match those in fake_wlm.py.
+
+// ***********  Functions for general usage  ****************************
+	Data_API(LONG_PTR)       Instantiate(long RFC, long Mode, LONG_PTR P1, long P2) ;
+	Data_API(long)           ControlWLM(long Action, LONG_PTR App, long Ver) ;
+	Data_API(long)           ControlWLMEx(long Action, LONG_PTR App, long Ver, long Delay, long Res) ;
+	Data_API(long)           GetWLMVersion(long Ver) ;
+
+	Data_API(double)         GetWavelengthNum(long num, double WL) ;
+	Data_API(double)         GetFrequencyNum(long num, double F) ;
+
+	Data_API(long)           GetSwitcherMode(long SM) ;
+	Data_API(long)           SetSwitcherMode(long SM) ;
+	Data_API(long)           GetSwitcherSignalStates(long Signal, lref Use, lref Show) ;
+	Data_API(long)           SetSwitcherSignalStates(long Signal, long Use, long Show) ;
+
+	Data_API(long)           GetOperationState(unsigned short Op) ;
+	Data_API(long)           Operation(unsigned short Op) ;
+
+	Data_API(bool)           GetDeviationMode(bool DM) ;
+	Data_API(long)           SetDeviationMode(bool DM) ;
+	Data_API(long)           GetPIDCourseNum(long Port, sref PIDC) ;
+	Data_API(long)           SetPIDCourseNum(long Port, sref PIDC) ;
+	Data_API(long)           GetPIDSetting(long PS, long Port, lref iSet, dref dSet) ;
+	Data_API(long)           SetPIDSetting(long PS, long Port, long iSet, double dSet) ;
+
+
+// ***********  Constants  **********************************************
+
+// Instantiating Constants for 'RFC' parameter
+	const int cInstCheckForWLM = -1;
+	const int cInstResetCalc = 0;
+	const int cInstReturnMode = cInstResetCalc;
+	const int cInstNotification = 1;
+
+// Notification Constants for 'Mode' parameter
+	const int cNotifyInstallCallback = 2;
+	const int cNotifyRemoveCallback = 3;
+	const int cNotifyInstallCallbackEx = 6;
+
+// Mode Constants for Callback-Export and WaitForWLMEvent-function
+	const int cmiWavelength1 = 42;
+	const int cmiWavelength2 = 43;
+	const int cmiWavelength3 = 44;
+	const int cmiWavelength4 = 45;
+	const int cmiWavelength5 = 46;
+	const int cmiWavelength6 = 47;
+	const int cmiWavelength7 = 48;
+	const int cmiWavelength8 = 49;
+	const int cmiSwitcherChannel = 96;
+
+// Return errorvalues of GetFrequency, GetWavelength and GetWLMVersion
+	const int ErrNoValue = 0;
+	const int ErrNoSignal = -1;
+	const int ErrBadSignal = -2;
+	const int ErrLowSignal = -3;
+	const int ErrBigSignal = -4;
+	const int ErrWlmMissing = -5;
+	const int ErrNotAvailable = -6;
+
+// Return errorvalues of ResultError (Set... functions)
+	const int ResERR_NoErr = 0;
+	const int ResERR_WlmMissing = -1;
+	const int ResERR_CouldNotSet = -2;
+	const int ResERR_ParmOutOfRange = -3;
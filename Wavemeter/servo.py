@@ -0,0 +1,164 @@
+import importlib, logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+# Wavelength servo run inside hwserver: reads a wavemeter channel and writes an actuator
+# of another module loaded in the same process, so no network hop is in the loop.
+#
+# Actuators are looked up on the live instance of their class (cls._live, set by the
+# hardware class when it opens its connection).
+#   name: (module, class, setter, extra setter args, getter or None, (min, max))
+ACTUATORS = {
+    'solstis.set_resonator_val': ('MSquared.msquared','solstis','set_resonator_val',(0,),None,(0,100)),
+    'laser.setPiezoPercent': ('NewFocusLaser.Laser','laser','setPiezoPercent',(),'getPiezoPercent',(0,100)),
+}
+
+class ServoError(Exception):
+    pass
+
+def resolve(target):
+    # Returns (actuate(value), current output or None, (min, max)) for an ACTUATORS name
+    if target not in ACTUATORS:
+        raise ServoError('Unknown servo target "%s". Options: %s'%(target,', '.join(ACTUATORS.keys())))
+    (module,cls,setter,args,getter,limits) = ACTUATORS[target]
+    instance = getattr(getattr(importlib.import_module(module),cls),'_live',None)
+    if instance is None:
+        raise ServoError('No open %s instance; is %s loaded in this hwserver?'%(cls,module))
+    setter = getattr(instance,setter)
+    actuate = lambda value: setter(value,*args)
+    current = getattr(instance,getter)() if getter else None
+    return actuate,current,limits
+
+def check_rate(rate):
+    # Loop rate (Hz) as a float; the loop period is 1/rate
+    rate = float(rate)
+    if not rate > 0:
+        raise ServoError('Servo rate must be positive (Hz), got %g.'%rate)
+    return rate
+
+class Servo:
+    # Discrete PID at a fixed loop rate:
+    #   error = setpoint - measurement
+    #   output = clamp(P*error + integral + D*d(error)/dt), integral += I*error*dt
+    # Gains are in actuator units per measurement unit (negative to reverse direction).
+    # The integral is held while the output is saturated (anti-windup) and each step is
+    # limited to `slew` actuator units. measure() returns None when there is no new value.
+    # Locked once |error| <= tolerance for lock_cycles consecutive updates.
+    settable = ['setpoint','P','I','D','rate','limits','slew','tolerance','lock_cycles']
+
+    def __init__(self,measure,actuate,setpoint,output,limits,P=0,I=0,D=0,rate=50,
+                 slew=None,tolerance=None,lock_cycles=10,max_failures=10):
+        self.measure = measure
+        self.actuate = actuate
+        self.setpoint = float(setpoint)
+        self.limits = (float(limits[0]),float(limits[1]))
+        self.P = float(P)
+        self.I = float(I)
+        self.D = float(D)
+        self.rate = check_rate(rate)
+        self.slew = slew
+        self.tolerance = tolerance
+        self.lock_cycles = int(lock_cycles)
+        self.max_failures = max_failures
+        self.output = min(max(float(output),self.limits[0]),self.limits[1])
+        self.integral = self.output  # Bumpless start from the current output
+        self.value = None
+        self.error = None
+        self.saturated = False
+        self.in_tolerance = 0
+        self.updates = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop,daemon=True,name='wavemeter servo')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def set(self,prop,value):
+        assert prop in self.settable, '%s is not a servo setting. Options: %s'%(prop,', '.join(self.settable))
+        with self._lock:
+            if prop == 'limits':
+                value = (float(value[0]),float(value[1]))
+            elif prop == 'lock_cycles':
+                value = int(value)
+            elif prop == 'rate':
+                value = check_rate(value)
+            elif value is not None:
+                value = float(value)
+            setattr(self,prop,value)
+            if prop == 'setpoint':
+                self.in_tolerance = 0
+
+    def status(self):
+        with self._lock:
+            return {'running': self._thread.is_alive(),
+                    'locked': self.locked(),
+                    'setpoint': self.setpoint,
+                    'value': self.value,
+                    'error': self.error,
+                    'output': self.output,
+                    'saturated': self.saturated,
+                    'P': self.P, 'I': self.I, 'D': self.D,
+                    'rate': self.rate,
+                    'limits': self.limits,
+                    'slew': self.slew,
+                    'tolerance': self.tolerance,
+                    'updates': self.updates,
+                    'skipped': self.skipped,
+                    'last_error': self.last_error}
+
+    def locked(self):
+        return self.tolerance is not None and self.in_tolerance >= self.lock_cycles
+
+    def _update(self,value,dt):
+        # Must hold self._lock; returns new output
+        error = self.setpoint - value
+        derivative = 0 if self.error is None or not dt else (error-self.error)/dt
+        integral = self.integral + self.I*error*dt
+        output = self.P*error + integral + self.D*derivative
+        if self.slew is not None:
+            output = min(max(output,self.output-self.slew),self.output+self.slew)
+        clamped = min(max(output,self.limits[0]),self.limits[1])
+        self.saturated = clamped != output
+        if not self.saturated:
+            self.integral = integral
+        self.value = value
+        self.error = error
+        self.output = clamped
+        self.updates += 1
+        if self.tolerance is not None and abs(error) <= self.tolerance:
+            self.in_tolerance += 1
+        else:
+            self.in_tolerance = 0
+        return clamped
+
+    def _loop(self):
+        tlast = None
+        while not self._stop.is_set():
+            tstart = time.time()
+            try:
+                value = self.measure()
+                if value is None:
+                    self.skipped += 1
+                else:
+                    with self._lock:
+                        output = self._update(value,0 if tlast is None else tstart-tlast)
+                    tlast = tstart
+                    self.actuate(output)
+                self.failures = 0
+            except Exception as err:
+                self.failures += 1
+                self.last_error = str(err)
+                logger.exception('Servo update failed')
+                if self.failures >= self.max_failures:
+                    logger.error('Stopping servo after %i consecutive failures'%self.failures)
+                    break
+            self._stop.wait(max(0,1.0/self.rate - (time.time()-tstart)))
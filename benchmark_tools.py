@@ -0,0 +1,29 @@
+import time
+import numpy as np
+
+# Timing and report helpers shared by the entry-point benchmarks (Wavemeter/benchmark.py,
+# MSquared/benchmark.py, serial_benchmark.py).
+#
+# import benchmark_tools
+# benchmark_tools.header()
+# benchmark_tools.report('get_status',benchmark_tools.run(lambda: s._transmit('get_status'),1000,2.0))
+
+def run(fn,calls,duration):
+    # Returns per-call latencies (s); stops after calls or duration seconds
+    latencies = []
+    tend = time.perf_counter() + duration
+    for _ in range(calls):
+        tstart = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter()-tstart)
+        if tstart > tend:
+            break
+    return np.array(latencies)
+
+def header():
+    print('%-36s %7s %10s %9s %9s %9s'%('entry point','calls','calls/s','mean us','p50 us','p99 us'))
+
+def report(name,latencies):
+    us = latencies*1e6
+    print('%-36s %7i %10.0f %9.1f %9.1f %9.1f'%(name,len(us),len(us)/latencies.sum(),
+                                                us.mean(),np.percentile(us,50),np.percentile(us,99)))
@@ -0,0 +1,61 @@
+import time, random, functools
+
+# Scaffolding shared by the simulated vendor libraries (Wavemeter/fake_wlm.py,
+# PulseBlaster/fake_spinapi.py): a FakeLibrary stands in for a ctypes.CDLL/WinDLL.
+#
+# class FakeThing(FakeLibrary):
+#     @exported
+#     def GetValue(self,num):
+#         return 42
+# FakeThing(latency=1e-4)['GetValue'](1)
+#
+# FakeLibrary settings (keyword arguments of every fake library):
+#   latency -> seconds slept in every call; latencies -> {fn: seconds} overrides
+#   errors -> {fn: code} or {fn: (code, probability)} returned instead of calling fn
+# calls counts the calls to each function.
+
+def exported(fn):
+    # Marks a simulated library function: counts calls, applies latency and injected errors
+    @functools.wraps(fn)
+    def wrapper(self,*args):
+        name = fn.__name__
+        self.calls[name] = self.calls.get(name,0) + 1
+        latency = self.latencies.get(name,self.latency)
+        if latency:
+            time.sleep(latency)
+        if name in self.errors:
+            error = self.errors[name]
+            (code,probability) = error if isinstance(error,(tuple,list)) else (error,1)
+            if random.random() < probability:
+                self._injected(name)
+                return code
+        return fn(self,*args)
+    wrapper.exported = True
+    return wrapper
+
+class FakeFunction:
+    # Stands in for a ctypes function object; restype/argtypes are accepted and ignored
+    def __init__(self,fn):
+        self.fn = fn
+        self.restype = None
+        self.argtypes = None
+
+    def __call__(self,*args):
+        return self.fn(*args)
+
+class FakeLibrary:
+    def __init__(self,latency=0,latencies=None,errors=None):
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.errors = dict(errors or {})
+        self.calls = {}
+
+    def __getitem__(self,name):
+        # Mirrors CDLL[name]: new function object each time, AttributeError if missing
+        if not getattr(getattr(type(self),name,None),'exported',False):
+            raise AttributeError(name)
+        return FakeFunction(getattr(self,name))
+
+    def _injected(self,name):
+        # Called when an injected error replaces a call (e.g. to set the library's last error)
+        pass
@@ -0,0 +1,79 @@
+import argparse, logging
+import numpy as np
+from benchmark_tools import run, report, header
+from SuperK import superk, emulator as superk_emulator
+from Teensy import teensy, emulator as teensy_emulator
+from NewFocusLaser import Laser, emulator as newfocus_emulator
+from Cobolt import Cobolt, emulator as cobolt_emulator
+
+# Per-command latency and throughput of the serial drivers against their pty emulators
+# (see serial_emulator.py).
+#
+# python serial_benchmark.py --calls 200 --latency 0.001
+# python serial_benchmark.py --drivers superk --no-pacing
+
+def superk_entry_points(s):
+    # name: call
+    centers = np.linspace(500,700,50)
+    return [
+        ('emission', lambda: s.emission()),
+        ('getpower (cached)', lambda: s.getpower()),
+        ('getpower (uncached)', lambda: s.custom(s._module,0x37)),
+        ('setpower', lambda: s.setpower(50)),
+        ('getwavelength (cached)', lambda: s.getwavelength()),
+        ('setwavelength', lambda: s.setwavelength(np.random.uniform(500,700))),
+        ('sweep 50 points', lambda: s.sweep(centers)),
+    ]
+
+def teensy_entry_points(t):
+    t.reset()
+    return [
+        ('get_filter', lambda: t.get_filter()),
+        ('check_position_state', lambda: t.check_position_state()),
+        ('change_filter + get_filter', lambda: (t.change_filter(3),t.get_filter())),
+        ('set_digital_output + check', lambda: (t.set_digital_output(11,1),t.check_position_state())),
+    ]
+
+def newfocus_entry_points(l):
+    return [
+        ('idn', lambda: l.idn()),
+        ('getWavelength', lambda: l.getWavelength()),
+        ('getPiezoPercent', lambda: l.getPiezoPercent()),
+        ('setPiezoPercent + opc', lambda: (l.setPiezoPercent(50),l.opc())),
+        ('setWavelength (tune_time 0)', lambda: l.setWavelength(637)),
+    ]
+
+def cobolt_entry_points(c):
+    return [
+        ('l? (int)', lambda: c.dispatch('','l?')),
+        ('pa? (float)', lambda: c.dispatch('','pa?')),
+        ('p (set)', lambda: c.dispatch('','p',0.05)),
+        ('l1 (action)', lambda: c.dispatch('','l1')),
+    ]
+
+DRIVERS = {  # name: (emulator class, reply baudrate, driver(port), entry points)
+    'superk': (superk_emulator.SuperKEmulator, 115200, lambda port: superk.superk(port=port), superk_entry_points),
+    'teensy': (teensy_emulator.TeensyEmulator, 9600, lambda port: teensy.teensy(port=port), teensy_entry_points),
+    'newfocus': (newfocus_emulator.NewFocusEmulator, 9600, lambda port: Laser.laser(port=port), newfocus_entry_points),
+    'cobolt': (cobolt_emulator.CoboltEmulator, 9600, lambda port: Cobolt.Cobolt(port=port), cobolt_entry_points),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the serial drivers on their pty emulators.')
+    parser.add_argument('--drivers',nargs='+',choices=list(DRIVERS),default=list(DRIVERS))
+    parser.add_argument('--calls',type=int,default=200,help='maximum calls per entry point')
+    parser.add_argument('--duration',type=float,default=2.0,help='maximum seconds per entry point')
+    parser.add_argument('--latency',type=float,default=0,help='emulated seconds before every reply')
+    parser.add_argument('--no-pacing',action='store_true',help='reply as fast as the pty allows instead of at the baudrate')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    for name in args.drivers:
+        (emulator,baudrate,driver,entry_points) = DRIVERS[name]
+        baudrate = None if args.no_pacing else baudrate
+        with emulator(latency=args.latency,baudrate=baudrate) as emu:
+            with driver(emu.port) as device:
+                print('\n%s (reply latency %g s, %s)'%(name,args.latency,'%i baud'%baudrate if baudrate else 'no pacing'))
+                header()
+                for (label,fn) in entry_points(device):
+                    report(label,run(fn,args.calls,args.duration))
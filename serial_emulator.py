@@ -0,0 +1,80 @@
+import os, pty, tty, time, threading, logging
+logger = logging.getLogger(__name__)
+
+# Base for the serial instrument emulators (SuperK/emulator.py, Teensy/emulator.py,
+# NewFocusLaser/emulator.py, Cobolt/emulator.py): a device on a Linux pseudo-terminal that
+# the drivers open like their USB serial port.
+#
+# from Teensy import emulator, teensy
+# with emulator.TeensyEmulator(latency=1e-3) as emu:
+#     with teensy.teensy(port=emu.port) as t:
+#         t.reset()
+#
+# PTYEmulator settings (keyword arguments of every emulator):
+#   latency -> seconds before each reply
+#   baudrate -> replies are paced at 10 bits per byte at this rate (None: as fast as the pty)
+#
+# Subclasses override received(data), called on the emulator thread with the bytes as
+# they arrive, and answer with reply(data). The base device ignores what it is sent.
+
+class PTYEmulator:
+    name = 'serial device'
+
+    def __init__(self,latency=0,baudrate=None):
+        self.latency = latency
+        self.baudrate = baudrate
+        self.calls = {}  # command: count
+        (self._master,self._slave) = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)  # Stays open so the pty survives drivers closing the port
+        self.port = os.ttyname(self._slave)
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_loop,daemon=True,name=self.name+' emulator')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            os.close(self._master)
+            os.close(self._slave)
+
+    def _read_loop(self):
+        while not self._closed:
+            try:
+                data = os.read(self._master,4096)
+            except OSError:
+                return
+            if not data:
+                return
+            try:
+                self.received(data)
+            except Exception:
+                logger.exception('%s emulator failed handling %r'%(self.name,data))
+
+    def count(self,command):
+        self.calls[command] = self.calls.get(command,0) + 1
+
+    def received(self,data):
+        pass
+
+    def reply(self,data):
+        # Write data after latency, paced at baudrate
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.baudrate:
+            return os.write(self._master,data)
+        byte_time = 10.0/self.baudrate
+        deadline = time.perf_counter()
+        for i in range(0,len(data),16):
+            chunk = data[i:i+16]
+            deadline += len(chunk)*byte_time
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            os.write(self._master,chunk)
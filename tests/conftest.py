@@ -0,0 +1,4 @@
+import os, sys
+
+# Tests import the instrument packages the way hwserver does, from the repository root.
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import threading, time
+import pytest
+from MSquared import msquared, simulator
+
+@pytest.fixture
+def solstis():
+    with simulator.SimulatedICE(tune_time=0.05) as sim:
+        msquared.init('test',sim.address,sim.address)
+        with msquared.solstis() as s:
+            yield s,sim
+            s.stop_poller()
+
+def wait_for(condition,timeout=2.0):
+    tend = time.time() + timeout
+    while not condition():
+        assert time.time() < tend, 'timed out'
+        time.sleep(0.01)
+
+def test_polled_reads_skip_the_controller(solstis):
+    (s,sim) = solstis
+    s.start_poller(rate=20)
+    calls = sim.calls.get('poll_wave_m',0)
+    for _ in range(20):
+        s.get_wavelength()
+    assert sim.calls.get('poll_wave_m',0) <= calls + 2  # Only the poller's own reads
+
+def failing(s,monkeypatch):
+    # Polls fail until the returned undo is called
+    def fail():
+        raise IOError('no reply')
+    monkeypatch.setattr(s,'status_wavelength',fail)
+    return lambda: monkeypatch.undo()
+
+def test_poll_error_clears_after_success(solstis,monkeypatch):
+    (s,sim) = solstis
+    s.start_poller(rate=50)
+    recover = failing(s,monkeypatch)
+    wait_for(lambda: s.poller_status()['last_error'])
+    recover()
+    wait_for(lambda: s.poller_status()['last_error'] is None)
+
+def test_stale_poll_reads_go_live(solstis,monkeypatch):
+    (s,sim) = solstis
+    s.start_poller(rate=50)
+    failing(s,monkeypatch)
+    wait_for(lambda: s._fresh_poll() is None)  # poll_max_age periods without a good poll
+    assert s.poller_status()['running']
+    calls = sim.calls.get('poll_wave_m',0)
+    s.get_wavelength()
+    assert sim.calls.get('poll_wave_m',0) == calls + 1  # Read from the controller
+
+def test_concurrent_requests_get_their_own_replies(solstis):
+    # Slow and fast ops interleave on one socket; each caller must get its own reply
+    (s,sim) = solstis
+    sim.latencies.update({'get_status':0.05,'poll_wave_m':0.01})
+    results = {}
+    def run(i):
+        results[i] = s.status() if i%2 else s.get_wavelength()
+    threads = [threading.Thread(target=run,args=(i,)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 10
+    for (i,reply) in results.items():
+        assert ('current_wavelength' in reply) != bool(i%2)
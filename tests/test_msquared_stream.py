@@ -0,0 +1,58 @@
+import json, socket
+import pytest
+from MSquared import msquared
+
+@pytest.fixture
+def pair():
+    (a,b) = socket.socketpair()
+    a.settimeout(1)
+    yield msquared.JSONStream(a,chunk=7),b
+    a.close()
+    b.close()
+
+def message(i,text='ok'):
+    return {'message':{'transmission_id':[i],'op':'test','parameters':{'text':text}}}
+
+def test_messages_split_across_reads(pair):
+    (stream,b) = pair
+    raw = json.dumps(message(1)).encode()
+    for i in range(0,len(raw),3):
+        b.sendall(raw[i:i+3])
+    assert stream.recv() == message(1)
+
+def test_several_messages_in_one_read(pair):
+    (stream,b) = pair
+    b.sendall(b''.join(json.dumps(message(i)).encode() for i in range(5)))
+    assert [stream.recv()['message']['transmission_id'][0] for i in range(5)] == list(range(5))
+
+def test_brackets_and_escapes_inside_strings(pair):
+    (stream,b) = pair
+    tricky = ['}{][', '\\"}', 'end\\\\', '"{"']
+    b.sendall(b' \r\n'.join(json.dumps(message(i,text)).encode() for (i,text) in enumerate(tricky)))
+    assert [stream.recv()['message']['parameters']['text'] for _ in tricky] == tricky
+
+def test_utf8_split_between_reads(pair):
+    (stream,b) = pair
+    raw = json.dumps(message(1,'µm Å'),ensure_ascii=False).encode()
+    cut = raw.index('µ'.encode()) + 1  # Inside the two byte character
+    b.sendall(raw[:cut])
+    b.sendall(raw[cut:])
+    assert stream.recv()['message']['parameters']['text'] == 'µm Å'
+
+def test_partial_message_stays_buffered(pair):
+    (stream,b) = pair
+    raw = json.dumps(message(1)).encode()
+    b.sendall(raw[:10])
+    with pytest.raises(socket.timeout):
+        stream.sock.settimeout(0.05)
+        stream.recv()
+    stream.sock.settimeout(1)
+    b.sendall(raw[10:] + json.dumps(message(2)).encode())
+    assert stream.recv() == message(1)
+    assert stream.recv() == message(2)
+
+def test_disconnect(pair):
+    (stream,b) = pair
+    b.close()
+    with pytest.raises(msquared.ClientDisconnected):
+        stream.recv()
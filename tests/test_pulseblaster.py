@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PulseBlaster import fake_spinapi, program as pbprogram
+from PulseBlaster.PulseBlaster import PulseBlaster
+
+PROGRAM = 'START: 0x1, 100 ms\n0x0, 100 ms, BRANCH, START'
+
+@pytest.fixture
+def pb():
+    fake_spinapi.install()
+    with PulseBlaster() as pb:
+        yield pb
+
+def test_program_cache_lru():
+    cache = pbprogram.ProgramCache(2)
+    compiled = []
+    compile = lambda name: lambda: compiled.append(name) or name
+    for name in ['a','b','a','c','b']:
+        assert cache.get(name,compile(name)) == name
+    assert compiled == ['a','b','c','b']  # b was evicted by c (a was used more recently)
+    assert cache.status()['evictions'] == 2 and cache.status()['hits'] == 1
+
+def test_keys_depend_on_content_and_clock():
+    assert pbprogram.key(PROGRAM,500) == pbprogram.key(PROGRAM,500)
+    assert pbprogram.key(PROGRAM,500) != pbprogram.key(PROGRAM,400)
+    table = np.zeros((2,4))
+    assert pbprogram.key(table,500) != pbprogram.key(table+1,500)
+
+def test_reloading_the_loaded_program_skips_the_board(pb):
+    pb.load(PROGRAM)
+    loads = fake_spinapi.board().loads
+    pb.load(PROGRAM)
+    assert fake_spinapi.board().loads == loads
+    assert pb.getCacheStats()['skipped'] >= 1
+
+def test_static_lines_reach_the_board(pb):
+    pb.setLines([1,3],True)
+    assert fake_spinapi.board().instructions[0][0] & 0xFFFFFF == 0b101 | pb.driver.shortPulseBits
+
+def test_coalesced_lines_are_one_update(pb):
+    pb.setCoalesceWindow(0.05)
+    loads = fake_spinapi.board().loads
+    for line in range(1,6):
+        pb.setLines(line,True)
+    assert pb.getLines(pending=True)[:5] == [True]*5
+    pb.flushLines()
+    assert fake_spinapi.board().loads == loads + 1
+    assert pb.getLines()[:6] == [True]*5 + [False]
+
+def test_stage_and_commit(pb):
+    pb.stage(PROGRAM)
+    assert fake_spinapi.board().instructions[0][0] & 0b1 == 0  # Still the static lines
+    out = pb.commit()
+    assert out['instructions'] == 2
+    assert [inst[0] for inst in fake_spinapi.board().instructions] == \
+        [0x1 | pb.driver.shortPulseBits,pb.driver.shortPulseBits]
+    assert fake_spinapi.board().running
+
+def test_discard_staged(pb):
+    pb.stage(PROGRAM)
+    pb.discardStaged()
+    with pytest.raises(RuntimeError):
+        pb.commit()
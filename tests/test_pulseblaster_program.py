@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from PulseBlaster import program as pbprogram
+
+OP = pbprogram.OPCODES
+CLOCK = 500  # MHz: 2 ns per clock cycle
+
+def expand(table):
+    # Runs a compile_sequence table (one pass; BRANCH ends it) into output states per clock cycle
+    tick = 1e3/CLOCK
+    out = []
+    counters = {}  # LOOP index: iterations left
+    pc = 0
+    while True:
+        (flags,opcode,data,length) = table[pc]
+        (opcode,data,cycles) = (int(opcode),int(data),int(round(length/tick)))
+        if opcode == OP['STOP']:
+            return np.array(out,dtype=np.int64)
+        out += [int(flags)]*(cycles*data if opcode == OP['LONG_DELAY'] else cycles)
+        if opcode == OP['LOOP']:
+            counters.setdefault(pc,data)
+        if opcode == OP['END_LOOP']:
+            counters[data] -= 1
+            if counters[data]:
+                pc = data
+                continue
+            del counters[data]
+        if opcode == OP['BRANCH']:
+            return np.array(out,dtype=np.int64)
+        pc += 1
+
+def reference(sequence,end):
+    # Output state per clock cycle straight from the edges (each edge toggles its line)
+    state = np.zeros(end,dtype=np.int64)
+    for (line,edges) in sequence.items():
+        for t in np.ravel(edges):
+            state[int(round(t*CLOCK/1e3)):] ^= 1 << (line-1)
+    return state
+
+def test_random_sequences_play_back_exactly():
+    rnd = np.random.RandomState(0)
+    for trial in range(50):
+        sequence = {}
+        for line in rnd.choice(np.arange(1,25),rnd.randint(1,5),replace=False):
+            steps = rnd.randint(5,40,size=2*rnd.randint(1,8))*10  # ns, multiples of 5 cycles
+            sequence[int(line)] = np.cumsum(steps).tolist()
+        end = max(max(edges) for edges in sequence.values()) + 100
+        (table,info) = pbprogram.compile_sequence(sequence,end,CLOCK,maxCycles=50)
+        assert info['duration'] == end
+        assert np.array_equal(expand(table)[:end],reference(sequence,end*CLOCK//1000))
+
+def test_periodic_pulses_become_one_loop():
+    period = 200  # ns
+    sequence = {1: [[i*period,i*period+50] for i in range(1000)]}
+    (table,info) = pbprogram.compile_sequence(sequence,1000*period,CLOCK)
+    assert info['loops'] == 1
+    assert len(table) <= 4
+    assert [int(op) for op in table[:,1]].count(OP['LOOP']) == 1
+    assert np.array_equal(expand(table),reference(sequence,1000*period*CLOCK//1000))
+
+def test_long_states_use_long_delay():
+    (table,info) = pbprogram.compile_sequence({1: [10,1e6]},2e6,CLOCK,maxCycles=1000)
+    assert OP['LONG_DELAY'] in table[:,1]
+    assert np.array_equal(expand(table),reference({1: [10,1e6]},int(2e6*CLOCK/1e3)))
+
+def test_repeat_branches_to_start():
+    (table,info) = pbprogram.compile_sequence({2: [[0,100]]},400,CLOCK,repeat=True)
+    assert tuple(table[-1,1:3]) == (OP['BRANCH'],0)
+
+@pytest.mark.parametrize('sequence,duration,message',[
+    ({1: [0,4]},100,'clock cycles'),
+    ({1: [50,20]},100,'increasing'),
+    ({1: [50,200]},100,'after the end'),
+    ({25: [0,50]},100,'Line indices'),
+])
+def test_invalid_sequences(sequence,duration,message):
+    with pytest.raises(pbprogram.ProgramError,match=message):
+        pbprogram.compile_sequence(sequence,duration,CLOCK)
+
+def test_parse_resolves_labels_and_units():
+    text = 'START: 0b1_0000, 1 us // comment\n0x0, 500, LOOP, 3\n0x1, 1 ms, END_LOOP, 1\n0x0, 2 s, BRANCH, START'
+    assert pbprogram.parse(text) == [(16,OP['CONTINUE'],0,1e3),(0,OP['LOOP'],3,500.0),
+                                     (1,OP['END_LOOP'],1,1e6),(0,OP['BRANCH'],0,2e9)]
+
+def test_format_round_trips():
+    (table,info) = pbprogram.compile_sequence({1: [[i*100,i*100+20] for i in range(10)],3: [0,500]},1000,CLOCK)
+    instructions = pbprogram.instructions(table)
+    assert pbprogram.parse(pbprogram.format(instructions)) == instructions
+
+@pytest.mark.parametrize('text,message',[
+    ('0x1, 1 us, JUMP','unknown opcode'),
+    ('0x1, 1 us, BRANCH, NOWHERE','unknown label'),
+    ('A: 0x1, 1 us\nA: 0x0, 1 us','defined twice'),
+    ('0x1','expected'),
+])
+def test_parse_errors(text,message):
+    with pytest.raises(pbprogram.ProgramError,match=message):
+        pbprogram.parse(text)
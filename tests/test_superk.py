@@ -0,0 +1,80 @@
+import pytest
+from SuperK import superk, emulator
+
+@pytest.fixture
+def device():
+    with emulator.SuperKEmulator() as emu:
+        with superk.superk(port=emu.port) as s:
+            yield s,emu
+
+def test_reads_and_writes(device):
+    (s,emu) = device
+    s.setpower(42.5)
+    assert emu.registers[(15,0x37)][0] == 425
+    s.invalidate()
+    assert s.getpower() == pytest.approx(42.5)
+
+def test_retries_busy_and_crc_errors(device):
+    (s,emu) = device
+    emu.busy = emu.crc_errors = 0.2
+    s.retries = 20  # Failing 20 times in a row is all but impossible
+    for _ in range(20):
+        assert s.custom(s._module,0x37) is not None
+
+def test_skips_telegrams_for_other_hosts(device):
+    (s,emu) = device
+    emu.reply(superk.encode_telegram(0xA3,15,superk.DATAGRAM,0x37,b'\x00\x00'))
+    s.invalidate()
+    emu.registers[(15,0x37)][0] = 333
+    assert s.getpower() == pytest.approx(33.3)
+    assert s.serial.misdirected == 1
+
+def test_frames_split_and_joined():
+    with emulator.SuperKEmulator() as emu:
+        port = superk.com(emu.port)
+        port.my_address = 0xA2
+        first = superk.encode_telegram(0xA2,15,superk.ACK,0x30)
+        second = superk.encode_telegram(0xA2,17,superk.DATAGRAM,0x33,b'\x10\x20')
+        emu.reply(first[:3])
+        emu.reply(first[3:] + second)
+        assert port.recv() == [15,superk.ACK,0x30,[]]
+        assert port.recv() == [17,superk.DATAGRAM,0x33,[0x10,0x20]]
+        port.close()
+
+def test_shadow_cache_serves_reads_and_skips_writes(device):
+    (s,emu) = device
+    s.setpower(50)
+    hits = s.cachestatus()['hits']
+    assert s.getpower() == pytest.approx(50)
+    assert s.cachestatus()['hits'] == hits + 1
+    assert emu.calls.get('read 15 0x37',0) == 0  # Served from the write
+    s.setwavelength(600)
+    writes = (emu.calls.get('write 17 0x33',0),emu.calls.get('write 17 0x34',0))
+    skipped = s.cachestatus()['skipped']
+    s.setwavelength(600)  # Both edges already hold these values
+    assert s.cachestatus()['skipped'] == skipped + 2
+    assert (emu.calls.get('write 17 0x33',0),emu.calls.get('write 17 0x34',0)) == writes
+    s.invalidate()
+    assert s.getpower() == pytest.approx(50)
+    assert emu.calls.get('read 15 0x37',0) == 1
+
+@pytest.mark.parametrize('cache_age',[5.0,0])
+@pytest.mark.parametrize('centers',[[700,520,690,505],[505,690,520,700]])
+def test_filter_moves_never_cross(device,cache_age,centers):
+    # The emulator NACKs an LWP at or above SWP (and the reverse), so a wrong write order raises
+    (s,emu) = device
+    s.setcacheage(cache_age)
+    for center in centers:
+        s.setwavelength(center)
+        assert s.getwavelength() == pytest.approx(center)
+    s.setbandwidth(40)
+    assert s.getbandwidth() == pytest.approx(40)
+
+def test_sweep_writes_only_changes(device):
+    (s,emu) = device
+    s.setwavelength(550)
+    before = dict(emu.calls)
+    out = s.sweep([560,560,540,700],bandwidths=10)
+    assert out['writes'] == 6  # Both edges at 560, 540 and 700; the repeated 560 writes nothing
+    assert len(out['t']) == 4
+    assert (emu.registers[(17,0x34)][0],emu.registers[(17,0x33)][0]) == (6950,7050)
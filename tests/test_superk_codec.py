@@ -0,0 +1,39 @@
+import pytest
+from SuperK import superk, benchmark
+
+def test_crc16_check_value():
+    # CRC-16/XMODEM (poly 0x1021, init 0) check value
+    assert superk.crc16(b'123456789') == 0x31C3
+
+def test_matches_the_per_byte_codec():
+    # Special bytes (SOT, EOT, SOE) are frequent among random bytes, so substitution is covered
+    for size in [0,1,2,8,32]:
+        benchmark.check(benchmark.telegrams(200,size))
+
+def test_round_trip_of_special_bytes():
+    data = bytes([superk.SOT,superk.EOT,superk.SOE,superk.SOE+superk.ECC,0])
+    raw = superk.encode_telegram(15,0xA2,superk.WRITE,superk.SOE,data)
+    assert raw[0] == superk.SOT and raw[-1] == superk.EOT
+    assert superk.EOT not in raw[1:-1] and superk.SOT not in raw[1:-1]
+    assert superk.decode_telegram(raw) == (15,0xA2,superk.WRITE,superk.SOE,data)
+
+def test_corrupted_telegram_fails_the_checksum():
+    raw = bytearray(superk.encode_telegram(15,0xA2,superk.READ,0x37))
+    raw[4] ^= 0x01
+    with pytest.raises(superk.SuperKerror,match='Checksum'):
+        superk.decode_telegram(raw)
+
+def test_short_telegram():
+    with pytest.raises(superk.SuperKerror,match='too short'):
+        superk.decode_telegram(bytes([superk.SOT,15,0xA2,superk.EOT]))
+
+@pytest.mark.parametrize('data,nbytes,packed',[
+    (0,None,b'\x00'),
+    (0x1234,None,b'\x34\x12'),
+    (5,2,b'\x05\x00'),
+    ([1,2],1,b'\x01\x02'),
+])
+def test_pack_is_little_endian(data,nbytes,packed):
+    assert superk.pack(data,nbytes) == packed
+    if nbytes is None:
+        assert superk.bytes2int(list(packed)) == data
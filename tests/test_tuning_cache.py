@@ -0,0 +1,78 @@
+import time
+import pytest
+from MSquared import msquared, simulator
+
+def test_lookup_nearest_within_tolerance():
+    cache = msquared.TuningCache(tolerance=0.01)
+    cache.store(700.0,10,20)
+    cache.store(700.02,30,40)
+    assert cache.lookup(700.004)[0] == 700.0
+    assert cache.lookup(700.015)[0] == 700.02
+    assert cache.lookup(700.05) is None
+    assert cache.status()['hits'] == 2 and cache.status()['misses'] == 1
+
+def test_evicts_least_recently_used():
+    cache = msquared.TuningCache(max_entries=2)
+    for wl in [600.0,610.0]:
+        cache.store(wl,1,1)
+    cache.lookup(600.0)  # 610 is now the least recently used
+    cache.store(620.0,1,1)
+    assert sorted(cache.entries) == [600.0,620.0]
+    assert cache.wavelengths == [600.0,620.0]
+    assert cache.status()['evictions'] == 1
+
+def test_evicts_expired_entries(tmp_path):
+    path = str(tmp_path/'cache.json')
+    cache = msquared.TuningCache(path,max_age=60)
+    cache.store(600.0,1,1)
+    cache.store(610.0,1,1)
+    cache.entries[600.0]['used'] -= 120
+    cache._save()
+    reloaded = msquared.TuningCache(path,max_age=60)
+    assert reloaded.wavelengths == [610.0]
+
+def test_persists_and_discards(tmp_path):
+    path = str(tmp_path/'cache.json')
+    cache = msquared.TuningCache(path)
+    cache.store(600.0,12.5,50)
+    cache.store(650.0,1,2)
+    cache.discard(600.0)
+    reloaded = msquared.TuningCache(path)
+    assert reloaded.wavelengths == [650.0]
+    assert reloaded.entries[650.0]['etalon'] == 1
+
+@pytest.fixture
+def solstis():
+    with simulator.SimulatedICE(tune_time=0.05) as sim:
+        msquared.init('test',sim.address,sim.address)
+        msquared.solstis._tuning_caches.clear()
+        with msquared.solstis() as s:
+            yield s,sim
+
+def wait_for(condition,timeout=2.0):
+    tend = time.time() + timeout
+    while not condition():
+        assert time.time() < tend, 'timed out'
+        time.sleep(0.01)
+
+def test_set_wavelength_learns_settings(solstis):
+    (s,sim) = solstis
+    s.set_etalon_val(40)
+    s.set_resonator_val(30,10)
+    s.set_wavelength(700.5,timeout=10)
+    wait_for(lambda: 700.5 in s._tuning.entries)
+    entry = s._tuning.entries[700.5]
+    assert (entry['etalon'],entry['resonator']) == (40.0,30.0)
+
+def test_failed_prepositioning_is_discarded_not_fatal(solstis):
+    (s,sim) = solstis
+    s._tuning.store(700.5,150.0,30.0)  # Out of range: set_etalon_val refuses it
+    (response,report) = s.set_wavelength(700.5,timeout=10)
+    assert report['report'] == [0]
+    assert s._tuning.status()['failures'] == 1
+
+def test_no_cache_without_report(solstis):
+    (s,sim) = solstis
+    s._tuning.store(700.5,40.0,30.0)
+    s.set_wavelength(700.5,timeout=0)
+    assert s._tuning.status()['hits'] == 0
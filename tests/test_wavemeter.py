@@ -0,0 +1,89 @@
+import time
+import numpy as np
+import pytest
+from Wavemeter import fake_wlm
+from Wavemeter.Wavemeter import wavemeter, RingBuffer
+
+@pytest.fixture
+def wlm():
+    fake_wlm.install(noise=1e-5)
+    with wavemeter() as w:
+        time.sleep(0.05)  # Let the fake WLM measure every channel once
+        yield w
+
+def wait_for(condition,timeout=2.0):
+    tend = time.time() + timeout
+    while not condition():
+        assert time.time() < tend, 'timed out'
+        time.sleep(0.01)
+
+def test_ringbuffer_keeps_equal_values():
+    buf = RingBuffer(4)
+    for t in range(3):
+        assert buf.append(t,600.0)
+    assert buf.count == 3
+
+def test_ringbuffer_skips_repeated_stamp():
+    buf = RingBuffer(4)
+    assert buf.append(0,600.0,stamp=10)
+    assert not buf.append(1,600.0,stamp=10)
+    assert buf.append(2,600.0,stamp=11)
+    assert buf.count == 2
+
+def test_ringbuffer_error_codes_are_not_samples():
+    buf = RingBuffer(4)
+    buf.append(0,600.0)
+    assert not buf.append(1,-3)
+    assert buf.count == 1 and buf.current() == -3 and buf.checked == 1
+    buf.append(2,601.0)
+    assert buf.current() == 601.0
+    (t,value) = buf.history()
+    assert value.tolist() == [600.0,601.0]
+
+def test_ringbuffer_wraps_in_order():
+    buf = RingBuffer(3)
+    for t in range(5):
+        buf.append(t,600.0+t)
+    (t,value) = buf.history()
+    assert t.tolist() == [2,3,4]
+
+@pytest.mark.parametrize('mode',['sampler','callback'])
+def test_underexposed_channel_is_reported_but_not_recorded(wlm,mode):
+    if mode == 'sampler':
+        wlm.StartSampler(0.002)
+        status = wlm.SamplerStatus
+    else:
+        wlm.StartCallback()
+        status = wlm.CallbackStatus
+    wait_for(lambda: status()['channels'].get(1,{}).get('samples',0) > 5)
+    wlm.lib.signal_errors[1] = fake_wlm.ErrLowSignal
+    wait_for(lambda: wlm.SendCommand('','GetWavelengthNum',1,0) == fake_wlm.ErrLowSignal)
+    n = wlm.GetHistory(1)['n']
+    samples = status()['channels'][1]['samples']
+    time.sleep(0.1)  # Many sweeps/measurements while under-exposed
+    assert status()['channels'][1]['samples'] == samples  # Nothing evicted from the history
+    assert wlm.GetHistory(1)['n'] == n
+    assert wlm.GetStatistics(1,window=None)['n'] == n
+    del wlm.lib.signal_errors[1]
+    wait_for(lambda: wlm.SendCommand('','GetWavelengthNum',1,0) > 0)
+    wait_for(lambda: wlm.GetHistory(1)['n'] > n)
+
+def test_allan_deviation_of_jittered_white_noise(wlm):
+    # White noise on jittered arrivals: tau0 is the median interval, adev falls as 1/sqrt(tau)
+    rng = np.random.default_rng(1)
+    N = 4096
+    t = time.time() - 50 + np.cumsum(rng.uniform(0.007,0.013,N))
+    buf = RingBuffer(N)
+    for (ti,vi) in zip(t,600 + 1e-4*rng.standard_normal(N)):
+        buf.append(ti,vi)
+    with wlm._samplesCond:
+        wlm._samples[7] = buf
+    out = wlm.GetAllanDeviation(7,window=None)
+    assert out['tau0'] == pytest.approx(0.01,rel=0.05)
+    assert out['adev'][0] == pytest.approx(1e-4,rel=0.1)
+    (tau,adev) = (np.array(out['tau']),np.array(out['adev']))
+    use = tau <= 20*out['tau0']  # Enough averages for a stable estimate
+    slope = np.polyfit(np.log(tau[use]),np.log(adev[use]),1)[0]
+    assert slope == pytest.approx(-0.5,abs=0.1)
+    out = wlm.GetAllanDeviation(7,window=None,taus=[0.01,0.1,1e3])
+    assert out['tau'] == pytest.approx([out['tau0'],10*out['tau0']])  # Beyond half the record dropped